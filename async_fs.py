@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Async Filesystem Layer
+
+Every blocking filesystem call made from the lifecycle manager's coroutines
+goes through this module. Calls run on a small, bounded thread pool shared
+by the process, so a large copy cannot monopolise the event loop or spawn
+unbounded threads, and status queries keep being served while it runs.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class AsyncFileSystem:
+    """Thin async facade over blocking filesystem calls"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openaiplugin-fs")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run any blocking callable on the filesystem executor"""
+        loop = asyncio.get_event_loop()
+        if kwargs:
+            return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def map(self, func: Callable, items: Iterable, limit: Optional[int] = None) -> List[Any]:
+        """Apply a blocking callable to many items with at most `limit` in flight"""
+        semaphore = asyncio.Semaphore(limit or self.max_workers * 2)
+
+        async def one(item):
+            async with semaphore:
+                return await self.run(func, item)
+
+        return await asyncio.gather(*(one(item) for item in items))
+
+    async def exists(self, path: Path) -> bool:
+        return await self.run(os.path.exists, path)
+
+    async def is_file(self, path: Path) -> bool:
+        return await self.run(os.path.isfile, path)
+
+    async def is_dir(self, path: Path) -> bool:
+        return await self.run(os.path.isdir, path)
+
+    async def stat(self, path: Path) -> os.stat_result:
+        return await self.run(os.stat, path)
+
+    async def mkdir(self, path: Path, parents: bool = True, exist_ok: bool = True):
+        return await self.run(Path(path).mkdir, parents=parents, exist_ok=exist_ok)
+
+    async def read_bytes(self, path: Path) -> bytes:
+        return await self.run(Path(path).read_bytes)
+
+    async def read_json(self, path: Path) -> Any:
+        def _load():
+            with open(path, 'r') as f:
+                return json.load(f)
+        return await self.run(_load)
+
+    async def copy2(self, source: Path, target: Path):
+        return await self.run(shutil.copy2, source, target)
+
+    async def listdir_recursive(self, path: Path) -> List[Path]:
+        """Materialise Path.rglob('*') off the event loop"""
+        return await self.run(lambda: list(Path(path).rglob('*')))
+
+    async def rmtree(self, path: Path, ignore_errors: bool = False):
+        return await self.run(shutil.rmtree, path, ignore_errors)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_default_fs: Optional[AsyncFileSystem] = None
+_default_fs_lock = threading.Lock()
+
+
+def get_async_fs() -> AsyncFileSystem:
+    """Process-wide filesystem layer, so all managers share one bounded pool"""
+    global _default_fs
+    with _default_fs_lock:
+        if _default_fs is None:
+            _default_fs = AsyncFileSystem()
+        return _default_fs
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Batch Runner
+
+Runs one lifecycle operation (install, delete, status, update, export) for
+a stream of user IDs with bounded concurrency. User IDs are consumed in
+fixed-size batches so arbitrarily long inputs (files or stdin) never have
+to fit in memory, every user gets its own database session, one JSON line
+is written per user as soon as it finishes, and a progress/throughput line
+is kept up to date on stderr.
+
+Used by the command-line interface in lifecycle_manager.py.
+"""
+
+import asyncio
+import datetime
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import structlog
+
+logger = structlog.get_logger()
+
+OPERATIONS = ("install", "delete", "status", "update", "export")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 500
+
+
+def iter_user_ids(stream: TextIO) -> Iterator[str]:
+    """Yield user IDs from a text stream, one per line; blanks and '#' comments are skipped"""
+    for line in stream:
+        user_id = line.strip()
+        if user_id and not user_id.startswith("#"):
+            yield user_id
+
+
+def _batches(user_ids: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+class BatchRunner:
+    """Fan a lifecycle operation out over many users"""
+
+    def __init__(self,
+                 manager,
+                 session_factory: Callable[[], Any],
+                 operation: str,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 output: Optional[TextIO] = None,
+                 progress: Optional[TextIO] = None,
+                 progress_interval: float = 0.5,
+                 commit_every: int = 0,
+                 target_manager=None):
+        """
+        Args:
+            manager: OpenAILifecycleManager to run the operation on
+            session_factory: returns a new AsyncSession (used as an async context manager)
+            operation: one of OPERATIONS
+            concurrency: users processed at the same time
+            batch_size: user IDs read from the input per batch
+            output: JSONL result stream (default stdout)
+            progress: live progress stream such as stderr (None disables it)
+            commit_every: if > 0, install/delete run in the manager's unit of
+                work mode: each of `concurrency` workers keeps one session and
+                commits every N users (group commit) instead of once per user
+            target_manager: update only: manager of the version users move to,
+                built once and shared by every user of the run
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}', expected one of {', '.join(OPERATIONS)}")
+        if operation == "update" and target_manager is None:
+            raise ValueError("The update operation needs a target_manager for the new version")
+        self.manager = manager
+        self.target_manager = target_manager
+        self.session_factory = session_factory
+        self.operation = operation
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.output = output if output is not None else sys.stdout
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.commit_every = commit_every if operation in ("install", "delete") else 0
+
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._started = 0.0
+        self._last_progress = 0.0
+
+    async def run(self, user_ids: Iterable[str]) -> Dict[str, Any]:
+        """Process all user IDs and return a summary"""
+        self._started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(user_id: str):
+            async with semaphore:
+                record = await self._run_one(user_id)
+            self._emit(record)
+
+        for batch in _batches(user_ids, self.batch_size):
+            if self.commit_every:
+                slices = [batch[i::self.concurrency] for i in range(self.concurrency)]
+                await asyncio.gather(*(self._run_group(users) for users in slices if users))
+            else:
+                await asyncio.gather(*(one(user_id) for user_id in batch))
+            self.output.flush()
+
+        self._report_progress(final=True)
+        return self.get_summary()
+
+    def get_summary(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self._started, 1e-9) if self._started else 0.0
+        return {
+            'operation': self.operation,
+            'processed': self.processed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'users_per_second': round(self.processed / elapsed, 2) if elapsed else 0.0
+        }
+
+    async def _run_one(self, user_id: str, db=None) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            if db is None:
+                async with self.session_factory() as db:
+                    result = await self._dispatch(user_id, db)
+            else:
+                result = await self._dispatch(user_id, db)
+            ok = self._is_success(result)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Batch {self.operation} failed for user {user_id}: {e}")
+            result, ok = {'error': str(e)}, False
+
+        return {
+            'user_id': user_id,
+            'operation': self.operation,
+            'success': ok,
+            'duration_ms': round((time.monotonic() - started) * 1000, 1),
+            'result': result
+        }
+
+    async def _run_group(self, user_ids: List[str]):
+        """Process users sequentially on one session, committing every commit_every users"""
+        async with self.session_factory() as db:
+            async with self.manager.unit_of_work(db):
+                pending = []
+                for user_id in user_ids:
+                    pending.append(await self._run_one(user_id, db))
+                    if len(pending) >= self.commit_every:
+                        await self._commit_group(db, pending)
+                        pending = []
+                await self._commit_group(db, pending)
+
+    async def _commit_group(self, db, records: List[Dict[str, Any]]):
+        """Commit a group and only then report its results"""
+        if not records:
+            return
+        try:
+            await db.commit()
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Group commit of {len(records)} users failed: {e}")
+            await db.rollback()
+            self.manager.discard_post_commit(db)
+            for record in records:
+                if record['success']:
+                    record['success'] = False
+                    record['result'] = {'error': f'Group commit failed: {e}'}
+                    # Keep the manager's in-memory view in line with the rolled-back rows
+                    if self.operation == "install":
+                        self.manager.active_users.discard(record['user_id'])
+                    else:
+                        self.manager.active_users.add(record['user_id'])
+        else:
+            await self.manager.run_post_commit(db)
+        for record in records:
+            self._emit(record)
+
+    async def _dispatch(self, user_id: str, db) -> Dict[str, Any]:
+        manager = self.manager
+        if self.operation == "install":
+            return await manager.install_plugin(user_id, db)
+        if self.operation == "status":
+            return await manager.get_plugin_status(user_id, db)
+        if self.operation == "export":
+            existing = await manager._check_existing_plugin(user_id, db)
+            if not existing['exists']:
+                return {'success': False, 'error': 'Plugin not installed for user'}
+            return {'success': True, 'data': await manager._export_user_data(user_id, db)}
+
+        # delete/update act on users installed by earlier processes, which this
+        # process has not seen yet; adopt them from the database first
+        existing = await manager._check_existing_plugin(user_id, db)
+        if existing['exists']:
+            manager.active_users.add(user_id)
+        if self.operation == "delete":
+            return await manager.delete_plugin(user_id, db)
+        return await manager.update_plugin(user_id, db, self.target_manager)
+
+    def _is_success(self, result: Dict[str, Any]) -> bool:
+        if self.operation == "status":
+            return result.get('status') != 'error'
+        return bool(result.get('success'))
+
+    def _emit(self, record: Dict[str, Any]):
+        self.processed += 1
+        if record['success']:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.output.write(json.dumps(record, default=_json_default) + "\n")
+        self._report_progress()
+
+    def _report_progress(self, final: bool = False):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not final and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        summary = self.get_summary()
+        self.progress.write(
+            f"\r{self.operation}: {summary['processed']} done "
+            f"({summary['succeeded']} ok, {summary['failed']} failed) "
+            f"{summary['users_per_second']:.1f} users/s"
+            + ("\n" if final else "")
+        )
+        self.progress.flush()
+
+
+def create_session_factory(db_url: str, pool_size: int = DEFAULT_CONCURRENCY):
+    """AsyncSession factory for `db_url`, with a pool sized for the batch concurrency"""
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    engine_args = {}
+    if not db_url.startswith("sqlite"):
+        engine_args = {'pool_size': pool_size, 'max_overflow': 0}
+    engine = create_async_engine(db_url, **engine_args)
+    return engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -1,30 +1,32 @@
 #!/bin/bash
 
 # OpenAI Plugin Build Script
-# This script creates a tar.gz file ready for GitHub releases
+# This script creates a tar.gz file ready for GitHub releases.
+# Files and version come from lifecycle_manager.py (see release_packager.py);
+# extra arguments (--force, --workers N, --level N) are passed through.
+
+set -e
 
-PLUGIN_NAME="OpenAIPlugin"
-VERSION="1.0.0"
-BUILD_DIR="PluginBuild"
-PLUGIN_DIR="$BUILD_DIR/$PLUGIN_NAME"
 OUTPUT_DIR="releases"
 
-echo "Building $PLUGIN_NAME v$VERSION..."
+cd "$(dirname "$0")"
+
+echo "Building OpenAIPlugin release..."
 
-# Create releases directory
-mkdir -p "$OUTPUT_DIR"
+# The release ships the built bundle
+if [ ! -f "dist/remoteEntry.js" ]; then
+    npm run build
+fi
 
-# Create the tar.gz file
-cd "$BUILD_DIR"
-tar -czf "../$OUTPUT_DIR/${PLUGIN_NAME}-v${VERSION}.tar.gz" "$PLUGIN_NAME"
-cd ..
+RESULT=$(python3 release_packager.py --output-dir "$OUTPUT_DIR" "$@") || { echo "$RESULT" >&2; exit 1; }
+ARCHIVE=$(printf '%s' "$RESULT" | python3 -c 'import json, sys; print(json.load(sys.stdin)["archive"])')
 
-echo "✅ Plugin package created: $OUTPUT_DIR/${PLUGIN_NAME}-v${VERSION}.tar.gz"
+echo "✅ Plugin package created: $ARCHIVE"
 
 # Show contents
 echo ""
 echo "📦 Package contents:"
-tar -tzf "$OUTPUT_DIR/${PLUGIN_NAME}-v${VERSION}.tar.gz" | head -20
+tar -tzf "$ARCHIVE" | head -20
 
 echo ""
-echo "🚀 Ready for GitHub release!"
\ No newline at end of file
+echo "🚀 Ready for GitHub release!"
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Bundle Artifacts
+
+Install-time preparation of the `dist/` assets so serving them costs no CPU
+per request: gzip (and brotli, when the `brotli` package is installed)
+variants are generated in parallel, and `dist/asset-manifest.json` records a
+content hash per file for strong ETags plus the cache policy to send.
+
+Content-hashed filenames are marked immutable. Stable entry points such as
+remoteEntry.js keep their URL across builds, so they are served with
+`no-cache` and revalidate cheaply against the strong ETag instead.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Optional dependency: brotli variants are skipped when it is unavailable
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = "asset-manifest.json"
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".json", ".map", ".svg", ".txt", ".wasm"}
+# Files below this size are not worth a compressed variant
+MIN_COMPRESS_BYTES = 256
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# webpack-style content hashes: main.3f2a9c1b.js, 123.3f2a9c1b7e.chunk.js
+HASHED_NAME_PATTERN = re.compile(r"[.-][0-9a-f]{8,}\.")
+
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def _strong_etag(digest: bytes) -> str:
+    return '"' + base64.urlsafe_b64encode(digest[:18]).decode("ascii") + '"'
+
+
+def _compress_file(path: Path) -> Tuple[str, Dict[str, Any]]:
+    """Hash one asset and write its compressed variants next to it"""
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).digest()
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    if path.suffix in (".js", ".mjs"):
+        content_type = "application/javascript"
+
+    entry = {
+        'size': len(data),
+        'sha256': digest.hex(),
+        'etag': _strong_etag(digest),
+        'content_type': content_type,
+        'cache_control': IMMUTABLE_CACHE_CONTROL if HASHED_NAME_PATTERN.search(path.name) else REVALIDATE_CACHE_CONTROL,
+        'variants': {}
+    }
+
+    if path.suffix in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+        candidates = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(data, quality=11)
+
+        for encoding, compressed in candidates.items():
+            variant_path = path.with_name(path.name + VARIANT_SUFFIXES[encoding])
+            if len(compressed) >= len(data):
+                if variant_path.exists():
+                    variant_path.unlink()
+                continue
+            tmp = variant_path.with_name(variant_path.name + ".tmp")
+            tmp.write_bytes(compressed)
+            os.replace(tmp, variant_path)
+            entry['variants'][encoding] = {'file': variant_path.name, 'size': len(compressed)}
+
+    return path.name, entry
+
+
+def build_bundle_artifacts(plugin_dir: Path, max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Compress every asset under `plugin_dir/dist` in parallel and write the
+    asset manifest. zlib and brotli release the GIL, so threads scale.
+    """
+    dist_dir = Path(plugin_dir) / "dist"
+    if not dist_dir.is_dir():
+        return {'success': False, 'error': 'OpenAIPlugin: dist directory not found'}
+
+    assets: List[Path] = [
+        p for p in sorted(dist_dir.rglob("*"))
+        if p.is_file() and p.name != MANIFEST_NAME
+        and not any(p.name.endswith(suffix) for suffix in VARIANT_SUFFIXES.values())
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(8, (os.cpu_count() or 1) + 1)) as pool:
+        results = list(pool.map(_compress_file, assets))
+
+    files = {}
+    for path, (_, entry) in zip(assets, results):
+        files[path.relative_to(dist_dir).as_posix()] = entry
+
+    manifest = {
+        'version': 1,
+        'encodings': ['br', 'gzip'] if brotli is not None else ['gzip'],
+        'files': files
+    }
+    manifest_path = dist_dir / MANIFEST_NAME
+    tmp = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, manifest_path)
+
+    original = sum(e['size'] for e in files.values())
+    smallest = sum(min([e['size']] + [v['size'] for v in e['variants'].values()]) for e in files.values())
+    logger.info(f"OpenAIPlugin: Prepared {len(files)} bundle assets ({original} -> {smallest} bytes precompressed)")
+    return {
+        'success': True,
+        'files': len(files),
+        'original_bytes': original,
+        'compressed_bytes': smallest,
+        'brotli': brotli is not None
+    }
+
+
+def load_asset_manifest(plugin_dir: Path) -> Optional[Dict[str, Any]]:
+    """Read dist/asset-manifest.json, or None if it is missing or invalid"""
+    try:
+        with open(Path(plugin_dir) / "dist" / MANIFEST_NAME, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def select_variant(entry: Dict[str, Any], accept_encoding: str) -> Optional[str]:
+    """Pick the best precompressed encoding the client accepts ('br', 'gzip' or None)"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token and quality > 0:
+            accepted.add(token.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in entry.get('variants', {}) and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Bundle Server
+
+Serves the shared plugin's `dist/` assets (remoteEntry.js and chunks) from a
+bounded in-memory byte cache. Responses carry the strong ETag and cache
+policy from the install-time asset manifest, use precompressed variants when
+the client accepts them, and support conditional (If-None-Match) and single
+byte-range requests. Files too large for the cache are returned as sendfile
+descriptors so the host can stream them zero-copy.
+
+Cache keys include the resolved build directory, so switching the `active`
+or version pointer (see version_store.py) naturally invalidates old entries.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import structlog
+
+from bundle_artifacts import (
+    MANIFEST_NAME,
+    REVALIDATE_CACHE_CONTROL,
+    VARIANT_SUFFIXES,
+    load_asset_manifest,
+    select_variant,
+)
+
+logger = structlog.get_logger()
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into an inclusive (start, end) pair.
+    Returns None for no/unsupported ranges and (-1, -1) if unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[6:].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return (-1, -1)
+            return (max(0, size - length), size - 1)
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return (-1, -1)
+    return (start, min(end, size - 1))
+
+
+class BundleServer:
+    """Bounded, version-aware asset cache for the shared plugin bundle"""
+
+    def __init__(self,
+                 plugin_root: Path,
+                 max_cache_bytes: int = DEFAULT_CACHE_BYTES,
+                 max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES,
+                 fs=None):
+        """
+        Args:
+            plugin_root: shared/<plugin_slug> directory holding version pointers
+            max_cache_bytes: total bytes kept in memory across all entries
+            max_entry_bytes: larger files are streamed with sendfile instead
+            fs: AsyncFileSystem that fetch_asset reads cache misses on
+                (default: the process-wide one)
+        """
+        self.plugin_root = Path(plugin_root)
+        self.max_cache_bytes = max_cache_bytes
+        self.max_entry_bytes = max_entry_bytes
+        if fs is None:
+            from async_fs import get_async_fs
+            fs = get_async_fs()
+        self.fs = fs
+
+        # (build_dir, relative_path, encoding) -> {'body', 'etag', ...}
+        self._cache: "OrderedDict[Tuple[str, str, Optional[str]], Dict[str, Any]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._manifests: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.stats = {
+            'requests': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'not_modified': 0,
+            'partial': 0,
+            'sendfile': 0,
+            'not_found': 0,
+            'bytes_served': 0
+        }
+
+    def get_asset(self, relative_path: str, request_headers: Optional[Dict[str, str]] = None,
+                  pointer: str = "active") -> Dict[str, Any]:
+        """
+        Build a response for `dist/<relative_path>` of the build `pointer`
+        refers to ('active' or a version name such as 'v1.0.0').
+
+        Returns a dict with status, headers and either `body` (memoryview)
+        or `sendfile` ({'path', 'offset', 'count'}).
+        """
+        self.stats['requests'] += 1
+        headers_in = {k.lower(): v for k, v in (request_headers or {}).items()}
+        target = self._target(relative_path, pointer)
+        if target is None:
+            return self._not_found()
+
+        build_key, build_dir, asset_path, relative = target
+        manifest_entry = self._manifest_entry(build_key, build_dir, relative)
+        encoding = self._encoding(headers_in, manifest_entry)
+        entry = self._load(build_key, asset_path, relative, encoding, manifest_entry)
+        return self._respond(entry, headers_in, encoding)
+
+    async def fetch_asset(self, relative_path: str, request_headers: Optional[Dict[str, str]] = None,
+                          pointer: str = "active") -> Dict[str, Any]:
+        """
+        get_asset for coroutines: cache hits are answered on the event loop,
+        while a miss loads the manifest, stats and reads the file on the
+        filesystem executor.
+        """
+        self.stats['requests'] += 1
+        headers_in = {k.lower(): v for k, v in (request_headers or {}).items()}
+        target = self._target(relative_path, pointer)
+        if target is None:
+            return self._not_found()
+
+        build_key, build_dir, asset_path, relative = target
+        if build_key not in self._manifests:
+            self._manifests[build_key] = await self.fs.run(load_asset_manifest, build_dir)
+        manifest_entry = self._manifest_entry(build_key, build_dir, relative)
+        encoding = self._encoding(headers_in, manifest_entry)
+        cache_key = (build_key, relative, encoding)
+        entry = self._cached(cache_key)
+        if entry is None:
+            entry = self._store(cache_key, await self.fs.run(self._read_entry, asset_path, encoding, manifest_entry))
+        return self._respond(entry, headers_in, encoding)
+
+    async def send(self, response: Dict[str, Any], writer: asyncio.StreamWriter):
+        """Write a response body to an asyncio stream, using sendfile when possible"""
+        if 'sendfile' not in response:
+            writer.write(response['body'])
+            await writer.drain()
+            return
+
+        spec = response['sendfile']
+        loop = asyncio.get_event_loop()
+        await writer.drain()
+        with open(spec['path'], 'rb') as f:
+            # Uses os.sendfile on plain sockets and falls back to read/write otherwise (e.g. TLS)
+            await loop.sendfile(writer.transport, f, spec['offset'], spec['count'])
+
+    def preload(self, pointer: str = "active") -> Dict[str, Any]:
+        """
+        Load the asset manifest and the dist/ files of a build (with their
+        precompressed variants) into the cache ahead of the first requests,
+        remoteEntry.js first. Files that would not fit the cache budget
+        without evicting are skipped.
+        """
+        build_dir = self._resolve_build(pointer)
+        if build_dir is None:
+            return {'success': False, 'error': f'OpenAIPlugin: No build for pointer {pointer}'}
+        build_key = str(build_dir)
+        dist_dir = build_dir / "dist"
+        self._manifests.pop(build_key, None)
+        self._manifest_entry(build_key, build_dir, "")
+        manifest = self._manifests[build_key]
+        if manifest is not None:
+            entries = manifest['files']
+        else:
+            entries = {path.relative_to(dist_dir).as_posix(): None for path in dist_dir.rglob('*')
+                       if path.is_file() and path.name != MANIFEST_NAME and
+                       not path.name.endswith(tuple(VARIANT_SUFFIXES.values()))}
+
+        files = loaded_bytes = 0
+        for relative in sorted(entries, key=lambda name: (name != "remoteEntry.js", name)):
+            entry = entries[relative]
+            asset_path = dist_dir / relative
+            for encoding in [None] + sorted((entry or {}).get('variants', {})):
+                if entry is not None:
+                    size = entry['variants'][encoding]['size'] if encoding else entry['size']
+                else:
+                    size = asset_path.stat().st_size
+                if size > self.max_entry_bytes or self._cache_bytes + size > self.max_cache_bytes:
+                    continue
+                if (build_key, relative, encoding) not in self._cache:
+                    self._load(build_key, asset_path, relative, encoding, entry)
+                    files += 1
+                    loaded_bytes += size
+        return {'success': True, 'build': build_dir.name, 'files': files, 'bytes': loaded_bytes}
+
+    def invalidate(self, build_dir: Optional[Path] = None):
+        """Drop cached entries for one build, or everything"""
+        if build_dir is None:
+            self._cache.clear()
+            self._manifests.clear()
+            self._cache_bytes = 0
+            return
+        key = str(Path(build_dir).resolve())
+        for cache_key in [k for k in self._cache if k[0] == key]:
+            self._cache_bytes -= len(self._cache.pop(cache_key)['body'] or b"")
+        self._manifests.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'cached_entries': len(self._cache), 'cached_bytes': self._cache_bytes}
+
+    def _resolve_build(self, pointer: str) -> Optional[Path]:
+        link = self.plugin_root / pointer
+        try:
+            # One readlink per request: pointer swaps are picked up immediately
+            return link.resolve(strict=True) if link.exists() else None
+        except (OSError, RuntimeError):
+            return None
+
+    def _safe_asset_path(self, build_dir: Path, relative_path: str) -> Optional[Path]:
+        relative_path = relative_path.lstrip("/")
+        if relative_path.startswith("dist/"):
+            relative_path = relative_path[5:]
+        if not relative_path or os.path.basename(relative_path) == MANIFEST_NAME:
+            return None
+        dist_dir = build_dir / "dist"
+        candidate = (dist_dir / relative_path).resolve()
+        if dist_dir.resolve() not in candidate.parents:
+            return None
+        return candidate
+
+    def _target(self, relative_path: str, pointer: str) -> Optional[Tuple[str, Path, Path, str]]:
+        """(build key, build dir, asset path, dist-relative path) of an existing asset, else None"""
+        build_dir = self._resolve_build(pointer)
+        asset_path = self._safe_asset_path(build_dir, relative_path) if build_dir else None
+        if asset_path is None or not asset_path.is_file():
+            return None
+        return str(build_dir), build_dir, asset_path, asset_path.relative_to(build_dir / "dist").as_posix()
+
+    def _not_found(self) -> Dict[str, Any]:
+        self.stats['not_found'] += 1
+        return {'status': 404, 'headers': {}, 'body': memoryview(b"")}
+
+    def _encoding(self, headers_in: Dict[str, str], manifest_entry: Optional[Dict[str, Any]]) -> Optional[str]:
+        # Ranges always address the identity representation
+        if 'range' in headers_in or not manifest_entry:
+            return None
+        return select_variant(manifest_entry, headers_in.get('accept-encoding', ''))
+
+    def _respond(self, entry: Dict[str, Any], headers_in: Dict[str, str], encoding: Optional[str]) -> Dict[str, Any]:
+        range_requested = 'range' in headers_in
+        headers = {
+            'ETag': entry['etag'],
+            'Cache-Control': entry['cache_control'],
+            'Content-Type': entry['content_type'],
+            'Accept-Ranges': 'bytes',
+            'Vary': 'Accept-Encoding'
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        if_none_match = headers_in.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or entry['etag'] in
+                              [tag.strip().replace('W/', '') for tag in if_none_match.split(',')]):
+            self.stats['not_modified'] += 1
+            return {'status': 304, 'headers': headers, 'body': memoryview(b"")}
+
+        size = entry['size']
+        status = 200
+        start, end = 0, size - 1
+        if range_requested:
+            byte_range = parse_range(headers_in['range'], size)
+            if byte_range == (-1, -1):
+                headers['Content-Range'] = f"bytes */{size}"
+                return {'status': 416, 'headers': headers, 'body': memoryview(b"")}
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+                headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+                self.stats['partial'] += 1
+
+        length = max(0, end - start + 1)
+        headers['Content-Length'] = str(length)
+        self.stats['bytes_served'] += length
+
+        if entry['body'] is None:
+            self.stats['sendfile'] += 1
+            return {'status': status, 'headers': headers,
+                    'sendfile': {'path': entry['path'], 'offset': start, 'count': length}}
+        return {'status': status, 'headers': headers, 'body': entry['body'][start:end + 1]}
+
+    def _manifest_entry(self, build_key: str, build_dir: Path, relative: str) -> Optional[Dict[str, Any]]:
+        if build_key not in self._manifests:
+            self._manifests[build_key] = load_asset_manifest(build_dir)
+        manifest = self._manifests[build_key]
+        return manifest['files'].get(relative) if manifest else None
+
+    def _load(self, build_key: str, asset_path: Path, relative: str,
+              encoding: Optional[str], manifest_entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        cache_key = (build_key, relative, encoding)
+        entry = self._cached(cache_key)
+        if entry is None:
+            entry = self._store(cache_key, self._read_entry(asset_path, encoding, manifest_entry))
+        return entry
+
+    def _cached(self, cache_key: Tuple[str, str, Optional[str]]) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(cache_key)
+        if entry is not None:
+            self._cache.move_to_end(cache_key)
+            self.stats['cache_hits'] += 1
+            return entry
+        self.stats['cache_misses'] += 1
+        return None
+
+    def _read_entry(self, asset_path: Path, encoding: Optional[str],
+                    manifest_entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Stat and (if small enough) read one representation; blocking"""
+        path = asset_path.with_name(asset_path.name + VARIANT_SUFFIXES[encoding]) if encoding else asset_path
+        stat = path.stat()
+
+        if manifest_entry:
+            etag = manifest_entry['etag']
+            if encoding:
+                # Each representation needs its own strong validator
+                etag = etag[:-1] + f'-{encoding}"'
+            cache_control = manifest_entry['cache_control']
+            content_type = manifest_entry['content_type']
+        else:
+            etag = None
+            cache_control = REVALIDATE_CACHE_CONTROL
+            content_type = "application/javascript" if path.suffix == ".js" else "application/octet-stream"
+
+        body = None
+        if stat.st_size <= self.max_entry_bytes:
+            body = memoryview(path.read_bytes())
+            if etag is None:
+                etag = '"' + base64.urlsafe_b64encode(hashlib.sha256(body).digest()[:18]).decode("ascii") + '"'
+        elif etag is None:
+            etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+        entry = {
+            'body': body,
+            'path': str(path),
+            'size': stat.st_size,
+            'etag': etag,
+            'cache_control': cache_control,
+            'content_type': content_type
+        }
+        return entry
+
+    def _store(self, cache_key: Tuple[str, str, Optional[str]], entry: Dict[str, Any]) -> Dict[str, Any]:
+        if entry['body'] is None:
+            return entry
+        if cache_key in self._cache:
+            # Another request filled it while this one was reading
+            return self._cache[cache_key]
+        self._cache[cache_key] = entry
+        self._cache_bytes += len(entry['body'])
+        while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted['body'])
+        return entry
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Completion Cache
+
+Opt-in exact-match cache for deterministic chat completion requests. Requests
+are keyed by a canonical hash of every field that influences the completion;
+only deterministic requests (temperature 0, single choice, non-streaming) are
+ever served from or written to the cache. Entries live in a size-bounded LRU
+memory tier with an optional on-disk tier behind it.
+
+Entries are partitioned by API key fingerprint and organization (as in
+model_catalog.py), so one key never receives another key's responses unless
+the cache is built with share_across_keys=True. Disk-tier I/O runs on the
+async filesystem executor.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Request fields that change the completion; anything else (e.g. `user`) is ignored
+KEY_FIELDS = (
+    "model", "messages", "max_tokens", "temperature", "top_p", "n", "stop",
+    "presence_penalty", "frequency_penalty", "logit_bias", "seed",
+    "response_format", "tools", "tool_choice", "functions", "function_call"
+)
+
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 256 * 1024 * 1024
+
+
+def is_deterministic(request: Dict[str, Any]) -> bool:
+    """Return True if identical requests are expected to produce identical output"""
+    if request.get("stream"):
+        return False
+    try:
+        if request.get("temperature") is None or float(request["temperature"]) != 0.0:
+            return False
+    except (TypeError, ValueError):
+        # Malformed temperatures are the upstream API's to reject, never cached
+        return False
+    if request.get("n") not in (None, 1):
+        return False
+    return True
+
+
+def credential_partition(api_key: Optional[str], organization: Optional[str] = None) -> Optional[str]:
+    """Cache partition for a set of credentials; None when there is no key"""
+    if not api_key:
+        return None
+    from model_catalog import api_key_fingerprint
+    return f"{api_key_fingerprint(api_key)}:{organization or ''}"
+
+
+def request_cache_key(request: Dict[str, Any], partition: Optional[str] = None) -> str:
+    """
+    Canonical SHA-256 of the completion-relevant request fields, scoped to
+    `partition` (see credential_partition; None = shared by all callers)
+    """
+    canonical = {field: request[field] for field in KEY_FIELDS if request.get(field) is not None}
+    if partition is not None:
+        canonical["_partition"] = partition
+    if "temperature" in canonical:
+        canonical["temperature"] = float(canonical["temperature"])
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Size-bounded LRU cache of chat completions with an optional disk tier"""
+
+    def __init__(self,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 disk_path: Optional[Path] = None,
+                 disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+                 share_across_keys: bool = False,
+                 fs=None):
+        """
+        Args:
+            share_across_keys: serve one API key's cached responses to
+                requests made with other keys; otherwise requests without an
+                API key bypass the cache
+            fs: AsyncFileSystem for disk-tier I/O (default: the process-wide one)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.disk_max_bytes = disk_max_bytes
+        self.share_across_keys = share_across_keys
+        if fs is None:
+            from async_fs import get_async_fs
+            fs = get_async_fs()
+        self.fs = fs
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Disk bookkeeping is updated from executor threads; sized lazily on first write
+        self._disk_lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'stores': 0,
+            'evictions': 0,
+            'bytes_saved': 0,
+            'tokens_saved': 0
+        }
+
+    @classmethod
+    def from_config(cls, config_fields: Dict[str, Any], disk_path: Optional[Path] = None) -> Optional['CompletionCache']:
+        """
+        Build a cache from ComponentOpenAIChat config values.
+
+        Accepts either plain values or the module's config_fields definitions
+        (using their defaults). Returns None when caching is disabled.
+        """
+        def value(name: str, default: Any) -> Any:
+            field = config_fields.get(name, default)
+            if isinstance(field, dict):
+                return field.get("default", default)
+            return field
+
+        if not value("response_cache_enabled", False):
+            return None
+
+        return cls(
+            max_entries=int(value("response_cache_max_entries", DEFAULT_MAX_ENTRIES)),
+            disk_path=disk_path if value("response_cache_disk", False) else None,
+            share_across_keys=bool(value("response_cache_shared_across_keys", False))
+        )
+
+    def _key(self, request: Dict[str, Any], api_key: Optional[str], organization: Optional[str]) -> Optional[str]:
+        """Cache key for a request, or None when it must bypass the cache"""
+        if not is_deterministic(request):
+            return None
+        if self.share_across_keys:
+            return request_cache_key(request)
+        partition = credential_partition(api_key, organization)
+        if partition is None:
+            return None
+        return request_cache_key(request, partition)
+
+    async def get(self, request: Dict[str, Any], api_key: Optional[str] = None,
+                  organization: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return a cached completion for a deterministic request made with these credentials, or None"""
+        key = self._key(request, api_key, organization)
+        if key is None:
+            self.stats['bypassed'] += 1
+            return None
+
+        payload = self._memory.get(key)
+        if payload is not None:
+            self._memory.move_to_end(key)
+            self.stats['hits'] += 1
+        else:
+            payload = await self.fs.run(self._read_disk, key) if self.disk_path else None
+            if payload is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._store_memory(key, payload)
+
+        response = json.loads(payload)
+        self.stats['bytes_saved'] += len(payload)
+        self.stats['tokens_saved'] += (response.get('usage') or {}).get('total_tokens', 0)
+        return response
+
+    async def put(self, request: Dict[str, Any], response: Dict[str, Any], api_key: Optional[str] = None,
+                  organization: Optional[str] = None) -> bool:
+        """Store a successful completion for a deterministic request"""
+        key = self._key(request, api_key, organization)
+        if key is None or response.get('error') or not response.get('choices'):
+            return False
+
+        payload = json.dumps(response, separators=(",", ":")).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return False
+
+        self._store_memory(key, payload)
+        if self.disk_path:
+            await self.fs.run(self._write_disk, key, payload)
+        self.stats['stores'] += 1
+        return True
+
+    async def get_or_fetch(self,
+                           request: Dict[str, Any],
+                           fetch: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                           api_key: Optional[str] = None,
+                           organization: Optional[str] = None) -> Dict[str, Any]:
+        """Serve from cache when possible, otherwise call fetch() and store the result"""
+        cached = await self.get(request, api_key, organization)
+        if cached is not None:
+            return cached
+        response = await fetch(request)
+        await self.put(request, response, api_key, organization)
+        return response
+
+    async def clear(self):
+        """Remove all cached entries from both tiers"""
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.disk_path:
+            await self.fs.run(self._clear_disk)
+
+    def _clear_disk(self):
+        with self._disk_lock:
+            for entry in self.disk_path.glob("*/*.json"):
+                entry.unlink()
+            self._disk_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit rate, bytes saved and tier sizes"""
+        served = self.stats['hits'] + self.stats['disk_hits']
+        lookups = served + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': served / lookups if lookups else 0.0,
+            'entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_bytes': self._disk_bytes or 0
+        }
+
+    def _store_memory(self, key: str, payload: bytes):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = payload
+        self._memory_bytes += len(payload)
+
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats['evictions'] += 1
+
+    def _disk_file(self, key: str) -> Path:
+        return self.disk_path / key[:2] / f"{key}.json"
+
+    # Disk tier: called on the filesystem executor
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            return self._disk_file(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"OpenAIPlugin: Failed to read completion cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, payload: bytes):
+        target = self._disk_file(key)
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self.disk_path.mkdir(parents=True, exist_ok=True)
+                self._disk_bytes = sum(f.stat().st_size for f in self.disk_path.glob("*/*.json"))
+            try:
+                target.parent.mkdir(exist_ok=True)
+                existing = target.stat().st_size if target.exists() else 0
+                tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp.write_bytes(payload)
+                os.replace(tmp, target)
+                self._disk_bytes += len(payload) - existing
+            except OSError as e:
+                logger.warning(f"OpenAIPlugin: Failed to write completion cache entry {key}: {e}")
+                return
+
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop the least recently written disk entries until under budget"""
+        entries = sorted(self.disk_path.glob("*/*.json"), key=lambda f: f.stat().st_mtime)
+        for entry in entries:
+            if self._disk_bytes <= self.disk_max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                entry.unlink()
+                self._disk_bytes -= size
+            except OSError:
+                continue
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Configuration Export
+
+Streaming backup and migration of every user's plugin and module
+`config_fields`. Rows are read through a server-side cursor (AsyncSession
+.stream) in fixed-size partitions, grouped into one record per user by an
+async generator, and written as gzip-compressed JSONL; re-import parses the
+file incrementally and applies batched executemany UPDATEs. Memory use is
+bounded by the chunk/batch size, not the number of users.
+
+One JSONL record per user:
+
+    {"user_id": ..., "plugin_slug": ..., "version": ...,
+     "config_fields": {...}, "modules": {"<module name>": {...}, ...}}
+
+Module config_fields are exported exactly as stored, so in template storage
+mode (module_templates.py) they are the per-user overrides.
+"""
+
+import gzip
+import json
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List
+
+import structlog
+from sqlalchemy import text
+
+from async_fs import get_async_fs
+
+logger = structlog.get_logger()
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_COMPRESSLEVEL = 6
+
+
+def _decode(value: Any) -> Any:
+    if value is None or value == "":
+        return {}
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return {}
+    return value
+
+
+async def iter_user_configs(db, plugin_slug: str,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield one config record per user, ordered by user_id, reading the joined
+    plugin/module rows through a server-side cursor `chunk_size` rows at a time.
+    """
+    query = text("""
+    SELECT p.user_id AS user_id, p.id AS plugin_id, p.version AS version,
+           p.config_fields AS plugin_config, m.name AS module_name, m.config_fields AS module_config
+    FROM plugin p
+    LEFT JOIN module m ON m.plugin_id = p.id AND m.user_id = p.user_id
+    WHERE p.plugin_slug = :plugin_slug
+    ORDER BY p.user_id, m.name
+    """).execution_options(yield_per=chunk_size)
+
+    result = await db.stream(query, {'plugin_slug': plugin_slug})
+    record = None
+    async for partition in result.partitions(chunk_size):
+        for row in partition:
+            if record is None or record['user_id'] != row.user_id:
+                if record is not None:
+                    yield record
+                record = {
+                    'user_id': row.user_id,
+                    'plugin_slug': plugin_slug,
+                    'version': row.version,
+                    'config_fields': _decode(row.plugin_config),
+                    'modules': {}
+                }
+            if row.module_name is not None:
+                record['modules'][row.module_name] = _decode(row.module_config)
+    if record is not None:
+        yield record
+
+
+async def export_configs(db, path: Path, plugin_slug: str,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         compresslevel: int = DEFAULT_COMPRESSLEVEL) -> Dict[str, Any]:
+    """Stream all users' config records into a gzip JSONL file (written atomically)"""
+    fs = get_async_fs()
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    await fs.mkdir(path.parent)
+    out = await fs.run(gzip.open, tmp, 'wt', compresslevel=compresslevel, encoding='utf-8')
+
+    users = 0
+    lines: List[str] = []
+    try:
+        async for record in iter_user_configs(db, plugin_slug, chunk_size):
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+            users += 1
+            if len(lines) >= chunk_size:
+                # Compression and writes run off the event loop, one chunk at a time
+                await fs.run(out.writelines, lines)
+                lines = []
+        if lines:
+            await fs.run(out.writelines, lines)
+        await fs.run(out.close)
+        await fs.run(tmp.replace, path)
+    except Exception:
+        await fs.run(out.close)
+        await fs.run(tmp.unlink)
+        raise
+
+    size = (await fs.stat(path)).st_size
+    logger.info(f"OpenAIPlugin: Exported config for {users} users to {path} ({size} bytes)")
+    return {'success': True, 'users': users, 'path': str(path), 'bytes': size}
+
+
+async def iter_jsonl(path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """Yield records from a (gzip) JSONL file, reading `chunk_size` lines per executor hop"""
+    fs = get_async_fs()
+    path = Path(path)
+    opener = gzip.open if path.name.endswith(".gz") else open
+    f = await fs.run(opener, path, 'rt', encoding='utf-8')
+
+    def read_chunk() -> List[str]:
+        chunk = []
+        for line in f:
+            if line.strip():
+                chunk.append(line)
+            if len(chunk) >= chunk_size:
+                break
+        return chunk
+
+    try:
+        while True:
+            chunk = await fs.run(read_chunk)
+            if not chunk:
+                break
+            for line in chunk:
+                yield json.loads(line)
+    finally:
+        await fs.run(f.close)
+
+
+async def import_configs(db, path: Path, plugin_slug: str,
+                         batch_size: int = DEFAULT_CHUNK_SIZE,
+                         commit: bool = True) -> Dict[str, Any]:
+    """
+    Re-apply exported config_fields with batched UPDATEs. Rows are matched by
+    their deterministic ids, so only users already installed are updated.
+    With commit=False the caller owns the transaction (unit of work).
+    """
+    plugin_stmt = text("""
+    UPDATE plugin SET config_fields = :config_fields
+    WHERE id = :plugin_id AND user_id = :user_id
+    """)
+    module_stmt = text("""
+    UPDATE module SET config_fields = :config_fields
+    WHERE id = :module_id AND user_id = :user_id
+    """)
+
+    users = plugins_updated = modules_updated = 0
+    plugin_batch: List[Dict[str, Any]] = []
+    module_batch: List[Dict[str, Any]] = []
+
+    async def flush():
+        nonlocal plugins_updated, modules_updated
+        if plugin_batch:
+            result = await db.execute(plugin_stmt, plugin_batch)
+            plugins_updated += max(result.rowcount or 0, 0)
+            plugin_batch.clear()
+        if module_batch:
+            result = await db.execute(module_stmt, module_batch)
+            modules_updated += max(result.rowcount or 0, 0)
+            module_batch.clear()
+        if commit:
+            await db.commit()
+
+    try:
+        async for record in iter_jsonl(path, batch_size):
+            if record.get('plugin_slug', plugin_slug) != plugin_slug:
+                continue
+            user_id = record['user_id']
+            plugin_id = f"{user_id}_{plugin_slug}"
+            plugin_batch.append({
+                'config_fields': json.dumps(record.get('config_fields') or {}),
+                'plugin_id': plugin_id,
+                'user_id': user_id
+            })
+            for module_name, config in (record.get('modules') or {}).items():
+                module_batch.append({
+                    'config_fields': json.dumps(config),
+                    'module_id': f"{plugin_id}_{module_name}",
+                    'user_id': user_id
+                })
+            users += 1
+            if len(plugin_batch) >= batch_size:
+                await flush()
+        await flush()
+    except Exception as e:
+        if commit:
+            await db.rollback()
+        logger.error(f"OpenAIPlugin: Config import from {path} failed after {users} users: {e}")
+        return {'success': False, 'error': str(e), 'users': users}
+
+    logger.info(f"OpenAIPlugin: Imported config for {users} users from {path}")
+    return {
+        'success': True,
+        'users': users,
+        'plugins_updated': plugins_updated,
+        'modules_updated': modules_updated
+    }
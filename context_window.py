@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Context Window Manager
+
+Keeps chat requests inside a token budget. Token counts are estimated once
+per message and cached; per-conversation prefix sums are reused across turns
+so each new turn only costs the messages that were appended. When a history
+exceeds the budget the oldest turns are dropped (or summarized, if a
+summarizer is supplied) while leading system messages are always kept.
+"""
+
+import bisect
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Optional exact tokenizer; the character heuristic is used when unavailable
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Fixed per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens reserved for the assistant reply priming
+REPLY_PRIMING_TOKENS = 3
+
+MODEL_CONTEXT_LIMITS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "o1-mini": 128000,
+    "o3-mini": 200000,
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+
+def get_context_limit(model: str) -> int:
+    """Context window for a model, matching on the longest known prefix"""
+    matches = [name for name in MODEL_CONTEXT_LIMITS if model.startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_LIMIT
+    return MODEL_CONTEXT_LIMITS[max(matches, key=len)]
+
+
+def _message_hash(message: Dict[str, Any]) -> str:
+    digest = hashlib.sha1()
+    digest.update(str(message.get('role', '')).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(str(message.get('content') or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ContextWindowManager:
+    """Incremental token accounting and budget trimming for chat histories"""
+
+    def __init__(self,
+                 max_context_tokens: int = 0,
+                 safety_margin: int = 64,
+                 summarizer: Optional[Summarizer] = None,
+                 message_cache_size: int = 50000,
+                 conversation_cache_size: int = 1000):
+        """
+        Args:
+            max_context_tokens: hard cap on prompt + completion tokens; 0 uses
+                the model's context window
+            safety_margin: tokens held back to absorb estimation error
+            summarizer: optional async callable turning dropped messages into
+                a summary string
+        """
+        self.max_context_tokens = max_context_tokens
+        self.safety_margin = safety_margin
+        self.summarizer = summarizer
+        self.message_cache_size = message_cache_size
+        self.conversation_cache_size = conversation_cache_size
+
+        self._message_tokens: "OrderedDict[str, int]" = OrderedDict()
+        # conversation_id -> {'hashes': [...], 'prefix': [0, t0, t0+t1, ...]}
+        self._prefixes: "OrderedDict[str, Dict[str, list]]" = OrderedDict()
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._encoder = None
+        self.stats = {
+            'messages_estimated': 0,
+            'message_cache_hits': 0,
+            'prefix_reused': 0,
+            'trimmed_requests': 0,
+            'messages_dropped': 0,
+            'summaries': 0
+        }
+
+    @classmethod
+    def from_config(cls, config_fields: Dict[str, Any], summarizer: Optional[Summarizer] = None) -> 'ContextWindowManager':
+        """Build a manager from ComponentOpenAIChat config values or definitions"""
+        field = config_fields.get("max_context_tokens", 0)
+        if isinstance(field, dict):
+            field = field.get("default", 0)
+        return cls(max_context_tokens=int(field or 0), summarizer=summarizer)
+
+    def estimate_text_tokens(self, text: str) -> int:
+        """Estimate tokens in a string (exact when tiktoken is installed)"""
+        if not text:
+            return 0
+        if tiktoken is not None:
+            if self._encoder is None:
+                self._encoder = tiktoken.get_encoding("cl100k_base")
+            return len(self._encoder.encode(text))
+        # ~4 characters per token for English; never below the word count
+        return max(math.ceil(len(text) / 4), len(text.split()))
+
+    def message_tokens(self, message: Dict[str, Any], message_hash: Optional[str] = None) -> int:
+        """Token estimate for one message, cached by content hash"""
+        key = message_hash or _message_hash(message)
+        cached = self._message_tokens.get(key)
+        if cached is not None:
+            self._message_tokens.move_to_end(key)
+            self.stats['message_cache_hits'] += 1
+            return cached
+
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.estimate_text_tokens(str(message.get('content') or ''))
+        self._message_tokens[key] = tokens
+        self.stats['messages_estimated'] += 1
+        if len(self._message_tokens) > self.message_cache_size:
+            self._message_tokens.popitem(last=False)
+        return tokens
+
+    def prefix_sums(self, conversation_id: str, messages: List[Dict[str, Any]]) -> List[int]:
+        """
+        Cumulative token counts for `messages`, reusing the cached prefix of
+        the previous turn of the same conversation.
+        """
+        state = self._prefixes.get(conversation_id)
+        hashes = [_message_hash(m) for m in messages]
+
+        common = 0
+        if state is not None:
+            self._prefixes.move_to_end(conversation_id)
+            cached_hashes = state['hashes']
+            limit = min(len(cached_hashes), len(hashes))
+            while common < limit and cached_hashes[common] == hashes[common]:
+                common += 1
+            if common:
+                self.stats['prefix_reused'] += 1
+            prefix = state['prefix'][:common + 1]
+        else:
+            prefix = [0]
+
+        for index in range(common, len(messages)):
+            prefix.append(prefix[-1] + self.message_tokens(messages[index], hashes[index]))
+
+        self._prefixes[conversation_id] = {'hashes': hashes, 'prefix': prefix}
+        if len(self._prefixes) > self.conversation_cache_size:
+            self._prefixes.popitem(last=False)
+        return prefix
+
+    def prompt_budget(self, model: str, max_tokens: int) -> int:
+        """Tokens available for the prompt once the completion is reserved"""
+        limit = get_context_limit(model)
+        if self.max_context_tokens:
+            limit = min(limit, self.max_context_tokens)
+        return max(0, limit - int(max_tokens or 0) - REPLY_PRIMING_TOKENS - self.safety_margin)
+
+    async def prepare(self,
+                      conversation_id: str,
+                      messages: List[Dict[str, Any]],
+                      model: str,
+                      max_tokens: int) -> Dict[str, Any]:
+        """
+        Fit a conversation into the model's budget.
+
+        Returns the messages to send, their estimated token count and how
+        many history messages were dropped or summarized.
+        """
+        budget = self.prompt_budget(model, max_tokens)
+        prefix = self.prefix_sums(conversation_id, messages)
+        total = prefix[-1]
+
+        if total <= budget:
+            return {'messages': messages, 'estimated_tokens': total, 'dropped': 0, 'summarized': False}
+
+        # Leading system messages are instructions and are always kept
+        system_count = 0
+        while system_count < len(messages) and messages[system_count].get('role') == 'system':
+            system_count += 1
+        system_tokens = prefix[system_count]
+
+        # Smallest cut such that system + messages[cut:] fits: prefix[cut] >= total - (budget - system)
+        needed = total - (budget - system_tokens)
+        cut = bisect.bisect_left(prefix, needed, lo=system_count)
+        # Always keep the latest message even if it alone exceeds the budget
+        cut = min(max(cut, system_count), len(messages) - 1)
+
+        dropped = messages[system_count:cut]
+        kept = messages[:system_count] + messages[cut:]
+        summarized = False
+
+        if dropped and self.summarizer is not None:
+            summary = await self._summarize(dropped)
+            if summary:
+                summary_message = {'role': 'system', 'content': f"Summary of earlier conversation: {summary}"}
+                summary_tokens = self.message_tokens(summary_message)
+                # Make room for the summary by dropping further turns if needed
+                while cut < len(messages) - 1 and system_tokens + summary_tokens + (total - prefix[cut]) > budget:
+                    cut += 1
+                kept = messages[:system_count] + [summary_message] + messages[cut:]
+                summarized = True
+
+        estimated = sum(self.message_tokens(m) for m in kept)
+        self.stats['trimmed_requests'] += 1
+        self.stats['messages_dropped'] += cut - system_count
+        if summarized:
+            self.stats['summaries'] += 1
+
+        return {
+            'messages': kept,
+            'estimated_tokens': estimated,
+            'dropped': cut - system_count,
+            'summarized': summarized
+        }
+
+    def forget(self, conversation_id: str):
+        """Drop cached prefix state for a conversation (e.g. after Clear Chat)"""
+        self._prefixes.pop(conversation_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'cached_messages': len(self._message_tokens),
+            'cached_conversations': len(self._prefixes),
+            'exact_tokenizer': tiktoken is not None
+        }
+
+    async def _summarize(self, dropped: List[Dict[str, Any]]) -> Optional[str]:
+        """Summarize dropped messages, caching by the hash of the dropped block"""
+        digest = hashlib.sha1()
+        for message in dropped:
+            digest.update(_message_hash(message).encode('ascii'))
+        key = digest.hexdigest()
+
+        summary = self._summaries.get(key)
+        if summary is not None:
+            return summary
+        try:
+            summary = await self.summarizer(dropped)
+        except Exception as e:
+            logger.warning(f"OpenAIPlugin: Context summarization failed, dropping turns instead: {e}")
+            return None
+
+        self._summaries[key] = summary
+        if len(self._summaries) > self.conversation_cache_size:
+            self._summaries.popitem(last=False)
+        return summary
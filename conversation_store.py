@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Conversation Store
+
+Persistent chat history for ComponentOpenAIChat. Each conversation is an
+append-only log split into segments plus a fixed-width index (one record per
+message: segment, offset, length). Fetching the latest N messages, or paging
+backwards with a cursor, reads N index records and N log lines regardless of
+how long the conversation is.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# segment number, byte offset, record length
+INDEX_RECORD = struct.Struct("<IQI")
+DEFAULT_SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_PAGE_SIZE = 50
+# Writers of different users rarely share a stripe; the lock table never grows
+LOCK_STRIPES = 64
+MAX_PAGE_SIZE = 500
+
+CONVERSATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ConversationStore:
+    """Append-only, index-paged conversation history stored per user"""
+
+    def __init__(self, root_path: Path, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES, fsync: bool = False,
+                 fs=None):
+        """
+        Args:
+            fs: AsyncFileSystem the blocking store operations run on
+                (default: the process-wide one)
+        """
+        self.root_path = Path(root_path)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        if fs is None:
+            from async_fs import get_async_fs
+            fs = get_async_fs()
+        self.fs = fs
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    # Public async API
+
+    async def append(self, user_id: str, conversation_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Append one message; returns the stored record including its seq number"""
+        return await self._run(self._append_sync, user_id, conversation_id, message)
+
+    async def append_many(self, user_id: str, conversation_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append several messages under one lock acquisition"""
+        return await self._run(self._append_many_sync, user_id, conversation_id, messages)
+
+    async def get_messages(self, user_id: str, conversation_id: str,
+                           limit: int = DEFAULT_PAGE_SIZE, before: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return up to `limit` messages ending just before the `before` cursor
+        (or at the latest message), oldest first.
+
+        `next_cursor` pages further back and is None once the start is reached.
+        """
+        return await self._run(self._get_messages_sync, user_id, conversation_id, limit, before)
+
+    async def list_conversations(self, user_id: str) -> List[Dict[str, Any]]:
+        """Return conversation ids with message counts for a user"""
+        return await self._run(self._list_conversations_sync, user_id)
+
+    async def delete_conversation(self, user_id: str, conversation_id: str) -> bool:
+        return await self._run(self._delete_conversation_sync, user_id, conversation_id)
+
+    async def delete_user(self, user_id: str) -> bool:
+        """Remove every conversation belonging to a user"""
+        return await self._run(self._delete_user_sync, user_id)
+
+    # Paths and locking
+
+    def user_dir(self, user_id: str) -> Path:
+        # User ids are hashed so arbitrary ids cannot escape the store root
+        return self.root_path / hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+
+    def conversation_dir(self, user_id: str, conversation_id: str) -> Path:
+        if not CONVERSATION_ID_PATTERN.match(conversation_id):
+            raise ValueError(f"Invalid conversation id: {conversation_id!r}")
+        return self.user_dir(user_id) / conversation_id
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        # A user's writes always take the same lock, so delete_user cannot
+        # remove a directory an append is writing into
+        return self._locks[hash(user_id) % LOCK_STRIPES]
+
+    async def _run(self, func, *args):
+        return await self.fs.run(func, *args)
+
+    # Synchronous implementation (runs on the filesystem executor)
+
+    def _append_sync(self, user_id: str, conversation_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        return self._append_many_sync(user_id, conversation_id, [message])[0]
+
+    def _append_many_sync(self, user_id: str, conversation_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        conv_dir = self.conversation_dir(user_id, conversation_id)
+        with self._lock(user_id):
+            conv_dir.mkdir(parents=True, exist_ok=True)
+            index_path = conv_dir / "index.bin"
+            count, last = self._read_tail(index_path)
+            segment = last[0] if last else 0
+            segment_path = conv_dir / f"seg-{segment:06d}.log"
+            # The log may hold an unindexed tail from an interrupted append; the
+            # index is the source of truth, so new records start after it
+            offset = last[1] + last[2] if last else 0
+
+            stored = []
+            index_records = []
+            now = datetime.datetime.now().isoformat()
+            for message in messages:
+                record = {
+                    'seq': count,
+                    'role': message.get('role'),
+                    'content': message.get('content'),
+                    'created_at': message.get('created_at') or now
+                }
+                line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+                if offset and offset + len(line) > self.segment_max_bytes:
+                    self._write_segment(segment_path, index_records, offset)
+                    segment += 1
+                    segment_path = conv_dir / f"seg-{segment:06d}.log"
+                    offset = 0
+
+                index_records.append((segment, offset, line))
+                offset += len(line)
+                stored.append(record)
+                count += 1
+
+            self._write_segment(segment_path, index_records, offset)
+            return stored
+
+    def _write_segment(self, segment_path: Path, index_records: list, end_offset: int):
+        """Write pending lines for one segment, then their index records"""
+        if not index_records:
+            return
+        start = index_records[0][1]
+        with open(segment_path, "r+b" if segment_path.exists() else "wb") as f:
+            f.seek(start)
+            f.write(b"".join(line for _, _, line in index_records))
+            f.truncate(end_offset)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+        index_path = segment_path.parent / "index.bin"
+        with open(index_path, "ab") as f:
+            f.write(b"".join(INDEX_RECORD.pack(seg, off, len(line)) for seg, off, line in index_records))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        index_records.clear()
+
+    def _read_tail(self, index_path: Path):
+        """Return (message count, last index record or None)"""
+        try:
+            size = index_path.stat().st_size
+        except FileNotFoundError:
+            return 0, None
+        count = size // INDEX_RECORD.size
+        if size % INDEX_RECORD.size:
+            # Drop a torn record left by an interrupted index write
+            os.truncate(index_path, count * INDEX_RECORD.size)
+        if count == 0:
+            return 0, None
+        with open(index_path, "rb") as f:
+            f.seek((count - 1) * INDEX_RECORD.size)
+            return count, INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))
+
+    def _get_messages_sync(self, user_id: str, conversation_id: str, limit: int, before: Optional[str]) -> Dict[str, Any]:
+        conv_dir = self.conversation_dir(user_id, conversation_id)
+        index_path = conv_dir / "index.bin"
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        try:
+            total = index_path.stat().st_size // INDEX_RECORD.size
+        except FileNotFoundError:
+            return {'messages': [], 'next_cursor': None, 'total': 0}
+
+        end = total
+        if before is not None:
+            try:
+                end = max(0, min(total, int(before)))
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {before!r}")
+        start = max(0, end - limit)
+        if start == end:
+            return {'messages': [], 'next_cursor': None, 'total': total}
+
+        with open(index_path, "rb") as f:
+            f.seek(start * INDEX_RECORD.size)
+            raw = f.read((end - start) * INDEX_RECORD.size)
+        records = [INDEX_RECORD.unpack_from(raw, i * INDEX_RECORD.size) for i in range(end - start)]
+
+        messages = []
+        open_segment = None
+        handle = None
+        try:
+            for segment, offset, length in records:
+                if segment != open_segment:
+                    if handle:
+                        handle.close()
+                    handle = open(conv_dir / f"seg-{segment:06d}.log", "rb")
+                    open_segment = segment
+                handle.seek(offset)
+                messages.append(json.loads(handle.read(length)))
+        finally:
+            if handle:
+                handle.close()
+
+        return {
+            'messages': messages,
+            'next_cursor': str(start) if start > 0 else None,
+            'total': total
+        }
+
+    def _list_conversations_sync(self, user_id: str) -> List[Dict[str, Any]]:
+        user_dir = self.user_dir(user_id)
+        if not user_dir.exists():
+            return []
+        conversations = []
+        for conv_dir in sorted(user_dir.iterdir()):
+            index_path = conv_dir / "index.bin"
+            if not index_path.exists():
+                continue
+            stat = index_path.stat()
+            conversations.append({
+                'conversation_id': conv_dir.name,
+                'message_count': stat.st_size // INDEX_RECORD.size,
+                'updated_at': datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+        return conversations
+
+    def _delete_conversation_sync(self, user_id: str, conversation_id: str) -> bool:
+        conv_dir = self.conversation_dir(user_id, conversation_id)
+        with self._lock(user_id):
+            if not conv_dir.exists():
+                return False
+            shutil.rmtree(conv_dir)
+            return True
+
+    def _delete_user_sync(self, user_id: str) -> bool:
+        user_dir = self.user_dir(user_id)
+        with self._lock(user_id):
+            if not user_dir.exists():
+                return False
+            shutil.rmtree(user_dir)
+        logger.info(f"OpenAIPlugin: Deleted conversation history for user {user_id}")
+        return True
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Integrity Verification
+
+Checks that a published build still matches the hash manifest written when
+it was published (version_delta.MANIFEST_NAME, which records size, sha256,
+mtime_ns and inode per file). Verification keeps a snapshot of the last
+verified (size, mtime_ns, inode, sha256) per file outside the build and only
+re-hashes files whose stat triple differs from it; unchanged trees cost one
+directory walk of stat calls. Files that do need hashing are hashed in
+parallel through read-only memory maps (hashlib releases the GIL while
+digesting a mapped buffer).
+
+The first verification of a build starts from the stats recorded at publish
+time, so a freshly published build is never re-hashed in full.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from version_delta import is_generated, load_stored_manifest
+
+logger = structlog.get_logger()
+
+SNAPSHOT_VERSION = 1
+
+# relative path -> (size, mtime_ns, inode)
+StatMap = Dict[str, Tuple[int, int, int]]
+# relative path -> [size, mtime_ns, inode, sha256] as last verified
+Snapshot = Dict[str, List[Any]]
+
+
+def hash_file_mmap(path: Path) -> str:
+    """sha256 of a file, digested from a read-only memory map"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def scan_tree(root: Path) -> StatMap:
+    """(size, mtime_ns, inode) of every non-generated regular file under root"""
+    stats = {}
+    stack = [(str(root), "")]
+    while stack:
+        directory, prefix = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                relative = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, relative + "/"))
+                elif entry.is_file(follow_symlinks=False) and not is_generated(relative):
+                    stat = entry.stat(follow_symlinks=False)
+                    stats[relative] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    return stats
+
+
+def verify_tree(root: Path,
+                manifest: Dict[str, Dict[str, Any]],
+                snapshot: Optional[Snapshot] = None,
+                max_workers: Optional[int] = None) -> Tuple[Dict[str, Any], Snapshot]:
+    """
+    Compare a build directory against its manifest. Files whose stat triple
+    matches the snapshot (or, without one, the manifest) are trusted; the
+    rest are re-hashed. Returns (report, updated snapshot).
+    """
+    started = time.perf_counter()
+    root = Path(root)
+    if snapshot is None:
+        snapshot = {
+            relative: [entry['size'], entry['mtime_ns'], entry['inode'], entry['sha256']]
+            for relative, entry in manifest.items()
+            if 'mtime_ns' in entry and 'inode' in entry
+        }
+
+    current = scan_tree(root)
+    missing = sorted(relative for relative in manifest if relative not in current)
+    extra = sorted(relative for relative in current if relative not in manifest)
+
+    to_hash = []
+    verified: Snapshot = {}
+    for relative, entry in manifest.items():
+        stat = current.get(relative)
+        if stat is None:
+            continue
+        known = snapshot.get(relative)
+        if known is not None and tuple(known[:3]) == stat and known[3] == entry['sha256']:
+            verified[relative] = known
+        else:
+            to_hash.append(relative)
+
+    modified = []
+    if to_hash:
+        workers = max_workers or min(8, (os.cpu_count() or 1) + 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = pool.map(lambda relative: hash_file_mmap(root / relative), to_hash)
+            for relative, digest in zip(to_hash, digests):
+                if digest == manifest[relative]['sha256']:
+                    verified[relative] = [*current[relative], digest]
+                else:
+                    modified.append(relative)
+
+    report = {
+        'ok': not (missing or extra or modified),
+        'files': len(manifest),
+        'rehashed': len(to_hash),
+        'missing': missing,
+        'extra': extra,
+        'modified': sorted(modified),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+    return report, verified
+
+
+class IntegrityVerifier:
+    """Verifies builds against their manifests, caching verified stats per build"""
+
+    def __init__(self, cache_dir: Path, max_workers: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+
+    def verify(self, build_dir: Path) -> Dict[str, Any]:
+        build_dir = Path(build_dir)
+        manifest = load_stored_manifest(build_dir)
+        if manifest is None:
+            return {'success': False, 'ok': False, 'build': build_dir.name,
+                    'error': f'OpenAIPlugin: No file manifest in {build_dir}'}
+
+        snapshot = self._load_snapshot(build_dir.name)
+        report, verified = verify_tree(build_dir, manifest, snapshot, self.max_workers)
+        if verified != snapshot:
+            # Only verified files are recorded, so drift is re-checked next time
+            self._save_snapshot(build_dir.name, verified)
+
+        if report['ok']:
+            logger.info(f"OpenAIPlugin: Verified {report['files']} files of {build_dir.name} "
+                        f"({report['rehashed']} re-hashed) in {report['duration_ms']} ms")
+        else:
+            logger.warning(f"OpenAIPlugin: Integrity check failed for {build_dir.name}: "
+                           f"{len(report['missing'])} missing, {len(report['modified'])} modified, "
+                           f"{len(report['extra'])} unexpected files")
+        return {'success': True, 'build': build_dir.name, **report}
+
+    def _snapshot_path(self, build_name: str) -> Path:
+        return self.cache_dir / f"{build_name}.json"
+
+    def _load_snapshot(self, build_name: str) -> Optional[Snapshot]:
+        try:
+            with open(self._snapshot_path(build_name), 'r') as f:
+                stored = json.load(f)
+            return stored['files'] if stored.get('version') == SNAPSHOT_VERSION else None
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def _save_snapshot(self, build_name: str, snapshot: Snapshot):
+        path = self._snapshot_path(build_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump({'version': SNAPSHOT_VERSION, 'files': snapshot}, f)
+        os.replace(tmp, path)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Lazy Installation
+
+Tenant-wide enablement without eager per-user writes. Enabling the plugin
+for a tenant writes one `plugin_tenant_enablement` row; a user's `plugin`
+and `module` rows are materialized the first time the read path
+(get_plugin_status, get_user_modules) looks that user up and finds nothing.
+Callers cannot tell a lazily installed user from an eagerly installed one.
+
+Materialization is race-safe: concurrent first lookups for the same user in
+this process share one in-flight install, and across processes the
+deterministic row ids make the losing insert fail, after which the winner's
+rows are simply read back. The insert runs in a savepoint, so losing the race
+never rolls back the caller's session.
+
+A user who uninstalls gets a `plugin_user_opt_out` row, and is not
+materialized again while it exists.
+"""
+
+import asyncio
+import datetime
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+
+logger = structlog.get_logger()
+
+# Tenant used when no resolver is configured: every user belongs to it
+DEFAULT_TENANT = "default"
+DEFAULT_CACHE_TTL = 30.0
+
+ENABLEMENT_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS plugin_tenant_enablement (
+    tenant_id VARCHAR NOT NULL,
+    plugin_slug VARCHAR NOT NULL,
+    version VARCHAR NOT NULL,
+    enabled_at VARCHAR,
+    PRIMARY KEY (tenant_id, plugin_slug)
+)
+"""
+
+OPT_OUT_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS plugin_user_opt_out (
+    user_id VARCHAR NOT NULL,
+    plugin_slug VARCHAR NOT NULL,
+    opted_out_at VARCHAR,
+    PRIMARY KEY (user_id, plugin_slug)
+)
+"""
+
+
+class LazyInstaller:
+    """Per-tenant enablement and on-first-use materialization for one manager"""
+
+    def __init__(self,
+                 manager,
+                 tenant_resolver: Optional[Callable[[str], Optional[str]]] = None,
+                 cache_ttl: float = DEFAULT_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            manager: OpenAILifecycleManager whose rows are materialized
+            tenant_resolver: maps a user id to its tenant id (None = no tenant);
+                defaults to putting every user in DEFAULT_TENANT
+            cache_ttl: seconds an enablement lookup is reused
+        """
+        self.manager = manager
+        self.plugin_slug = manager.plugin_data['plugin_slug']
+        self.tenant_resolver = tenant_resolver or (lambda user_id: DEFAULT_TENANT)
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+
+        self._enabled_cache: Dict[str, Tuple[bool, float]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._table_ready = False
+        self.stats = {'materialized': 0, 'lost_races': 0, 'joined_inflight': 0, 'opted_out': 0}
+
+    async def _ensure_table(self, db):
+        if not self._table_ready:
+            await db.execute(text(ENABLEMENT_TABLE_DDL))
+            await db.execute(text(OPT_OUT_TABLE_DDL))
+            self._table_ready = True
+
+    async def enable_tenant(self, db, tenant_id: str = DEFAULT_TENANT) -> Dict[str, Any]:
+        """Enable the plugin for every user of a tenant with a single row"""
+        await self._ensure_table(db)
+        await db.execute(text("""
+        INSERT INTO plugin_tenant_enablement (tenant_id, plugin_slug, version, enabled_at)
+        VALUES (:tenant_id, :plugin_slug, :version, :enabled_at)
+        ON CONFLICT (tenant_id, plugin_slug) DO UPDATE SET version = :version, enabled_at = :enabled_at
+        """), {
+            'tenant_id': tenant_id,
+            'plugin_slug': self.plugin_slug,
+            'version': self.manager.plugin_data['version'],
+            'enabled_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+        await self._commit(db)
+        self._enabled_cache[tenant_id] = (True, self.clock())
+        logger.info(f"OpenAIPlugin: Enabled for tenant {tenant_id} (users install on first use)")
+        return {'success': True, 'tenant_id': tenant_id}
+
+    async def disable_tenant(self, db, tenant_id: str = DEFAULT_TENANT) -> Dict[str, Any]:
+        """Stop materializing new users; already materialized rows are kept"""
+        await self._ensure_table(db)
+        result = await db.execute(text("""
+        DELETE FROM plugin_tenant_enablement
+        WHERE tenant_id = :tenant_id AND plugin_slug = :plugin_slug
+        """), {'tenant_id': tenant_id, 'plugin_slug': self.plugin_slug})
+        await self._commit(db)
+        self._enabled_cache[tenant_id] = (False, self.clock())
+        return {'success': True, 'tenant_id': tenant_id, 'was_enabled': bool(result.rowcount)}
+
+    async def is_enabled_for(self, db, user_id: str) -> bool:
+        tenant_id = self.tenant_resolver(user_id)
+        if tenant_id is None:
+            return False
+        cached = self._enabled_cache.get(tenant_id)
+        if cached is not None and self.clock() - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        await self._ensure_table(db)
+        row = (await db.execute(text("""
+        SELECT tenant_id FROM plugin_tenant_enablement
+        WHERE tenant_id = :tenant_id AND plugin_slug = :plugin_slug
+        """), {'tenant_id': tenant_id, 'plugin_slug': self.plugin_slug})).fetchone()
+        enabled = row is not None
+        self._enabled_cache[tenant_id] = (enabled, self.clock())
+        return enabled
+
+    async def record_opt_out(self, db, user_id: str):
+        """
+        Remember that a user uninstalled, so the read path does not bring the
+        rows back. Committed by whoever commits the uninstall.
+        """
+        await self._ensure_table(db)
+        await db.execute(text("""
+        INSERT INTO plugin_user_opt_out (user_id, plugin_slug, opted_out_at)
+        VALUES (:user_id, :plugin_slug, :opted_out_at)
+        ON CONFLICT (user_id, plugin_slug) DO NOTHING
+        """), {
+            'user_id': user_id,
+            'plugin_slug': self.plugin_slug,
+            'opted_out_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    async def has_opted_out(self, db, user_id: str) -> bool:
+        await self._ensure_table(db)
+        row = (await db.execute(text("""
+        SELECT user_id FROM plugin_user_opt_out
+        WHERE user_id = :user_id AND plugin_slug = :plugin_slug
+        """), {'user_id': user_id, 'plugin_slug': self.plugin_slug})).fetchone()
+        return row is not None
+
+    async def materialize(self, db, user_id: str) -> Dict[str, Any]:
+        """
+        Create a user's rows if their tenant is enabled and they have none.
+        Returns {'materialized': bool, 'exists': bool}.
+        """
+        if not await self.is_enabled_for(db, user_id):
+            return {'materialized': False, 'exists': False}
+
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            self.stats['joined_inflight'] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            result = await self._materialize(db, user_id)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(user_id, None)
+
+    async def _materialize(self, db, user_id: str) -> Dict[str, Any]:
+        manager = self.manager
+        existing = await manager._check_existing_plugin(user_id, db)
+        if existing['exists']:
+            manager.active_users.add(user_id)
+            return {'materialized': False, 'exists': True}
+
+        if await self.has_opted_out(db, user_id):
+            self.stats['opted_out'] += 1
+            return {'materialized': False, 'exists': False}
+
+        # Inside a unit of work the insert gets its own savepoint: a lost race
+        # rolls back only that, never the caller's session
+        async with manager.unit_of_work(db):
+            created = await manager._create_database_records(user_id, db)
+        if created['success']:
+            await self._commit(db)
+            manager.active_users.add(user_id)
+            self.stats['materialized'] += 1
+            logger.info(f"OpenAIPlugin: Materialized rows for {user_id} on first use")
+            return {'materialized': True, 'exists': True}
+
+        # Another process may have won the insert race; its rows are as good as ours
+        existing = await manager._check_existing_plugin(user_id, db)
+        if existing['exists']:
+            manager.active_users.add(user_id)
+            self.stats['lost_races'] += 1
+            return {'materialized': False, 'exists': True}
+        return {'materialized': False, 'exists': False, 'error': created.get('error')}
+
+    async def _commit(self, db):
+        if id(db) not in self.manager._unit_of_work_sessions:
+            await db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
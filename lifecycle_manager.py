@@ -6,12 +6,16 @@ This script handles install/update/delete operations for the OpenAI plugin
 using the new multi-user plugin lifecycle management architecture.
 """
 
+import fnmatch
 import json
 import logging
 import datetime
 import os
+import sys
 import shutil
+import time
 import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -20,6 +24,14 @@ import structlog
 
 logger = structlog.get_logger()
 
+# Companion modules (caches, stores) ship next to this file and are imported lazily
+PLUGIN_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+if PLUGIN_SOURCE_DIR not in sys.path:
+    sys.path.append(PLUGIN_SOURCE_DIR)
+
+# Needed at class definition time; tracing itself only depends on the standard library
+from tracing import traced
+
 # Import the new base lifecycle manager
 try:
     # Try to import from the BrainDrive system first (when running in production)
@@ -76,6 +88,16 @@ except ImportError:
                         self.last_used = datetime.datetime.now()
                     return result
 
+                async def update_for_user(self, user_id: str, db, new_version_manager: 'BaseLifecycleManager'):
+                    user_data = await self._export_user_data(user_id, db)
+                    uninstall_result = await self.uninstall_for_user(user_id, db)
+                    if not uninstall_result['success']:
+                        return uninstall_result
+                    result = await new_version_manager.install_for_user(user_id, db, new_version_manager.shared_path)
+                    if result['success']:
+                        await new_version_manager._import_user_data(user_id, db, user_data)
+                    return result
+
                 @abstractmethod
                 async def get_plugin_metadata(self): pass
                 @abstractmethod
@@ -92,11 +114,60 @@ except ImportError:
         raise ImportError("OpenAI plugin requires the new architecture BaseLifecycleManager")
 
 
+# Files and directories never copied into a build (similar to build_archive.py)
+EXCLUDE_PATTERNS = {
+    'node_modules',
+    'package-lock.json',
+    '.git',
+    '.gitignore',
+    '__pycache__',
+    '.pytest_cache',
+    '*.pyc',
+    '.DS_Store',
+    'Thumbs.db',
+    # release_packager.py output
+    'releases'
+}
+
+# Development-only files kept out of release archives (fnmatch on the file name)
+RELEASE_EXCLUDE_PATTERNS = (
+    'test_*.py',
+    '*_output.txt',
+    'build.sh',
+    'release_packager.py'
+)
+
+# Files an installed (or released) plugin must contain
+REQUIRED_FILES = ["package.json", "dist/remoteEntry.js"]
+
+
+def should_copy(path: Path) -> bool:
+    """Check if a file/directory (relative to the plugin source) should be copied"""
+    # Check if any part of the path matches exclude patterns
+    for part in path.parts:
+        if part in EXCLUDE_PATTERNS:
+            return False
+    # Check for pattern matches
+    for pattern in EXCLUDE_PATTERNS:
+        if '*' in pattern and path.name.endswith(pattern.replace('*', '')):
+            return False
+    return True
+
+
 class OpenAILifecycleManager(BaseLifecycleManager):
     """Lifecycle manager for OpenAI plugin using new architecture"""
 
-    def __init__(self, plugins_base_dir: str = None):
-        """Initialize the lifecycle manager"""
+    def __init__(self, plugins_base_dir: str = None, source_dir: str = None, module_storage: str = "inline",
+                 version: str = None):
+        """
+        Initialize the lifecycle manager
+
+        module_storage: "inline" writes full module rows per user; "template"
+        writes slim per-user rows referencing shared module definitions
+        (see module_templates.py).
+        version: build this manager for another version of the plugin whose
+        files are in source_dir (e.g. the target of a fleet update).
+        """
         # Define plugin-specific data
         self.plugin_data = {
             "name": "OpenAIPlugin",
@@ -188,6 +259,31 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                         "type": "number",
                         "description": "Response creativity (0-1)",
                         "default": 0.7
+                    },
+                    "max_context_tokens": {
+                        "type": "number",
+                        "description": "Maximum tokens per request including history (0 uses the model limit)",
+                        "default": 0
+                    },
+                    "response_cache_enabled": {
+                        "type": "boolean",
+                        "description": "Reuse responses for identical deterministic (temperature 0) requests",
+                        "default": False
+                    },
+                    "response_cache_max_entries": {
+                        "type": "number",
+                        "description": "Maximum number of cached responses kept in memory",
+                        "default": 500
+                    },
+                    "response_cache_disk": {
+                        "type": "boolean",
+                        "description": "Persist cached responses to disk",
+                        "default": False
+                    },
+                    "response_cache_shared_across_keys": {
+                        "type": "boolean",
+                        "description": "Serve cached responses to requests made with a different API key or organization",
+                        "default": False
                     }
                 },
                 "messages": {},
@@ -205,11 +301,65 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             }
         ]
 
+        if version:
+            self.plugin_data['version'] = version
+
         # Initialize base class with required parameters
         if plugins_base_dir:
-            shared_path = Path(plugins_base_dir) / "shared" / self.plugin_data['plugin_slug'] / f"v{self.plugin_data['version']}"
+            plugins_root = Path(plugins_base_dir)
         else:
-            shared_path = Path(__file__).parent.parent.parent / "backend" / "plugins" / "shared" / self.plugin_data['plugin_slug'] / f"v{self.plugin_data['version']}"
+            plugins_root = Path(__file__).parent.parent.parent / "backend" / "plugins"
+        shared_path = plugins_root / "shared" / self.plugin_data['plugin_slug'] / f"v{self.plugin_data['version']}"
+
+        # Per-user runtime data lives outside the versioned shared directory so it survives updates
+        self.data_path = plugins_root / "data" / self.plugin_data['plugin_slug']
+        self._conversation_store = None
+
+        # Directory the shared version is built from (defaults to this plugin checkout)
+        self.source_dir = Path(source_dir) if source_dir else Path(__file__).parent
+        self._version_store = None
+        self._publish_lock = None
+        self._update_checker = None
+        self._reconciler = None
+        self._version_gc = None
+
+        from module_templates import MODULE_STORAGE_MODES
+        if module_storage not in MODULE_STORAGE_MODES:
+            raise ValueError(f"module_storage must be one of {MODULE_STORAGE_MODES}")
+        self.module_storage = module_storage
+        self._module_templates = None
+
+        # id(session) -> nesting depth of unit_of_work blocks using it
+        self._unit_of_work_sessions: Dict[int, int] = {}
+        # id(session) -> non-database work to run once that unit of work commits
+        self._post_commit: Dict[int, list] = {}
+        # Users being moved to another version; their uninstall step keeps user data
+        self._updating_users: set = set()
+
+        # Set by configure_lazy_install / enable_for_tenant; None keeps reads side-effect free
+        self._lazy_installer = None
+
+        # warm_start() task and its (live) report
+        self._warmup_task = None
+        self.warmup_report = None
+
+        # All blocking filesystem work from coroutines goes through this bounded executor
+        from async_fs import get_async_fs
+        self.fs = get_async_fs()
+        self._bundle_server = None
+
+        # Process-wide tracer; disabled (non-recording spans) until tracing.configure_tracing()
+        from tracing import get_tracer
+        self.tracer = get_tracer()
+
+        # Validation/health results, trusted only while a file watcher covers the directory
+        self._file_watcher = None
+        self._probe_cache: Dict[tuple, Dict[str, Any]] = {}
+        # Bumped on every invalidation; a probe that overlapped one is not cached
+        self._probe_generation = 0
+        self._health_listeners = []
+        self._last_health = None
+        self._health_push = None
 
         super().__init__(
             plugin_slug=self.plugin_data['plugin_slug'],
@@ -217,11 +367,76 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             shared_storage_path=shared_path
         )
 
+        # Sorted-blob membership instead of a set of strings (~3x smaller at 1M users)
+        from user_set import CompactUserSet
+        self.active_users = CompactUserSet(self.active_users)
+
     @property
     def PLUGIN_DATA(self):
         """Compatibility property for remote installer validation"""
         return self.plugin_data
 
+    @property
+    def conversation_store(self) -> 'ConversationStore':
+        """Persistent chat history store for ComponentOpenAIChat"""
+        if self._conversation_store is None:
+            from conversation_store import ConversationStore
+            self._conversation_store = ConversationStore(self.data_path / "conversations", fs=self.fs)
+        return self._conversation_store
+
+    @property
+    def version_store(self) -> 'VersionStore':
+        """Staged build / atomic activation store for this plugin's shared versions"""
+        if self._version_store is None:
+            from version_store import VersionStore
+            self._version_store = VersionStore(self.shared_path.parent)
+        return self._version_store
+
+    @property
+    def bundle_server(self) -> 'BundleServer':
+        """In-memory server for the shared dist/ assets, following the active build"""
+        if self._bundle_server is None:
+            from bundle_server import BundleServer
+            self._bundle_server = BundleServer(self.shared_path.parent, fs=self.fs)
+        return self._bundle_server
+
+    @property
+    def module_templates(self) -> 'ModuleTemplateStore':
+        """Shared module definitions for this version (template storage mode)"""
+        if self._module_templates is None:
+            from module_templates import ModuleTemplateStore
+            self._module_templates = ModuleTemplateStore(self.plugin_data['plugin_slug'], self.plugin_data['version'])
+        return self._module_templates
+
+    @property
+    def update_checker(self) -> 'UpdateChecker':
+        """Release lookups for this plugin, with validators cached under data_path"""
+        if self._update_checker is None:
+            from update_checker import UpdateChecker
+            self._update_checker = UpdateChecker(cache_path=self.data_path / "update-check.json")
+        return self._update_checker
+
+    @property
+    def version_gc(self) -> 'VersionGarbageCollector':
+        """One collector per manager, so only one collection runs at a time"""
+        if self._version_gc is None:
+            from version_gc import VersionGarbageCollector
+            self._version_gc = VersionGarbageCollector(
+                self.version_store,
+                self.plugin_data['plugin_slug'],
+                protected_versions={self.shared_path.name},
+                fs=self.fs
+            )
+        return self._version_gc
+
+    @property
+    def reconciler(self) -> 'Reconciler':
+        """Incremental DB/memory/disk reconciler, with its cursor kept under data_path"""
+        if self._reconciler is None:
+            from reconciler import Reconciler
+            self._reconciler = Reconciler(self, cursor_path=self.data_path / "reconcile-cursor.json")
+        return self._reconciler
+
     async def get_plugin_metadata(self) -> Dict[str, Any]:
         """Return plugin metadata and configuration"""
         return self.plugin_data
@@ -259,11 +474,20 @@ class OpenAILifecycleManager(BaseLifecycleManager):
 
             plugin_id = existing_check['plugin_id']
 
+            # Keep lazy installation from bringing the rows back on the next lookup
+            updating = user_id in self._updating_users
+            if self._lazy_installer is not None and not updating:
+                await self._lazy_installer.record_opt_out(db, user_id)
+
             # Delete database records
             delete_result = await self._delete_database_records(user_id, plugin_id, db)
             if not delete_result['success']:
                 return delete_result
 
+            # Chat history lives outside the database; remove it only once the rows are gone for good
+            if not updating:
+                await self._after_commit(db, lambda: self._delete_conversations(user_id))
+
             logger.info(f"OpenAIPlugin: User uninstallation completed for {user_id}")
             return {
                 'success': True,
@@ -275,6 +499,14 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             logger.error(f"OpenAIPlugin: User uninstallation failed for {user_id}: {e}")
             return {'success': False, 'error': str(e)}
 
+    async def _delete_conversations(self, user_id: str):
+        try:
+            await self.conversation_store.delete_user(user_id)
+        except Exception as e:
+            # The uninstall itself is committed; leftover history is only disk space
+            logger.error(f"OpenAIPlugin: Failed to delete conversation history for user {user_id}: {e}")
+
+    @traced("files.copy", "target_dir")
     async def _copy_plugin_files_impl(self, user_id: str, target_dir: Path, update: bool = False) -> Dict[str, Any]:
         """
         OpenAIPlugin-specific implementation of file copying.
@@ -282,92 +514,118 @@ class OpenAILifecycleManager(BaseLifecycleManager):
         Copies all files from the plugin source directory to the target directory.
         """
         try:
-            source_dir = Path(__file__).parent
+            source_dir = self.source_dir
             copied_files = []
 
-            # Define files and directories to exclude (similar to build_archive.py)
-            exclude_patterns = {
-                'node_modules',
-                'package-lock.json',
-                '.git',
-                '.gitignore',
-                '__pycache__',
-                '*.pyc',
-                '.DS_Store',
-                'Thumbs.db'
-            }
+            fs = self.fs
 
-            def should_copy(path: Path) -> bool:
-                """Check if a file/directory should be copied"""
-                # Check if any part of the path matches exclude patterns
-                for part in path.parts:
-                    if part in exclude_patterns:
-                        return False
-                # Check for pattern matches
-                for pattern in exclude_patterns:
-                    if '*' in pattern and path.name.endswith(pattern.replace('*', '')):
-                        return False
-                return True
-
-            # Copy all files and directories recursively
-            for item in source_dir.rglob('*'):
-                # Skip the lifecycle_manager.py file itself to avoid infinite recursion
-                if item.name == 'lifecycle_manager.py' and item == Path(__file__):
-                    continue
-
-                # Get relative path from source directory
-                relative_path = item.relative_to(source_dir)
-
-                # Check if we should copy this item
-                if not should_copy(relative_path):
-                    continue
-
-                target_path = target_dir / relative_path
+            def classify(items):
+                """Split the source listing into directories and files to copy"""
+                dirs, files = [], []
+                for item in items:
+                    # Skip the lifecycle_manager.py file itself to avoid infinite recursion
+                    if item.name == 'lifecycle_manager.py' and item == Path(__file__):
+                        continue
+
+                    # Get relative path from source directory
+                    relative_path = item.relative_to(source_dir)
+
+                    # Check if we should copy this item
+                    if not should_copy(relative_path):
+                        continue
 
-                try:
                     if item.is_file():
-                        # Create parent directories if they don't exist
-                        target_path.parent.mkdir(parents=True, exist_ok=True)
-                        shutil.copy2(item, target_path)
-                        copied_files.append(str(target_path))
-                        logger.info(f"OpenAIPlugin: Copied file {item} to {target_path}")
+                        files.append((item, target_dir / relative_path))
                     elif item.is_dir():
-                        # Create directory if it doesn't exist
-                        target_path.mkdir(parents=True, exist_ok=True)
-                        logger.info(f"OpenAIPlugin: Created directory {target_path}")
+                        dirs.append(target_dir / relative_path)
+                return dirs, files
+
+            def make_dirs(dirs):
+                for directory in [target_dir] + dirs:
+                    directory.mkdir(parents=True, exist_ok=True)
+
+            def copy_one(pair):
+                item, target_path = pair
+                try:
+                    target_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(item, target_path)
+                    return str(target_path), target_path.stat().st_size
                 except Exception as e:
                     logger.error(f"OpenAIPlugin: Failed to copy {item} to {target_path}: {e}")
-                    continue
+                    return None
+
+            # Walk, create directories and copy files on the filesystem executor so
+            # the event loop keeps serving other coroutines during large copies
+            items = await fs.listdir_recursive(source_dir)
+            dirs, files = await fs.run(classify, items)
+            await fs.run(make_dirs, dirs)
+            for directory in dirs:
+                logger.info(f"OpenAIPlugin: Created directory {directory}")
+
+            copied_bytes = 0
+            for (item, target_path), copied in zip(files, await fs.map(copy_one, files)):
+                if copied is not None:
+                    copied_files.append(copied[0])
+                    copied_bytes += copied[1]
+                    logger.info(f"OpenAIPlugin: Copied file {item} to {target_path}")
 
             # Copy the lifecycle_manager.py file itself
             lifecycle_manager_source = Path(__file__)
             lifecycle_manager_target = target_dir / 'lifecycle_manager.py'
             try:
-                shutil.copy2(lifecycle_manager_source, lifecycle_manager_target)
+                await fs.copy2(lifecycle_manager_source, lifecycle_manager_target)
                 copied_files.append(str(lifecycle_manager_target))
                 logger.info(f"OpenAIPlugin: Copied lifecycle_manager.py to {lifecycle_manager_target}")
             except Exception as e:
                 logger.error(f"OpenAIPlugin: Failed to copy lifecycle_manager.py: {e}")
 
             logger.info(f"OpenAIPlugin: Copied {len(copied_files)} files/directories to {target_dir}")
+            self.tracer.current_span().set_attributes({'files': len(copied_files), 'bytes': copied_bytes})
             return {'success': True, 'copied_files': copied_files}
 
         except Exception as e:
             logger.error(f"OpenAIPlugin: Error copying plugin files: {e}")
             return {'success': False, 'error': str(e)}
 
+    def _list_source_files(self) -> Dict[str, Path]:
+        """Relative path -> source file for every file a build of this version contains"""
+        files = {}
+        for item in sorted(self.source_dir.rglob('*')):
+            if item == Path(__file__) or not item.is_file():
+                continue
+            relative_path = item.relative_to(self.source_dir)
+            if should_copy(relative_path):
+                files[relative_path.as_posix()] = item
+        files['lifecycle_manager.py'] = Path(__file__)
+        return files
+
+    def _list_release_files(self) -> Dict[str, Path]:
+        """Source files minus development-only ones; raises if the built bundle is missing"""
+        files = {
+            relative: path for relative, path in self._list_source_files().items()
+            if not any(fnmatch.fnmatch(Path(relative).name, pattern) for pattern in RELEASE_EXCLUDE_PATTERNS)
+        }
+        missing = [name for name in REQUIRED_FILES if name not in files]
+        if missing:
+            raise FileNotFoundError(f"OpenAIPlugin: Missing required files for release: {', '.join(missing)} "
+                                    f"(run `npm run build` first)")
+        return files
+
     async def _validate_installation_impl(self, user_id: str, plugin_dir: Path) -> Dict[str, Any]:
         """
         OpenAIPlugin-specific validation logic.
         This method is called by the base class during installation.
         """
+        return await self._cached_probe('validation', plugin_dir, self._check_installation, user_id)
+
+    async def _check_installation(self, user_id: str, plugin_dir: Path) -> Dict[str, Any]:
+        """Validate required files, package.json and the bundle in plugin_dir"""
         try:
             # Check for OpenAIPlugin-specific required files
-            required_files = ["package.json", "dist/remoteEntry.js"]
             missing_files = []
 
-            for file_path in required_files:
-                if not (plugin_dir / file_path).exists():
+            for file_path in REQUIRED_FILES:
+                if not await self.fs.exists(plugin_dir / file_path):
                     missing_files.append(file_path)
 
             if missing_files:
@@ -379,8 +637,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             # Validate package.json structure
             package_json_path = plugin_dir / "package.json"
             try:
-                with open(package_json_path, 'r') as f:
-                    package_data = json.load(f)
+                package_data = await self.fs.read_json(package_json_path)
 
                 # Check for required package.json fields
                 required_fields = ["name", "version"]
@@ -399,7 +656,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
 
             # Validate bundle file exists and is not empty
             bundle_path = plugin_dir / "dist" / "remoteEntry.js"
-            if bundle_path.stat().st_size == 0:
+            if (await self.fs.stat(bundle_path)).st_size == 0:
                 return {
                     'valid': False,
                     'error': 'OpenAIPlugin: Bundle file (remoteEntry.js) is empty'
@@ -417,6 +674,10 @@ class OpenAILifecycleManager(BaseLifecycleManager):
         OpenAIPlugin-specific health check logic.
         This method is called by the base class during status checks.
         """
+        return await self._cached_probe('health', plugin_dir, self._check_health, user_id)
+
+    async def _check_health(self, user_id: str, plugin_dir: Path) -> Dict[str, Any]:
+        """Probe bundle, package.json and assets in plugin_dir"""
         try:
             health_info = {
                 'bundle_exists': False,
@@ -427,23 +688,22 @@ class OpenAILifecycleManager(BaseLifecycleManager):
 
             # Check bundle file
             bundle_path = plugin_dir / "dist" / "remoteEntry.js"
-            if bundle_path.exists():
+            if await self.fs.exists(bundle_path):
                 health_info['bundle_exists'] = True
-                health_info['bundle_size'] = bundle_path.stat().st_size
+                health_info['bundle_size'] = (await self.fs.stat(bundle_path)).st_size
 
             # Check package.json
             package_json_path = plugin_dir / "package.json"
-            if package_json_path.exists():
+            if await self.fs.exists(package_json_path):
                 try:
-                    with open(package_json_path, 'r') as f:
-                        json.load(f)
+                    await self.fs.read_json(package_json_path)
                     health_info['package_json_valid'] = True
                 except json.JSONDecodeError:
                     pass
 
             # Check for assets directory
             assets_path = plugin_dir / "assets"
-            if assets_path.exists() and assets_path.is_dir():
+            if await self.fs.is_dir(assets_path):
                 health_info['assets_present'] = True
 
             # Determine overall health
@@ -465,6 +725,93 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                 'details': {'error': str(e)}
             }
 
+    async def _cached_probe(self, kind: str, plugin_dir: Path, probe, user_id: str) -> Dict[str, Any]:
+        """Serve a probe result from memory while the file watcher guarantees it is current"""
+        watcher = self._file_watcher
+        if watcher is None or not watcher.covers(plugin_dir):
+            return await probe(user_id, plugin_dir)
+
+        key = (kind, str(plugin_dir))
+        cached = self._probe_cache.get(key)
+        if cached is None:
+            generation = self._probe_generation
+            cached = await probe(user_id, plugin_dir)
+            if self._probe_generation == generation:
+                self._probe_cache[key] = cached
+        return dict(cached)
+
+    async def start_file_watcher(self, poll_interval: float = 2.0, use_inotify: bool = True) -> Dict[str, Any]:
+        """
+        Watch the shared version path and invalidate cached validation, health
+        and bundle data on change. Uses inotify when available, else polling.
+        """
+        if self._file_watcher is not None:
+            return {'success': True, 'mode': self._file_watcher.mode}
+        try:
+            from plugin_watcher import PluginDirectoryWatcher
+            watcher = PluginDirectoryWatcher(self.shared_path, self._on_plugin_files_changed,
+                                             poll_interval=poll_interval, use_inotify=use_inotify)
+            mode = await watcher.start()
+            self._file_watcher = watcher
+            self._invalidate_probes()
+            return {'success': True, 'mode': mode}
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to start file watcher: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def stop_file_watcher(self):
+        """Stop watching; probes go back to hitting the filesystem every time"""
+        if self._file_watcher is not None:
+            await self._file_watcher.stop()
+            self._file_watcher = None
+        if self._health_push is not None:
+            self._health_push.cancel()
+            self._health_push = None
+        self._invalidate_probes()
+
+    def _invalidate_probes(self):
+        self._probe_generation += 1
+        self._probe_cache.clear()
+
+    def add_health_listener(self, callback):
+        """Register callback(health, reason), called when watched health changes"""
+        self._health_listeners.append(callback)
+
+    def _on_plugin_files_changed(self, reason: str):
+        self._invalidate_probes()
+        if self._bundle_server is not None:
+            self._bundle_server.invalidate()
+        logger.info(f"OpenAIPlugin: Plugin files changed ({reason}), caches invalidated")
+        if self._health_listeners:
+            # Coalesce bursts (e.g. a copy in progress) into one health recomputation
+            if self._health_push is not None:
+                self._health_push.cancel()
+            loop = asyncio.get_event_loop()
+            self._health_push = loop.call_later(0.05, lambda: asyncio.ensure_future(self._push_health(reason)))
+
+    async def _push_health(self, reason: str):
+        self._health_push = None
+        health = await self._get_plugin_health_impl(None, self.shared_path)
+        if health == self._last_health:
+            return
+        self._last_health = health
+        for callback in list(self._health_listeners):
+            try:
+                callback(health, reason)
+            except Exception as e:
+                logger.error(f"OpenAIPlugin: Health listener failed: {e}")
+
+    async def _execute(self, db: AsyncSession, statement, params=None):
+        """db.execute inside a 'db.statement' span (operation, table, rows)"""
+        from tracing import SPAN_KIND_CLIENT, statement_attributes
+        with self.tracer.span("db.statement", kind=SPAN_KIND_CLIENT) as span:
+            result = await db.execute(statement, params)
+            if span.recording:
+                span.set_attributes(statement_attributes(statement))
+                rowcount = getattr(result, 'rowcount', -1)
+                span.set_attribute('db.rows', rowcount if rowcount >= 0 else None)
+            return result
+
     async def _check_existing_plugin(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Check if plugin already exists for user"""
         try:
@@ -474,7 +821,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             WHERE user_id = :user_id AND plugin_slug = :plugin_slug
             """)
 
-            result = await db.execute(plugin_query, {
+            result = await self._execute(db, plugin_query, {
                 'user_id': user_id,
                 'plugin_slug': self.plugin_data['plugin_slug']
             })
@@ -500,9 +847,77 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             logger.error(f"Error checking existing plugin: {e}")
             return {'exists': False, 'error': str(e)}
 
+    @asynccontextmanager
+    async def unit_of_work(self, db: AsyncSession):
+        """
+        Run lifecycle writes on `db` inside the caller's transaction.
+
+        Within this block the manager never commits or rolls back `db`
+        itself; each user's writes run in a savepoint, so one failed user is
+        rolled back alone and the caller decides when to commit (e.g. every
+        N users for group commit). Template definitions written inside the
+        block are re-written harmlessly (ON CONFLICT) until a later install
+        commits on its own.
+
+        Side effects outside the database (such as deleting an uninstalled
+        user's chat history) wait for the commit: call run_post_commit(db)
+        after committing and discard_post_commit(db) after rolling back.
+        Work still pending when the block exits is dropped.
+        """
+        key = id(db)
+        self._unit_of_work_sessions[key] = self._unit_of_work_sessions.get(key, 0) + 1
+        try:
+            yield db
+        finally:
+            self._unit_of_work_sessions[key] -= 1
+            if not self._unit_of_work_sessions[key]:
+                del self._unit_of_work_sessions[key]
+                dropped = self._post_commit.pop(key, [])
+                if dropped:
+                    logger.warning(f"OpenAIPlugin: Dropped {len(dropped)} post-commit actions of an uncommitted unit of work")
+
+    async def run_post_commit(self, db: AsyncSession):
+        """Run the work deferred until the unit of work on `db` committed"""
+        for action in self._post_commit.pop(id(db), []):
+            await action()
+
+    def discard_post_commit(self, db: AsyncSession):
+        """Forget deferred work after the unit of work on `db` rolled back"""
+        self._post_commit.pop(id(db), None)
+
+    async def _after_commit(self, db: AsyncSession, action):
+        """Run `action` (a coroutine function) now, or when the caller commits a unit of work"""
+        if id(db) in self._unit_of_work_sessions:
+            self._post_commit.setdefault(id(db), []).append(action)
+        else:
+            await action()
+
+    async def _begin_write(self, db: AsyncSession):
+        """Savepoint when writing inside a unit of work, None when we own the transaction"""
+        if id(db) in self._unit_of_work_sessions:
+            return await db.begin_nested()
+        return None
+
+    async def _finish_write(self, db: AsyncSession, savepoint):
+        with self.tracer.span("db.commit", savepoint=savepoint is not None):
+            if savepoint is not None:
+                await savepoint.commit()
+            else:
+                await db.commit()
+
+    async def _abort_write(self, db: AsyncSession, savepoint):
+        if savepoint is not None:
+            if savepoint.is_active:
+                await savepoint.rollback()
+        else:
+            await db.rollback()
+
+    @traced("db.create_records", "user_id")
     async def _create_database_records(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Create plugin and module records in database"""
+        savepoint = None
         try:
+            savepoint = await self._begin_write(db)
             current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             plugin_slug = self.plugin_data['plugin_slug']
             plugin_id = f"{user_id}_{plugin_slug}"
@@ -524,7 +939,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             :update_available, :latest_version, :installation_type, :permissions)
             """)
 
-            await db.execute(plugin_stmt, {
+            await self._execute(db, plugin_stmt, {
                 'id': plugin_id,
                 'name': self.plugin_data['name'],
                 'description': self.plugin_data['description'],
@@ -561,22 +976,39 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                 'permissions': json.dumps(self.plugin_data['permissions'])
             })
 
+            # Template mode: static definitions are shared, user rows only reference them
+            definition_ids = None
+            if self.module_storage == "template":
+                definition_ids = await self.module_templates.ensure_definitions(db, self.module_data)
+
             modules_created = []
             for module_data in self.module_data:
                 module_id = f"{user_id}_{plugin_slug}_{module_data['name']}"
 
-                module_stmt = text("""
-                INSERT INTO module
-                (id, plugin_id, name, display_name, description, icon, category,
-                enabled, priority, props, config_fields, messages, required_services,
-                dependencies, layout, tags, created_at, updated_at, user_id)
-                VALUES
-                (:id, :plugin_id, :name, :display_name, :description, :icon, :category,
-                :enabled, :priority, :props, :config_fields, :messages, :required_services,
-                :dependencies, :layout, :tags, :created_at, :updated_at, :user_id)
-                """)
+                if definition_ids is None:
+                    module_stmt = text("""
+                    INSERT INTO module
+                    (id, plugin_id, name, display_name, description, icon, category,
+                    enabled, priority, props, config_fields, messages, required_services,
+                    dependencies, layout, tags, created_at, updated_at, user_id)
+                    VALUES
+                    (:id, :plugin_id, :name, :display_name, :description, :icon, :category,
+                    :enabled, :priority, :props, :config_fields, :messages, :required_services,
+                    :dependencies, :layout, :tags, :created_at, :updated_at, :user_id)
+                    """)
+                else:
+                    module_stmt = text("""
+                    INSERT INTO module
+                    (id, plugin_id, name, display_name, description, icon, category,
+                    enabled, priority, props, config_fields, messages, required_services,
+                    dependencies, layout, tags, created_at, updated_at, user_id, definition_id)
+                    VALUES
+                    (:id, :plugin_id, :name, :display_name, :description, :icon, :category,
+                    :enabled, :priority, :props, :config_fields, :messages, :required_services,
+                    :dependencies, :layout, :tags, :created_at, :updated_at, :user_id, :definition_id)
+                    """)
 
-                await db.execute(module_stmt, {
+                module_values = {
                     'id': module_id,
                     'plugin_id': plugin_id,
                     'name': module_data['name'],
@@ -596,31 +1028,42 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                     'created_at': current_time,
                     'updated_at': current_time,
                     'user_id': user_id
-                })
+                }
+                if definition_ids is not None:
+                    module_values = self.module_templates.user_row(module_values, definition_ids[module_data['name']])
+
+                await self._execute(db, module_stmt, module_values)
 
                 modules_created.append(module_id)
 
-            # Commit the transaction to persist changes
-            await db.commit()
+            # Commit the transaction (or release the savepoint) to persist changes
+            await self._finish_write(db, savepoint)
+            if definition_ids is not None and savepoint is None:
+                self.module_templates.confirm(definition_ids.values())
 
             logger.info(f"Created database records for plugin {plugin_id} with {len(modules_created)} modules")
+            self.tracer.current_span().set_attributes({'modules': len(modules_created),
+                                                       'rows': 1 + len(modules_created)})
             return {'success': True, 'plugin_id': plugin_id, 'modules_created': modules_created}
 
         except Exception as e:
             logger.error(f"Error creating database records: {e}")
             # Rollback on error
-            await db.rollback()
+            await self._abort_write(db, savepoint)
             return {'success': False, 'error': str(e)}
 
+    @traced("db.delete_records", "user_id", "plugin_id")
     async def _delete_database_records(self, user_id: str, plugin_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Delete plugin and module records from database"""
+        savepoint = None
         try:
+            savepoint = await self._begin_write(db)
             module_delete_stmt = text("""
             DELETE FROM module
             WHERE plugin_id = :plugin_id AND user_id = :user_id
             """)
 
-            module_result = await db.execute(module_delete_stmt, {
+            module_result = await self._execute(db, module_delete_stmt, {
                 'plugin_id': plugin_id,
                 'user_id': user_id
             })
@@ -632,24 +1075,26 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             WHERE id = :plugin_id AND user_id = :user_id
             """)
 
-            plugin_result = await db.execute(plugin_delete_stmt, {
+            plugin_result = await self._execute(db, plugin_delete_stmt, {
                 'plugin_id': plugin_id,
                 'user_id': user_id
             })
 
             if plugin_result.rowcount == 0:
+                await self._abort_write(db, savepoint)
                 return {'success': False, 'error': 'Plugin not found or not owned by user'}
 
-            # Commit the transaction to persist changes
-            await db.commit()
+            # Commit the transaction (or release the savepoint) to persist changes
+            await self._finish_write(db, savepoint)
 
             logger.info(f"Deleted database records for plugin {plugin_id} ({deleted_modules} modules)")
+            self.tracer.current_span().set_attribute('rows', deleted_modules + plugin_result.rowcount)
             return {'success': True, 'deleted_modules': deleted_modules}
 
         except Exception as e:
             logger.error(f"Error deleting database records: {e}")
             # Rollback on error
-            await db.rollback()
+            await self._abort_write(db, savepoint)
             return {'success': False, 'error': str(e)}
 
     async def _export_user_data(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
@@ -672,7 +1117,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             WHERE user_id = :user_id AND plugin_slug = :plugin_slug
             """)
 
-            result = await db.execute(plugin_query, {
+            result = await self._execute(db, plugin_query, {
                 'user_id': user_id,
                 'plugin_slug': self.plugin_data['plugin_slug']
             })
@@ -692,7 +1137,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             """)
 
             plugin_id = f"{user_id}_{self.plugin_data['plugin_slug']}"
-            result = await db.execute(module_query, {
+            result = await self._execute(db, module_query, {
                 'plugin_id': plugin_id,
                 'user_id': user_id
             })
@@ -735,7 +1180,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                 WHERE id = :plugin_id AND user_id = :user_id
                 """)
 
-                await db.execute(update_plugin_query, {
+                await self._execute(db, update_plugin_query, {
                     'config_fields': json.dumps(user_data['user_config']),
                     'plugin_id': plugin_id,
                     'user_id': user_id
@@ -753,7 +1198,7 @@ class OpenAILifecycleManager(BaseLifecycleManager):
                     WHERE id = :module_id AND user_id = :user_id
                     """)
 
-                    await db.execute(update_module_query, {
+                    await self._execute(db, update_module_query, {
                         'config_fields': json.dumps(module_config),
                         'module_id': module_id,
                         'user_id': user_id
@@ -784,27 +1229,460 @@ class OpenAILifecycleManager(BaseLifecycleManager):
         """Compatibility property for remote installer"""
         return self.plugin_data
 
+    @traced("lifecycle.publish", "delta")
+    async def publish_shared_version(self, user_id: str = None, activate: bool = True,
+                                     delta: bool = True) -> Dict[str, Any]:
+        """
+        Build this version into a staging directory, validate it there and
+        atomically switch the shared version path (and `active`) to it.
+        Readers of the shared path never observe a partially copied tree.
+
+        With delta=True and an existing build to start from, unchanged files
+        are hard-linked from that build and only changed files are written.
+        """
+        if self._publish_lock is None:
+            self._publish_lock = asyncio.Lock()
+
+        async with self._publish_lock:
+            fs = self.fs
+            store = self.version_store
+            version_name = self.shared_path.name
+            self.tracer.current_span().set_attribute('version', version_name)
+            staging = await fs.run(store.create_staging, version_name)
+            try:
+                import version_delta
+                base_build = None
+                if delta:
+                    base_build = (await fs.run(store.resolve, version_name) or
+                                  await fs.run(store.active_build))
+
+                delta_report = None
+                if base_build is not None:
+                    with self.tracer.span("files.delta", base=base_build.name) as delta_span:
+                        source_files = await fs.run(self._list_source_files)
+                        delta_report = await fs.run(version_delta.build_delta, base_build, source_files, staging)
+                        delta_span.set_attributes({'files': delta_report['unchanged'] + len(delta_report['added']) +
+                                                            len(delta_report['changed']),
+                                                   'linked_files': delta_report['linked_files'],
+                                                   'bytes': delta_report['bytes_written']})
+                else:
+                    copy_result = await self._copy_plugin_files_impl(user_id, staging)
+                    if not copy_result['success']:
+                        await fs.run(store.discard_staging, staging)
+                        return copy_result
+                    # Record file hashes so the next version can be built as a delta
+                    with self.tracer.span("files.manifest"):
+                        await fs.run(version_delta.write_directory_manifest, staging)
+
+                with self.tracer.span("validate"):
+                    validation = await self._validate_installation_impl(user_id, staging)
+                if not validation['valid']:
+                    await fs.run(store.discard_staging, staging)
+                    return {'success': False, 'error': validation['error']}
+
+                # Precompress dist/ and write the asset manifest before the build goes live
+                from bundle_artifacts import build_bundle_artifacts
+                with self.tracer.span("bundle.artifacts"):
+                    artifacts = await fs.run(build_bundle_artifacts, staging)
+                if not artifacts['success']:
+                    await fs.run(store.discard_staging, staging)
+                    return artifacts
+
+                with self.tracer.span("version.commit", activate=activate):
+                    result = await fs.run(store.commit, staging, version_name, activate=activate)
+                result['artifacts'] = artifacts
+                if delta_report is not None:
+                    result['delta'] = delta_report
+                return result
+
+            except Exception as e:
+                await fs.run(store.discard_staging, staging)
+                logger.error(f"OpenAIPlugin: Failed to publish {version_name}: {e}")
+                return {'success': False, 'error': str(e)}
+
+    async def diff_versions(self, old: str, new: str) -> Dict[str, Any]:
+        """
+        Manifest diff between two versions. Each side may be a version or
+        pointer name (e.g. 'v1.0.0', 'active'), a build directory or a
+        release archive.
+        """
+        from version_delta import diff_versions
+
+        def locate(name: str) -> Path:
+            return self.version_store.resolve(name) or Path(name)
+
+        try:
+            old_path = await self.fs.run(locate, old)
+            new_path = await self.fs.run(locate, new)
+            return {'success': True, **await self.fs.run(diff_versions, old_path, new_path)}
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to diff {old} and {new}: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def package_release(self, output_dir: str = None, force: bool = False,
+                              workers: int = None) -> Dict[str, Any]:
+        """
+        Build the reproducible release archive of this version from the
+        source directory (see release_packager.py); skipped when nothing
+        that goes into it changed since the last run.
+        """
+        from release_packager import ReleasePackager
+        try:
+            packager = ReleasePackager(Path(output_dir) if output_dir else self.source_dir / "releases",
+                                       workers=workers)
+            source_files = await self.fs.run(self._list_release_files)
+            with self.tracer.span("release.package", version=self.plugin_data['version']) as span:
+                result = await self.fs.run(packager.package, self.plugin_data['name'],
+                                           self.plugin_data['version'], source_files, force)
+                span.set_attributes({'files': result['files'], 'skipped': result['skipped']})
+            return result
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Release packaging failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    @traced("integrity.verify", "version_name")
+    async def verify_integrity(self, version_name: str = None) -> Dict[str, Any]:
+        """
+        Check a published version (default: the one this manager serves)
+        against the hash manifest written at publish time. Only files whose
+        size, mtime or inode changed since the last verification are re-hashed.
+        """
+        from integrity import IntegrityVerifier
+        try:
+            build = await self.fs.run(self.version_store.resolve, version_name or self.shared_path.name)
+            if build is None:
+                return {'success': False, 'ok': False,
+                        'error': f'OpenAIPlugin: Version {version_name or self.shared_path.name} is not published'}
+            verifier = IntegrityVerifier(self.data_path / "integrity")
+            report = await self.fs.run(verifier.verify, build)
+            self.tracer.current_span().set_attributes({'ok': report['ok'], 'files': report.get('files'),
+                                 'rehashed': report.get('rehashed')})
+            return report
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Integrity verification failed: {e}")
+            return {'success': False, 'ok': False, 'error': str(e)}
+
+    async def activate_version(self, version_name: str = None) -> Dict[str, Any]:
+        """Point the `active` pointer at an already published version"""
+        return await self.fs.run(self.version_store.activate, version_name or self.shared_path.name)
+
+    async def rollback_version(self) -> Dict[str, Any]:
+        """Re-activate the previously active build"""
+        return await self.fs.run(self.version_store.rollback)
+
+    async def collect_unused_versions(self, db: AsyncSession, dry_run: bool = False,
+                                      background: bool = False, bytes_per_second: int = None,
+                                      session_factory=None) -> Dict[str, Any]:
+        """
+        Delete shared versions and builds no user references.
+        With background=True the deletion runs as a task on its own session
+        from `session_factory` and this returns the plan made on `db`.
+        """
+        from version_gc import DEFAULT_BYTES_PER_SECOND
+
+        collector = self.version_gc
+        try:
+            if background:
+                if session_factory is None:
+                    return {'success': False,
+                            'error': 'OpenAIPlugin: Background collection needs a session_factory'}
+                if collector.running:
+                    return {'success': True, 'scheduled': False, 'running': True}
+                collector.bytes_per_second = DEFAULT_BYTES_PER_SECOND if bytes_per_second is None else bytes_per_second
+                plan = await collector.plan(db)
+                collector.collect_in_background(session_factory, dry_run=dry_run)
+                return {'success': True, 'scheduled': True, **plan}
+            if collector.running:
+                return {'success': False, 'error': 'OpenAIPlugin: A version collection is already running'}
+            collector.bytes_per_second = DEFAULT_BYTES_PER_SECOND if bytes_per_second is None else bytes_per_second
+            return {'success': True, **await collector.collect(db, dry_run=dry_run)}
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Version garbage collection failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def configure_lazy_install(self, tenant_resolver=None, cache_ttl: float = None) -> 'LazyInstaller':
+        """
+        Turn on lazy installation: users of an enabled tenant get their rows
+        on first lookup. tenant_resolver maps user id -> tenant id (default:
+        one tenant for everyone). Call at startup in every process.
+        """
+        from lazy_install import LazyInstaller, DEFAULT_CACHE_TTL
+        self._lazy_installer = LazyInstaller(
+            self, tenant_resolver, DEFAULT_CACHE_TTL if cache_ttl is None else cache_ttl)
+        return self._lazy_installer
+
+    async def enable_for_tenant(self, db: AsyncSession, tenant_id: str = None) -> Dict[str, Any]:
+        """Enable the plugin for a whole tenant in O(1); rows appear on first use"""
+        from lazy_install import DEFAULT_TENANT
+        if self._lazy_installer is None:
+            self.configure_lazy_install()
+        try:
+            return await self._lazy_installer.enable_tenant(db, tenant_id or DEFAULT_TENANT)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to enable tenant {tenant_id}: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def disable_for_tenant(self, db: AsyncSession, tenant_id: str = None) -> Dict[str, Any]:
+        from lazy_install import DEFAULT_TENANT
+        if self._lazy_installer is None:
+            self.configure_lazy_install()
+        try:
+            return await self._lazy_installer.disable_tenant(db, tenant_id or DEFAULT_TENANT)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to disable tenant {tenant_id}: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def get_user_modules(self, user_id: str, db: AsyncSession) -> list:
+        """
+        A user's modules as full definitions. Template-mode rows are merged
+        with their shared definition; inline rows are returned as stored.
+        """
+        try:
+            plugin_id = f"{user_id}_{self.plugin_data['plugin_slug']}"
+            modules = await self.module_templates.get_user_modules(db, plugin_id, user_id)
+            if not modules and self._lazy_installer is not None:
+                materialized = await self._lazy_installer.materialize(db, user_id)
+                if materialized['exists']:
+                    modules = await self.module_templates.get_user_modules(db, plugin_id, user_id)
+            return modules
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Error reading modules for {user_id}: {e}")
+            return []
+
+    async def export_all_configs(self, db: AsyncSession, path: str, chunk_size: int = 1000) -> Dict[str, Any]:
+        """Stream every user's plugin/module config_fields to a gzip JSONL file"""
+        from config_export import export_configs
+        try:
+            return await export_configs(db, Path(path), self.plugin_data['plugin_slug'], chunk_size=chunk_size)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Config export failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def import_all_configs(self, db: AsyncSession, path: str, batch_size: int = 1000) -> Dict[str, Any]:
+        """Re-import an export_all_configs file with batched writes"""
+        from config_export import import_configs
+        return await import_configs(
+            db, Path(path), self.plugin_data['plugin_slug'],
+            batch_size=batch_size,
+            commit=id(db) not in self._unit_of_work_sessions
+        )
+
+    async def check_for_updates(self, db: AsyncSession, force: bool = False) -> Dict[str, Any]:
+        """Check the release endpoint once and flag every user's row of this plugin"""
+        try:
+            return await self.update_checker.check_plugin(
+                db,
+                self.plugin_data['plugin_slug'],
+                self.plugin_data['update_check_url'],
+                force=force,
+                commit=id(db) not in self._unit_of_work_sessions
+            )
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Update check failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def save_active_users(self, path: str = None) -> Dict[str, Any]:
+        """
+        Snapshot active_users to a file that other worker processes can
+        memory-map with load_active_users (default: data_path/active-users.bin)
+        """
+        try:
+            path = Path(path) if path else self.data_path / "active-users.bin"
+            users = self.active_users
+            # Only the file write runs on the executor; the set keeps taking
+            # changes on the loop and finish_save() carries them over
+            job = users.prepare_save(path)
+            try:
+                await self.fs.run(job.write)
+            except BaseException:
+                users.cancel_save()
+                raise
+            return users.finish_save(job)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to save active users: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def load_active_users(self, path: str = None) -> Dict[str, Any]:
+        """
+        Share the active-user snapshot read-only through a memory map. Users
+        active in this process but missing from the snapshot are kept.
+        """
+        from user_set import CompactUserSet, Snapshot
+        try:
+            path = Path(path) if path else self.data_path / "active-users.bin"
+            if self.active_users.path == path:
+                snapshot = await self.fs.run(Snapshot.open, path, self.active_users.snapshot_key)
+                self.active_users.attach(snapshot)
+            else:
+                snapshot = await self.fs.run(Snapshot.open, path)
+                shared = CompactUserSet.open(path, snapshot=snapshot)
+                for user_id in self.active_users:
+                    shared.add(user_id)
+                self.active_users = shared
+            return {'success': True, 'path': str(path), 'users': len(self.active_users),
+                    **self.active_users.memory_usage()}
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Failed to load active users: {e}")
+            return {'success': False, 'error': str(e)}
+
+    async def reconcile(self, db: AsyncSession) -> Dict[str, Any]:
+        """Run one bounded reconciliation cycle (see reconciler.py)"""
+        try:
+            return await self.reconciler.run_cycle(db)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Reconcile cycle failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def start_reconciler(self, session_factory, interval: float = None) -> Dict[str, Any]:
+        """Reconcile continuously in the background, one session per cycle"""
+        from reconciler import DEFAULT_INTERVAL
+        self.reconciler.start(session_factory, DEFAULT_INTERVAL if interval is None else interval)
+        return {'success': True, **self.reconciler.get_stats()}
+
+    async def stop_reconciler(self):
+        if self._reconciler is not None:
+            await self._reconciler.stop()
+
+    async def warm_start(self, session_factory=None, budget: float = None, background: bool = False,
+                         watch: bool = True, preload_bundle: bool = True, verify: bool = True) -> Dict[str, Any]:
+        """
+        Pay cold-start costs at plugin load instead of on the first requests
+        after a restart: installed users are loaded into active_users with
+        one query, the shared version is validated and health-probed once
+        (kept cached by the file watcher) and checked against its hash
+        manifest (verify), module definitions are fetched and the active
+        bundle's manifest and bytes are loaded into the bundle server.
+
+        background=True returns at once; budget=N waits at most N seconds and
+        leaves the rest running. The final report is kept in warmup_report.
+        """
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.ensure_future(
+                self._warm_start(session_factory, watch, preload_bundle, verify))
+        task = self._warmup_task
+        if not background:
+            done, _ = await asyncio.wait({task}, timeout=budget)
+            if task in done:
+                return task.result()
+        report = self.warmup_report or {}
+        return {**report, 'steps': dict(report.get('steps', {})), 'complete': False, 'background': True}
+
+    async def _warm_start(self, session_factory, watch: bool, preload_bundle: bool,
+                          verify: bool = True) -> Dict[str, Any]:
+        report = self.warmup_report = {'success': True, 'complete': False, 'steps': {}, 'errors': {}}
+        started = time.perf_counter()
+        plugin_dir = self.shared_path.parent / f"v{self.plugin_data['version']}"
+
+        async def step(name, action):
+            step_started = time.perf_counter()
+            with self.tracer.span(f"warmup.{name}") as span:
+                try:
+                    report[name] = await action()
+                except Exception as e:
+                    span.record_exception(e)
+                    report['errors'][name] = str(e)
+                    logger.warning(f"OpenAIPlugin: Warmup step {name} failed: {e}")
+            report['steps'][name] = round((time.perf_counter() - step_started) * 1000, 2)
+
+        with self.tracer.span("lifecycle.warmup"):
+            if session_factory is not None:
+                await step('users', lambda: self._warm_active_users(session_factory))
+            if watch:
+                await step('watcher', self.start_file_watcher)
+
+            async def probe():
+                validation = await self._validate_installation_impl(None, plugin_dir)
+                health = await self._get_plugin_health_impl(None, plugin_dir)
+                return {'valid': validation['valid'], 'healthy': health['healthy']}
+            await step('validation', probe)
+
+            if verify:
+                async def integrity():
+                    result = await self.verify_integrity()
+                    if not result['ok']:
+                        raise RuntimeError(result.get('error') or
+                                           f"{len(result['modified'])} modified, {len(result['missing'])} missing, "
+                                           f"{len(result['extra'])} unexpected files")
+                    return {'files': result['files'], 'rehashed': result['rehashed']}
+                await step('integrity', integrity)
+
+            if session_factory is not None and self.module_storage == "template":
+                await step('definitions', lambda: self._warm_module_definitions(session_factory))
+            if preload_bundle:
+                await step('bundle', lambda: self.fs.run(self.bundle_server.preload))
+
+        report['success'] = not report['errors']
+        report['complete'] = True
+        report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"OpenAIPlugin: Warm start finished in {report['duration_ms']} ms "
+                    f"({', '.join(f'{name} {ms} ms' for name, ms in report['steps'].items())})")
+        return report
+
+    async def _warm_active_users(self, session_factory, chunk_size: int = 10000) -> int:
+        """
+        Load installed users into active_users. A shared snapshot (see
+        save_active_users) is preferred over the query; otherwise user ids
+        are streamed straight into a compact set, never held as a list.
+        """
+        from tracing import SPAN_KIND_CLIENT, statement_attributes
+        from user_set import CompactUserSetBuilder
+        snapshot_path = self.active_users.path if self.active_users.shared else self.data_path / "active-users.bin"
+        if await self.fs.exists(snapshot_path):
+            loaded = await self.load_active_users(str(snapshot_path))
+            if loaded['success']:
+                return loaded['users']
+
+        builder = CompactUserSetBuilder()
+        async with session_factory() as db:
+            query = text("""
+            SELECT user_id FROM plugin
+            WHERE plugin_slug = :plugin_slug
+            ORDER BY user_id
+            """).execution_options(yield_per=chunk_size)
+            with self.tracer.span("db.statement", kind=SPAN_KIND_CLIENT) as span:
+                if span.recording:
+                    span.set_attributes(statement_attributes(query))
+                result = await db.stream(query, {'plugin_slug': self.plugin_data['plugin_slug']})
+                async for partition in result.partitions(chunk_size):
+                    builder.extend(row.user_id for row in partition)
+        users = builder.build()
+        # Keep users registered while the query ran; rows deleted meanwhile are left to the reconciler
+        for user_id in self.active_users:
+            users.add(user_id)
+        self.active_users = users
+        return len(users)
+
+    async def _warm_module_definitions(self, session_factory) -> int:
+        from module_templates import definition_id
+        store = self.module_templates
+        ids = [definition_id(self.plugin_data['plugin_slug'], self.plugin_data['version'], module)
+               for module in self.module_data]
+        async with session_factory() as db:
+            definitions = await store.load_definitions(db, ids)
+        # Definitions already in the table need not be re-written by the first installs
+        store.confirm(definitions)
+        return len(definitions)
+
     # Compatibility methods for old interface (for testing)
+    @traced("lifecycle.install", "user_id")
     async def install_plugin(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Install OpenAIPlugin plugin for specific user (compatibility method)"""
         try:
-            # For testing, we'll use a mock shared path
-            shared_path = self.shared_path
-            shared_path.mkdir(parents=True, exist_ok=True)
-
-            # Copy files to shared path for testing
-            copy_result = await self._copy_plugin_files_impl(user_id, shared_path)
-            if not copy_result['success']:
-                return copy_result
+            # Publish the shared version once; later installs reuse the active build
+            if await self.fs.run(self.version_store.resolve, self.shared_path.name) is None:
+                publish_result = await self.publish_shared_version(user_id)
+                if not publish_result['success']:
+                    return publish_result
 
             # Use the new architecture method
-            result = await self.install_for_user(user_id, db, shared_path)
+            result = await self.install_for_user(user_id, db, self.shared_path)
             return result
 
         except Exception as e:
             logger.error(f"Plugin installation failed for user {user_id}: {e}")
             return {'success': False, 'error': str(e)}
 
+    @traced("lifecycle.delete", "user_id")
     async def delete_plugin(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Delete OpenAIPlugin plugin for user (compatibility method)"""
         try:
@@ -816,36 +1694,65 @@ class OpenAILifecycleManager(BaseLifecycleManager):
             logger.error(f"Plugin deletion failed for user {user_id}: {e}")
             return {'success': False, 'error': str(e)}
 
+    @traced("lifecycle.status", "user_id")
     async def get_plugin_status(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Get current status of OpenAIPlugin plugin installation (compatibility method)"""
         try:
             existing_check = await self._check_existing_plugin(user_id, db)
+            if not existing_check['exists'] and self._lazy_installer is not None:
+                # Lazy mode: first lookup of a user in an enabled tenant installs them
+                materialized = await self._lazy_installer.materialize(db, user_id)
+                if materialized['exists']:
+                    existing_check = await self._check_existing_plugin(user_id, db)
             if not existing_check['exists']:
                 return {'exists': False, 'status': 'not_installed'}
 
             plugin_id = existing_check['plugin_id']
+            plugin_info = existing_check['plugin_info']
 
-            # Check if user is in active users
-            is_active = user_id in self.active_users
+            # The row is authoritative; memory may not know the user yet (e.g. after a restart)
+            if user_id not in self.active_users:
+                self.active_users.add(user_id)
 
-            return {
+            # Validate the shared files of the version this user is on
+            plugin_dir = self.shared_path.parent / f"v{plugin_info['version'] or self.plugin_data['version']}"
+            validation = await self._validate_installation_impl(user_id, plugin_dir)
+
+            status = {
                 'exists': True,
-                'status': 'healthy' if is_active else 'inactive',
+                'status': 'healthy' if validation['valid'] else 'unhealthy',
                 'plugin_id': plugin_id,
-                'plugin_info': existing_check['plugin_info'],
-                'files_exist': True,  # Assume files exist in shared storage
-                'plugin_directory': str(self.shared_path)
+                'plugin_info': plugin_info,
+                'files_exist': validation['valid'],
+                'plugin_directory': str(plugin_dir)
             }
+            if not validation['valid']:
+                status['error'] = validation.get('error')
+            self.tracer.current_span().set_attribute('status', status['status'])
+            return status
 
         except Exception as e:
+            self.tracer.current_span().record_exception(e)
             logger.error(f"Error checking plugin status for user {user_id}: {e}")
             return {'exists': False, 'status': 'error', 'error': str(e)}
 
+    @traced("lifecycle.update", "user_id")
     async def update_plugin(self, user_id: str, db: AsyncSession, new_version_manager: 'OpenAILifecycleManager') -> Dict[str, Any]:
         """Update OpenAIPlugin plugin for user (compatibility method)"""
         try:
+            # The target version's files must be published before users move to it
+            target = new_version_manager
+            if await target.fs.run(target.version_store.resolve, target.shared_path.name) is None:
+                publish_result = await target.publish_shared_version(user_id)
+                if not publish_result['success']:
+                    return publish_result
+
             # Use the new architecture method
-            result = await self.update_for_user(user_id, db, new_version_manager)
+            self._updating_users.add(user_id)
+            try:
+                result = await self.update_for_user(user_id, db, new_version_manager)
+            finally:
+                self._updating_users.discard(user_id)
             return result
 
         except Exception as e:
@@ -878,24 +1785,115 @@ async def update_plugin(user_id: str, db: AsyncSession, new_version_manager: 'Op
 if __name__ == "__main__":
     import sys
     import asyncio
+    import argparse
 
     async def main():
-        if len(sys.argv) < 3:
-            print("Usage: python lifecycle_manager.py <operation> <user_id>")
-            print("Operations: install, delete, status")
-            sys.exit(1)
-
-        operation = sys.argv[1]
-        user_id = sys.argv[2]
-
-        manager = OpenAILifecycleManager()
-
-        print(f"OpenAIPlugin Plugin Lifecycle Manager (New Architecture)")
-        print(f"Operation: {operation}")
-        print(f"User ID: {user_id}")
-        print(f"Plugin: {manager.plugin_data['name']} v{manager.plugin_data['version']}")
-        print(f"Plugin Slug: {manager.plugin_data['plugin_slug']}")
-        print("\nNote: This script requires database connection for actual operations.")
-        print("Use the new Plugin Lifecycle Service for full functionality.")
+        from batch_runner import (
+            BatchRunner, OPERATIONS, DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY,
+            create_session_factory, iter_user_ids
+        )
+
+        parser = argparse.ArgumentParser(
+            description="OpenAIPlugin Plugin Lifecycle Manager (New Architecture)")
+        parser.add_argument("operation", choices=OPERATIONS)
+        parser.add_argument("user_id", nargs="?",
+                            help="single user ID (omit when using --users-file)")
+        parser.add_argument("--users-file",
+                            help="file with one user ID per line, or '-' to read stdin")
+        parser.add_argument("--db-url", default=os.environ.get("BRAINDRIVE_DATABASE_URL"),
+                            help="SQLAlchemy async database URL (default: $BRAINDRIVE_DATABASE_URL)")
+        parser.add_argument("--plugins-dir", default=None,
+                            help="plugins base directory (default: the BrainDrive backend plugins dir)")
+        parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--commit-every", type=int, default=0,
+                            help="install/delete: commit once per N users instead of per user")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="worker processes; users are sharded across them by ID")
+        parser.add_argument("--target-source-dir", default=None,
+                            help="update: plugin checkout of the version to move users to")
+        parser.add_argument("--target-version", default=None,
+                            help="update: version to move users to (default: this plugin's version)")
+        parser.add_argument("--output", default="-",
+                            help="JSONL results file, or '-' for stdout")
+        parser.add_argument("--trace-file", default=None,
+                            help="append OTLP/JSON trace spans to this file")
+        parser.add_argument("--trace-sample", type=float, default=1.0,
+                            help="fraction of operations to trace (with --trace-file)")
+        parser.add_argument("--quiet", action="store_true", help="no progress output on stderr")
+        args = parser.parse_args()
+
+        if bool(args.user_id) == bool(args.users_file):
+            parser.error("give either a user_id or --users-file")
+        if not args.db_url:
+            parser.error("--db-url (or BRAINDRIVE_DATABASE_URL) is required")
+        if (args.operation == "update") != bool(args.target_source_dir or args.target_version):
+            parser.error("--target-source-dir/--target-version are required for update, and only for update")
+
+        if args.trace_file:
+            from tracing import FileSpanExporter, configure_tracing, instrument_engine
+            # Exported through the environment too, so sharded worker processes trace the same way
+            os.environ["OPENAIPLUGIN_TRACE_FILE"] = args.trace_file
+            os.environ["OTEL_TRACES_SAMPLER_ARG"] = str(args.trace_sample)
+            configure_tracing(FileSpanExporter(Path(args.trace_file)), args.trace_sample)
+
+        manager = OpenAILifecycleManager(args.plugins_dir)
+        target_manager = None
+        if args.operation == "update":
+            target_manager = OpenAILifecycleManager(args.plugins_dir, source_dir=args.target_source_dir,
+                                                    version=args.target_version)
+        engine, session_factory = create_session_factory(args.db_url, pool_size=args.concurrency)
+        if args.trace_file:
+            instrument_engine(engine, manager.tracer)
+
+        users_stream = None
+        output = sys.stdout
+        try:
+            if args.users_file == "-":
+                user_ids = iter_user_ids(sys.stdin)
+            elif args.users_file:
+                users_stream = open(args.users_file, "r")
+                user_ids = iter_user_ids(users_stream)
+            else:
+                user_ids = [args.user_id]
+            if args.output != "-":
+                output = open(args.output, "w")
+
+            if args.workers > 1:
+                from sharded_runner import ShardedRunner
+                runner = ShardedRunner(
+                    args.operation, workers=args.workers,
+                    db_url=args.db_url,
+                    plugins_dir=args.plugins_dir,
+                    concurrency=args.concurrency,
+                    batch_size=args.batch_size,
+                    commit_every=args.commit_every,
+                    target_source_dir=args.target_source_dir,
+                    target_version=args.target_version,
+                    output=output,
+                    progress=None if args.quiet else sys.stderr
+                )
+            else:
+                runner = BatchRunner(
+                    manager, session_factory, args.operation,
+                    concurrency=args.concurrency,
+                    batch_size=args.batch_size,
+                    commit_every=args.commit_every,
+                    target_manager=target_manager,
+                    output=output,
+                    progress=None if args.quiet else sys.stderr
+                )
+            summary = await runner.run(user_ids)
+        finally:
+            if users_stream is not None:
+                users_stream.close()
+            if output is not sys.stdout:
+                output.close()
+            await engine.dispose()
+            manager.tracer.flush()
+
+        if not args.quiet:
+            print(json.dumps(summary), file=sys.stderr)
+        sys.exit(0 if summary['failed'] == 0 else 1)
 
     asyncio.run(main())
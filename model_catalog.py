@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Model Catalog Cache
+
+Server-side cache for the OpenAI `/v1/models` list shared by the chat and
+status modules. Entries are keyed by an API key fingerprint (the raw key is
+never stored), served with stale-while-revalidate semantics and revalidated
+upstream with ETag/If-None-Match when the API provides one.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+OPENAI_MODELS_URL = "https://api.openai.com/v1/models"
+
+# Same filter ComponentOpenAIChat applies client-side to the raw model list
+CHAT_MODEL_MARKERS = ("gpt", "o1", "o3")
+
+# (status, headers, body)
+FetchResult = Tuple[int, Dict[str, str], bytes]
+Fetcher = Callable[[str, Dict[str, str]], Awaitable[FetchResult]]
+
+
+async def urllib_fetcher(url: str, headers: Dict[str, str], timeout: float = 10.0) -> FetchResult:
+    """Default fetcher: blocking urllib GET run in the default executor"""
+
+    def _get() -> FetchResult:
+        request = urllib.request.Request(url, headers=headers, method="GET")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, dict(response.headers.items()), response.read()
+        except urllib.error.HTTPError as e:
+            # 304 and 4xx/5xx arrive as HTTPError; surface them as plain results
+            return e.code, dict(e.headers.items()) if e.headers else {}, e.read() or b""
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, _get)
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Return a stable, non-reversible cache key for an API key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+
+
+def filter_chat_models(model_ids: List[str]) -> List[Dict[str, str]]:
+    """Build the compact, sorted chat-model list used by ComponentOpenAIChat"""
+    chat_ids = sorted(
+        model_id for model_id in model_ids
+        if any(marker in model_id for marker in CHAT_MODEL_MARKERS)
+    )
+    return [{"value": model_id, "label": model_id} for model_id in chat_ids]
+
+
+class ModelCatalogCache:
+    """Per-API-key cache of the OpenAI model list with conditional revalidation"""
+
+    def __init__(self,
+                 fetcher: Optional[Fetcher] = None,
+                 fresh_ttl: float = 300.0,
+                 stale_ttl: float = 3600.0,
+                 max_entries: int = 256,
+                 models_url: str = OPENAI_MODELS_URL,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            fetcher: async callable (url, headers) -> (status, headers, body)
+            fresh_ttl: seconds an entry is served without revalidation
+            stale_ttl: seconds past freshness an entry may still be served
+                while a background revalidation runs
+            max_entries: number of API key fingerprints kept (LRU)
+        """
+        self.fetcher = fetcher or urllib_fetcher
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.models_url = models_url
+        self.clock = clock
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'revalidations': 0,
+            'not_modified': 0,
+            'upstream_errors': 0,
+            'bytes_fetched': 0
+        }
+
+    async def get_models(self, api_key: str) -> Dict[str, Any]:
+        """
+        Return the cached model catalog for an API key.
+
+        Result keys: success, status ('online', 'invalid_key', 'offline'),
+        model_ids, chat_models, cache ('hit', 'stale', 'miss', 'revalidated').
+        """
+        if not api_key:
+            return {'success': False, 'status': 'invalid_key', 'error': 'API key is required'}
+
+        key = api_key_fingerprint(api_key)
+        entry = self._entries.get(key)
+        now = self.clock()
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+            age = now - entry['fetched_at']
+            if age <= self.fresh_ttl:
+                self.stats['hits'] += 1
+                return self._result(entry, 'hit')
+            if age <= self.fresh_ttl + self.stale_ttl:
+                self.stats['stale_hits'] += 1
+                self._schedule_revalidation(key, api_key)
+                return self._result(entry, 'stale')
+
+        self.stats['misses'] += 1
+        return await self._refresh(key, api_key)
+
+    async def get_chat_models(self, api_key: str) -> List[Dict[str, str]]:
+        """Return only the compact chat-model list, or [] if unavailable"""
+        result = await self.get_models(api_key)
+        return result.get('chat_models', []) if result['success'] else []
+
+    async def get_api_status(self, api_key: str) -> Dict[str, Any]:
+        """Status-module view of the catalog: online / invalid_key / offline"""
+        result = await self.get_models(api_key)
+        return {'status': result['status'], 'error': result.get('error')}
+
+    def invalidate(self, api_key: str) -> bool:
+        """Drop the cached catalog for an API key"""
+        return self._entries.pop(api_key_fingerprint(api_key), None) is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache counters and current size"""
+        lookups = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self._entries),
+            'hit_rate': (self.stats['hits'] + self.stats['stale_hits']) / lookups if lookups else 0.0
+        }
+
+    def _result(self, entry: Dict[str, Any], cache_state: str) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'status': 'online',
+            'model_ids': entry['model_ids'],
+            'chat_models': entry['chat_models'],
+            'cache': cache_state
+        }
+
+    def _schedule_revalidation(self, key: str, api_key: str):
+        """Start one background revalidation per fingerprint"""
+        task = self._background.get(key)
+        if task is not None and not task.done():
+            return
+        self._background[key] = asyncio.ensure_future(self._refresh(key, api_key))
+
+    async def _refresh(self, key: str, api_key: str) -> Dict[str, Any]:
+        """Fetch upstream, coalescing concurrent refreshes for the same key"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch(key, api_key)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            # Nobody else may await the future; mark any exception as retrieved
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    async def _fetch(self, key: str, api_key: str) -> Dict[str, Any]:
+        entry = self._entries.get(key)
+        headers = {'Authorization': f'Bearer {api_key}'}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            self.stats['revalidations'] += 1
+
+        try:
+            status, response_headers, body = await self.fetcher(self.models_url, headers)
+        except Exception as e:
+            self.stats['upstream_errors'] += 1
+            logger.warning(f"OpenAIPlugin: Model catalog fetch failed: {e}")
+            if entry is not None:
+                return self._result(entry, 'stale')
+            return {'success': False, 'status': 'offline', 'error': 'Network error'}
+
+        response_headers = {k.lower(): v for k, v in response_headers.items()}
+
+        if status == 304 and entry is not None:
+            self.stats['not_modified'] += 1
+            entry['fetched_at'] = self.clock()
+            return self._result(entry, 'revalidated')
+
+        if status == 401:
+            self._entries.pop(key, None)
+            return {'success': False, 'status': 'invalid_key', 'error': 'Invalid API Key'}
+
+        if status != 200:
+            self.stats['upstream_errors'] += 1
+            if entry is not None:
+                return self._result(entry, 'stale')
+            return {'success': False, 'status': 'offline', 'error': f'Error: {status}'}
+
+        self.stats['bytes_fetched'] += len(body)
+        try:
+            payload = json.loads(body)
+            model_ids = [model['id'] for model in payload.get('data', []) if 'id' in model]
+        except (json.JSONDecodeError, TypeError, AttributeError) as e:
+            self.stats['upstream_errors'] += 1
+            logger.warning(f"OpenAIPlugin: Invalid model catalog payload: {e}")
+            if entry is not None:
+                return self._result(entry, 'stale')
+            return {'success': False, 'status': 'offline', 'error': 'Invalid response from OpenAI'}
+
+        # Keep only the compact form; the raw payload is discarded after parsing
+        entry = {
+            'model_ids': model_ids,
+            'chat_models': filter_chat_models(model_ids),
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified'),
+            'fetched_at': self.clock()
+        }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return self._result(entry, 'miss')
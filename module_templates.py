@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Module Templates
+
+Optional storage mode for module rows. By default ("inline") every user's
+`module` row carries a full copy of the static module definition
+(description, props, config_fields, required_services, layout, tags...).
+In "template" mode the static part is written once per plugin version to a
+shared `module_definition` record, and per-user rows keep only their small
+scalar columns, user-specific overrides (config_fields) and a
+`definition_id` reference. Reads merge the two, with definitions cached in
+memory: they are immutable, because their ids include a content hash.
+
+Template mode needs the `module_definition` table (created on demand by
+`ensure_definition_table`) and a nullable `module.definition_id` column,
+which the host schema must provide (see MODULE_DEFINITION_COLUMN_DDL).
+"""
+
+import datetime
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import structlog
+from sqlalchemy import bindparam, text
+
+logger = structlog.get_logger()
+
+MODULE_STORAGE_INLINE = "inline"
+MODULE_STORAGE_TEMPLATE = "template"
+MODULE_STORAGE_MODES = (MODULE_STORAGE_INLINE, MODULE_STORAGE_TEMPLATE)
+
+# Columns of a module row that come from the static definition
+DEFINITION_FIELDS = (
+    'display_name', 'description', 'icon', 'category', 'priority', 'props', 'config_fields',
+    'messages', 'required_services', 'dependencies', 'layout', 'tags'
+)
+JSON_FIELDS = ('props', 'config_fields', 'messages', 'required_services', 'dependencies', 'layout', 'tags')
+
+MODULE_DEFINITION_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS module_definition (
+    id VARCHAR PRIMARY KEY,
+    plugin_slug VARCHAR NOT NULL,
+    name VARCHAR NOT NULL,
+    version VARCHAR NOT NULL,
+    definition TEXT NOT NULL,
+    created_at VARCHAR
+)
+"""
+MODULE_DEFINITION_COLUMN_DDL = "ALTER TABLE module ADD COLUMN definition_id VARCHAR"
+
+
+def definition_payload(module_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: module_data.get(field) for field in DEFINITION_FIELDS}
+
+
+def definition_id(plugin_slug: str, version: str, module_data: Dict[str, Any]) -> str:
+    """Versioned, content-addressed id: a changed definition never reuses an id"""
+    canonical = json.dumps(definition_payload(module_data), sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+    return f"{plugin_slug}_{module_data['name']}_{version}_{digest}"
+
+
+def _merge(base: Any, override: Any) -> Any:
+    """Recursive dict merge; non-dict overrides replace the base value"""
+    if isinstance(base, dict) and isinstance(override, dict):
+        merged = dict(base)
+        for key, value in override.items():
+            merged[key] = _merge(base.get(key), value)
+        return merged
+    return override
+
+
+def _row_dict(row: Any) -> Dict[str, Any]:
+    mapping = getattr(row, '_mapping', None)
+    return dict(mapping) if mapping is not None else dict(vars(row))
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+def merge_module(definition: Optional[Dict[str, Any]], row: Dict[str, Any]) -> Dict[str, Any]:
+    """Full module view from a shared definition plus a per-user row"""
+    module = {key: (_decode(value) if key in JSON_FIELDS else value) for key, value in row.items()}
+    if not definition:
+        return module
+    for field in DEFINITION_FIELDS:
+        base = definition.get(field)
+        override = module.get(field)
+        if override is None:
+            module[field] = base
+        elif field == 'config_fields':
+            module[field] = _merge(base or {}, override)
+    return module
+
+
+class ModuleTemplateStore:
+    """Writes and reads shared module definitions for one plugin version"""
+
+    def __init__(self, plugin_slug: str, version: str):
+        self.plugin_slug = plugin_slug
+        self.version = version
+        # definition_id -> parsed definition; safe to keep forever (content-addressed)
+        self._definitions: Dict[str, Dict[str, Any]] = {}
+        # definitions known to be committed, so installs can skip writing them
+        self._persisted = set()
+        self._table_ready = False
+
+    async def ensure_definition_table(self, db):
+        if not self._table_ready:
+            await db.execute(text(MODULE_DEFINITION_TABLE_DDL))
+            self._table_ready = True
+
+    async def ensure_definitions(self, db, module_data: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Make sure a definition record exists for every module; returns
+        {module name: definition_id}. Once a write is confirmed committed
+        (see confirm), later installs skip it; concurrent writers are
+        absorbed by ON CONFLICT.
+        """
+        ids = {}
+        for module in module_data:
+            module_definition_id = definition_id(self.plugin_slug, self.version, module)
+            ids[module['name']] = module_definition_id
+            if module_definition_id in self._persisted:
+                continue
+
+            await self.ensure_definition_table(db)
+            await db.execute(text("""
+            INSERT INTO module_definition (id, plugin_slug, name, version, definition, created_at)
+            VALUES (:id, :plugin_slug, :name, :version, :definition, :created_at)
+            ON CONFLICT (id) DO NOTHING
+            """), {
+                'id': module_definition_id,
+                'plugin_slug': self.plugin_slug,
+                'name': module['name'],
+                'version': self.version,
+                'definition': json.dumps(definition_payload(module)),
+                'created_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            })
+            self._definitions[module_definition_id] = definition_payload(module)
+        return ids
+
+    def confirm(self, ids: Iterable[str]):
+        """Record that the transaction writing these definitions committed"""
+        self._persisted.update(ids)
+
+    def user_row(self, module_values: Dict[str, Any], module_definition_id: str) -> Dict[str, Any]:
+        """
+        Slim per-user row: keeps identity and small scalar columns, drops the
+        static JSON (served from the definition) and starts with no overrides.
+        """
+        row = dict(module_values)
+        for field in JSON_FIELDS + ('description',):
+            row[field] = None
+        row['config_fields'] = json.dumps({})
+        row['definition_id'] = module_definition_id
+        return row
+
+    async def load_definitions(self, db, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch definitions not cached yet in one query"""
+        ids = list(ids)
+        missing = sorted({i for i in ids if i and i not in self._definitions})
+        if missing:
+            stmt = text("""
+            SELECT id, definition FROM module_definition WHERE id IN :ids
+            """).bindparams(bindparam('ids', expanding=True))
+            for row in (await db.execute(stmt, {'ids': missing})).fetchall():
+                self._definitions[row.id] = json.loads(row.definition)
+        return {i: self._definitions[i] for i in ids if i in self._definitions}
+
+    async def get_user_modules(self, db, plugin_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Merged module views for one user's plugin (works for inline rows too)"""
+        result = await db.execute(text("""
+        SELECT * FROM module
+        WHERE plugin_id = :plugin_id AND user_id = :user_id
+        """), {'plugin_id': plugin_id, 'user_id': user_id})
+        rows = [_row_dict(row) for row in result.fetchall()]
+        definitions = await self.load_definitions(db, [row.get('definition_id') for row in rows])
+        return [merge_module(definitions.get(row.get('definition_id')), row) for row in rows]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Directory Watcher
+
+Watches the shared plugin version path and reports changes the moment they
+happen, so cached validation/health/metadata results can be invalidated
+instead of re-probed on every query. On Linux the kernel's inotify API is
+used directly through ctypes (no extra dependency); elsewhere, or if inotify
+is unavailable, a lightweight stat-signature poller is used instead.
+
+Watched: the plugin root (version pointer swaps), the resolved build
+directory (package.json) and its dist/ directory (bundle).
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+# Paths (relative to the build directory) whose stat feeds the polling signature
+POLLED_PATHS = ("package.json", "dist", "dist/remoteEntry.js", "assets")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class PluginDirectoryWatcher:
+    """inotify watcher with a polling fallback for a shared plugin version path"""
+
+    def __init__(self,
+                 version_path: Path,
+                 on_change: Callable[[str], None],
+                 poll_interval: float = 2.0,
+                 use_inotify: bool = True):
+        """
+        Args:
+            version_path: e.g. shared/OpenAIPlugin/v1.0.0 (may be a symlink)
+            on_change: called with a short reason for every batch of changes;
+                it should be cheap (invalidate, then debounce heavier work)
+            poll_interval: seconds between polls in fallback mode
+        """
+        self.version_path = Path(version_path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+        self.mode: Optional[str] = None
+        self.build_dir: Optional[Path] = None
+        self._libc = None
+        self._fd: Optional[int] = None
+        self._watches: List[int] = []
+        self._poll_task: Optional[asyncio.Task] = None
+        self._signature = None
+        self.events_seen = 0
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None
+
+    def covers(self, path: Path) -> bool:
+        """True if results computed for `path` are kept fresh by this watcher"""
+        if not self.running:
+            return False
+        path = Path(path)
+        return path == self.version_path or (self.build_dir is not None and path.resolve() == self.build_dir)
+
+    async def start(self) -> str:
+        """Start watching; returns 'inotify' or 'polling'"""
+        if self.running:
+            return self.mode
+        self.build_dir = self._resolve_build()
+
+        if self.use_inotify:
+            self._libc = _load_libc()
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                self._add_watches()
+                asyncio.get_event_loop().add_reader(fd, self._read_events)
+                self.mode = 'inotify'
+                logger.info(f"OpenAIPlugin: Watching {self.version_path} with inotify")
+                return self.mode
+
+        self._signature = self._poll_signature()
+        self._poll_task = asyncio.ensure_future(self._poll_loop())
+        self.mode = 'polling'
+        logger.info(f"OpenAIPlugin: Watching {self.version_path} by polling every {self.poll_interval}s")
+        return self.mode
+
+    async def stop(self):
+        if self._fd is not None:
+            asyncio.get_event_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self._watches = []
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+        self.mode = None
+
+    def _resolve_build(self) -> Optional[Path]:
+        try:
+            return self.version_path.resolve(strict=True)
+        except (OSError, RuntimeError):
+            return None
+
+    def _add_watches(self):
+        """(Re)register watches for the plugin root, the build and its dist/"""
+        if self._fd is None:
+            return
+        # Watches on a previous build stay registered until that build is
+        # deleted; their events only cause a harmless extra invalidation.
+        targets = [self.version_path.parent]
+        if self.build_dir is not None:
+            targets += [self.build_dir, self.build_dir / "dist"]
+        for target in targets:
+            if not target.is_dir():
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(target)), WATCH_MASK)
+            if wd >= 0:
+                self._watches.append(wd)
+            else:
+                logger.warning(f"OpenAIPlugin: inotify_add_watch failed for {target}: errno {ctypes.get_errno()}")
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.warning(f"OpenAIPlugin: inotify read failed: {e}")
+            return
+
+        offset = 0
+        relevant = False
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            self.events_seen += 1
+            if mask & IN_Q_OVERFLOW or wd in self._watches:
+                relevant = True
+        if relevant:
+            self._fire('inotify')
+
+    def _fire(self, reason: str):
+        build_dir = self._resolve_build()
+        if build_dir != self.build_dir:
+            self.build_dir = build_dir
+            reason = 'version_switch'
+            self._add_watches()
+        try:
+            self.on_change(reason)
+        except Exception as e:
+            logger.error(f"OpenAIPlugin: Watcher change handler failed: {e}")
+
+    def _poll_signature(self) -> Tuple:
+        try:
+            link_target = os.readlink(self.version_path) if self.version_path.is_symlink() else None
+        except OSError:
+            link_target = None
+        build_dir = self._resolve_build()
+        entries = [link_target]
+        for relative in POLLED_PATHS:
+            try:
+                stat = os.stat(build_dir / relative) if build_dir else None
+                entries.append((stat.st_ino, stat.st_size, stat.st_mtime_ns) if stat else None)
+            except OSError:
+                entries.append(None)
+        return tuple(entries)
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = self._poll_signature()
+            if signature != self._signature:
+                self._signature = signature
+                self._fire('polling')
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin State Reconciler
+
+Background reconciliation of the three places plugin state lives: the
+`plugin`/`module` rows, the manager's in-memory `active_users` and the
+shared version directories on disk. Each cycle does a bounded amount of
+work, so the reconciler can run continuously in production:
+
+- DB -> memory/disk: the next `batch_size` plugin rows changed since the
+  persisted (updated_at, id) watermark are read with keyset pagination,
+  never a full-table scan. Installed users missing from active_users are
+  added; rows whose module count is wrong, or whose version directory
+  fails validation, are flagged. One grouped module query per batch; disk
+  is validated once per distinct version per cycle.
+- memory -> DB: the next `memory_batch_size` active users after a rotating
+  cursor are checked against the table with one IN query, and users whose
+  row is gone (e.g. deleted by another process) are removed.
+
+The watermark is written to a small JSON cursor file after every cycle, so
+a restart resumes where the last process stopped.
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+from sqlalchemy import bindparam, text
+
+logger = structlog.get_logger()
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL = 30.0
+CURSOR_VERSION = 1
+
+
+def _encode_watermark(value: Any) -> Dict[str, Any]:
+    if isinstance(value, datetime.datetime):
+        return {'type': 'datetime', 'value': value.isoformat()}
+    return {'type': 'str', 'value': None if value is None else str(value)}
+
+
+def _decode_watermark(encoded: Optional[Dict[str, Any]]) -> Any:
+    if not encoded or encoded.get('value') is None:
+        return None
+    if encoded.get('type') == 'datetime':
+        return datetime.datetime.fromisoformat(encoded['value'])
+    return encoded['value']
+
+
+def _users_after(users, after: str, limit: int) -> List[str]:
+    """Up to `limit` members of a set sorted after `after`"""
+    if hasattr(users, 'iter_after'):
+        return list(itertools.islice(users.iter_after(after), limit))
+    return sorted(user_id for user_id in users if user_id > after)[:limit]
+
+
+class Reconciler:
+    """Incremental DB / memory / disk drift detection and repair for one manager"""
+
+    def __init__(self,
+                 manager,
+                 cursor_path: Optional[Path] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 memory_batch_size: Optional[int] = None,
+                 repair: bool = True):
+        """
+        Args:
+            manager: OpenAILifecycleManager to reconcile
+            cursor_path: JSON file holding the scan watermark (None = in memory only)
+            batch_size: plugin rows read per cycle
+            memory_batch_size: active users verified per cycle (default batch_size)
+            repair: fix active_users drift; when False it is only reported
+        """
+        self.manager = manager
+        self.plugin_slug = manager.plugin_data['plugin_slug']
+        self.cursor_path = Path(cursor_path) if cursor_path else None
+        self.batch_size = batch_size
+        self.memory_batch_size = memory_batch_size or batch_size
+        self.repair = repair
+
+        self.cursor = self._load_cursor()
+        # plugin_id -> issues found the last time that row was scanned
+        self.flagged: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            'cycles': 0,
+            'rows_scanned': 0,
+            'users_verified': 0,
+            'activated': 0,
+            'deactivated': 0
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def run_cycle(self, db) -> Dict[str, Any]:
+        """One bounded reconciliation step; returns what was scanned and changed"""
+        rows = await self._next_rows(db)
+        module_counts = await self._module_counts(db, rows)
+
+        activated, flagged = [], []
+        version_checks: Dict[str, Dict[str, Any]] = {}
+        expected_modules = len(self.manager.module_data)
+        for row in rows:
+            issues = {}
+            if row.user_id not in self.manager.active_users:
+                activated.append(row.user_id)
+                if self.repair:
+                    self.manager.active_users.add(row.user_id)
+
+            modules = module_counts.get(row.id, 0)
+            if modules != expected_modules:
+                issues['modules'] = {'expected': expected_modules, 'found': modules}
+
+            if row.version not in version_checks:
+                plugin_dir = self.manager.shared_path.parent / f"v{row.version}"
+                version_checks[row.version] = await self.manager._validate_installation_impl(None, plugin_dir)
+            validation = version_checks[row.version]
+            if not validation['valid']:
+                issues['files'] = validation.get('error')
+
+            if issues:
+                self.flagged[row.id] = {'user_id': row.user_id, 'version': row.version, **issues}
+                flagged.append(row.id)
+            else:
+                self.flagged.pop(row.id, None)
+
+        if rows:
+            last = rows[-1]
+            self.cursor['watermark'] = _encode_watermark(last.updated_at)
+            self.cursor['last_id'] = last.id
+        caught_up = len(rows) < self.batch_size
+
+        deactivated, verified = await self._verify_memory(db)
+
+        self.cursor['cycles'] = self.cursor.get('cycles', 0) + 1
+        await self.manager.fs.run(self._save_cursor)
+
+        self.stats['cycles'] += 1
+        self.stats['rows_scanned'] += len(rows)
+        self.stats['users_verified'] += verified
+        self.stats['activated'] += len(activated) if self.repair else 0
+        self.stats['deactivated'] += len(deactivated) if self.repair else 0
+
+        if activated or deactivated or flagged:
+            logger.info(f"OpenAIPlugin: Reconcile cycle scanned {len(rows)} rows; "
+                        f"{len(activated)} missing from memory, {len(deactivated)} stale in memory, "
+                        f"{len(flagged)} flagged")
+        return {
+            'success': True,
+            'rows_scanned': len(rows),
+            'users_verified': verified,
+            'activated': activated,
+            'deactivated': deactivated,
+            'flagged': flagged,
+            'versions_checked': len(version_checks),
+            'caught_up': caught_up,
+            'repaired': self.repair
+        }
+
+    async def run(self, session_factory: Callable, interval: float = DEFAULT_INTERVAL,
+                  max_cycles: Optional[int] = None):
+        """
+        Reconcile continuously. Cycles run back to back while there is a
+        backlog of changed rows, then every `interval` seconds.
+        """
+        cycles = 0
+        while not self._stopping and (max_cycles is None or cycles < max_cycles):
+            try:
+                async with session_factory() as db:
+                    report = await self.run_cycle(db)
+            except Exception as e:
+                logger.error(f"OpenAIPlugin: Reconcile cycle failed: {e}")
+                report = {'caught_up': True}
+            cycles += 1
+            await asyncio.sleep(interval if report['caught_up'] else 0)
+
+    def start(self, session_factory: Callable, interval: float = DEFAULT_INTERVAL) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.ensure_future(self.run(session_factory, interval))
+        return self._task
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self):
+        """Start the next scan from the beginning of the table"""
+        self.cursor = {'version': CURSOR_VERSION, 'watermark': None, 'last_id': None,
+                       'memory_after': "", 'cycles': self.cursor.get('cycles', 0)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'flagged': len(self.flagged),
+            'watermark': self.cursor.get('watermark'),
+            'running': self._task is not None and not self._task.done()
+        }
+
+    async def _next_rows(self, db) -> list:
+        watermark = _decode_watermark(self.cursor.get('watermark'))
+        params = {'plugin_slug': self.plugin_slug, 'limit': self.batch_size}
+        if watermark is None:
+            where = "plugin_slug = :plugin_slug"
+        else:
+            where = """plugin_slug = :plugin_slug
+              AND (updated_at > :watermark OR (updated_at = :watermark AND id > :last_id))"""
+            params.update(watermark=watermark, last_id=self.cursor.get('last_id') or "")
+        result = await db.execute(text(f"""
+        SELECT id, user_id, version, enabled, updated_at FROM plugin
+        WHERE {where}
+        ORDER BY updated_at, id
+        LIMIT :limit
+        """), params)
+        return result.fetchall()
+
+    async def _module_counts(self, db, rows: list) -> Dict[str, int]:
+        if not rows:
+            return {}
+        stmt = text("""
+        SELECT plugin_id, COUNT(*) AS modules FROM module
+        WHERE plugin_id IN :plugin_ids
+        GROUP BY plugin_id
+        """).bindparams(bindparam('plugin_ids', expanding=True))
+        result = await db.execute(stmt, {'plugin_ids': [row.id for row in rows]})
+        return {row.plugin_id: row.modules for row in result.fetchall()}
+
+    async def _verify_memory(self, db):
+        """Drop active users whose plugin row no longer exists; rotates through the set"""
+        active_users = self.manager.active_users
+        users = _users_after(active_users, self.cursor.get('memory_after', ""), self.memory_batch_size)
+        if not users:
+            self.cursor['memory_after'] = ""
+            return [], 0
+
+        # An install committing while the query runs re-adds its user; such
+        # users are left for the next pass instead of being dropped on a
+        # result that may predate the commit
+        changed = active_users.watch()
+        try:
+            stmt = text("""
+            SELECT user_id FROM plugin
+            WHERE plugin_slug = :plugin_slug AND user_id IN :user_ids
+            """).bindparams(bindparam('user_ids', expanding=True))
+            result = await db.execute(stmt, {'plugin_slug': self.plugin_slug, 'user_ids': users})
+            installed = {row.user_id for row in result.fetchall()}
+        finally:
+            active_users.unwatch(changed)
+
+        if self.manager.active_users is not active_users:
+            # The set was replaced (snapshot load, warm start); verify it next cycle
+            return [], 0
+        stale = [user_id for user_id in users if user_id not in installed and user_id not in changed]
+        if self.repair:
+            for user_id in stale:
+                self.manager.active_users.discard(user_id)
+        self.cursor['memory_after'] = users[-1] if len(users) == self.memory_batch_size else ""
+        return stale, len(users)
+
+    def _load_cursor(self) -> Dict[str, Any]:
+        cursor = {'version': CURSOR_VERSION, 'watermark': None, 'last_id': None,
+                  'memory_after': "", 'cycles': 0}
+        if self.cursor_path is None:
+            return cursor
+        try:
+            with open(self.cursor_path, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == CURSOR_VERSION:
+                cursor.update(stored)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return cursor
+
+    def _save_cursor(self):
+        if self.cursor_path is None:
+            return
+        self.cursor_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cursor_path.with_name(self.cursor_path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.cursor, f)
+        os.replace(tmp, self.cursor_path)
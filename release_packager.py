@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Release Packager
+
+Builds the GitHub release archive (`<name>-v<version>.tar.gz`) straight from
+the plugin checkout, using the same file selection as installs
+(should_copy / EXCLUDE_PATTERNS via the manager's source listing) minus
+development-only files (RELEASE_EXCLUDE_PATTERNS), and the version from
+plugin_data instead of a hard-coded one. Packaging fails when the built
+bundle (REQUIRED_FILES, e.g. dist/remoteEntry.js) is missing.
+
+Archives are reproducible: entries are sorted, owners and mtimes are
+normalized (SOURCE_DATE_EPOCH, default 0) and the gzip header carries no
+timestamp, so the same inputs always give a byte-identical file. Compression
+is pigz-style parallel gzip: the tar stream is cut into fixed-size chunks
+that are deflated on a thread pool (zlib releases the GIL), each primed with
+the previous chunk's last 32 KiB as dictionary and joined into one ordinary
+gzip member. The output does not depend on the number of workers.
+
+Every archive embeds `.file-manifest.json` (version_delta.MANIFEST_NAME:
+path -> size and sha256), so an extracted release can be verified
+(integrity.py) and used as a delta base right away, and gets a
+`<archive>.sha256` file next to it. When the inputs and settings hash to the
+same key as the existing archive, packaging is skipped; input hashes are
+cached by (size, mtime_ns, inode) so that check only re-reads changed files.
+"""
+
+import hashlib
+import io
+import json
+import os
+import struct
+import tarfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+
+from version_delta import MANIFEST_NAME, hash_file
+
+logger = structlog.get_logger()
+
+FORMAT_VERSION = 1
+DEFAULT_LEVEL = 6
+DEFAULT_CHUNK_BYTES = 256 * 1024
+# Deflate window: each chunk is primed with this much of the data before it
+DICTIONARY_BYTES = 32 * 1024
+# magic, deflate, no flags, mtime 0, no extra flags, OS unknown
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def _deflate_chunk(chunk: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # Sync flush ends byte-aligned without a final block, so raw streams can be concatenated
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Write-only file object producing one gzip member, deflated in parallel chunks"""
+
+    def __init__(self, fileobj, level: int = DEFAULT_LEVEL, workers: Optional[int] = None,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+        self.compressed_bytes = len(GZIP_HEADER)
+        fileobj.write(GZIP_HEADER)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_bytes:
+            chunk = bytes(self._buffer[:self.chunk_bytes])
+            del self._buffer[:self.chunk_bytes]
+            self._submit(chunk, last=False)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.fileobj.closed:
+            # Abandoned after a failure; nothing left to finish
+            self._pool.shutdown(cancel_futures=True)
+            super().close()
+            return
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            while self._pending:
+                self._write_next()
+            trailer = struct.pack("<II", self._crc & 0xFFFFFFFF, self._size & 0xFFFFFFFF)
+            self.fileobj.write(trailer)
+            self.compressed_bytes += len(trailer)
+        finally:
+            self._pool.shutdown()
+            super().close()
+
+    def _submit(self, chunk: bytes, last: bool):
+        self._crc = zlib.crc32(chunk, self._crc)
+        self._size += len(chunk)
+        self._pending.append(self._pool.submit(_deflate_chunk, chunk, self._dictionary, self.level, last))
+        self._dictionary = (self._dictionary + chunk)[-DICTIONARY_BYTES:]
+        # Bounded read-ahead: keep every worker busy without buffering the whole archive
+        while len(self._pending) > self.workers * 2:
+            self._write_next()
+
+    def _write_next(self):
+        compressed = self._pending.popleft().result()
+        self.fileobj.write(compressed)
+        self.compressed_bytes += len(compressed)
+
+
+class _HashingReader:
+    """File wrapper that hashes what tarfile reads, to catch files changing mid-package"""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+
+class ReleasePackager:
+    """Reproducible, parallel-compressed release archives with an input-keyed skip"""
+
+    def __init__(self,
+                 output_dir: Path,
+                 level: int = DEFAULT_LEVEL,
+                 workers: Optional[int] = None,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+                 source_date_epoch: Optional[int] = None):
+        """
+        Args:
+            output_dir: directory for archives, checksum files and the input cache
+            level: gzip level (1-9)
+            workers: compression threads (default: CPU count)
+            chunk_bytes: uncompressed bytes per parallel deflate chunk
+            source_date_epoch: mtime stored for every entry (default:
+                $SOURCE_DATE_EPOCH, else 0)
+        """
+        self.output_dir = Path(output_dir)
+        self.level = level
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        if source_date_epoch is None:
+            source_date_epoch = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+        self.source_date_epoch = source_date_epoch
+
+    def package(self, name: str, version: str, source_files: Dict[str, Path],
+                force: bool = False) -> Dict[str, Any]:
+        """
+        Package `source_files` (relative posix path -> file) as
+        <name>/<path> into <output_dir>/<name>-v<version>.tar.gz.
+        """
+        started = time.perf_counter()
+        archive = self.output_dir / f"{name}-v{version}.tar.gz"
+        cache_path = self.output_dir / f".{archive.name}.inputs.json"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        cache = self._load_cache(cache_path)
+        stats = {relative: os.stat(path) for relative, path in source_files.items()}
+        manifest, hashed = self._manifest(source_files, stats, cache.get('files', {}))
+        executable = sorted(relative for relative, stat in stats.items() if stat.st_mode & 0o111)
+        key = hashlib.sha256(json.dumps({
+            'format': FORMAT_VERSION, 'name': name, 'version': version, 'level': self.level,
+            'chunk_bytes': self.chunk_bytes, 'epoch': self.source_date_epoch,
+            'files': manifest, 'executable': executable
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+
+        file_cache = {relative: [stat.st_size, stat.st_mtime_ns, stat.st_ino, manifest[relative]['sha256']]
+                      for relative, stat in stats.items()}
+        archive_stat = archive.stat() if archive.exists() else None
+        if (not force and cache.get('key') == key and archive_stat is not None and
+                [archive_stat.st_size, archive_stat.st_mtime_ns] == cache.get('archive_stat')):
+            if hashed:
+                self._save_cache(cache_path, {**cache, 'files': file_cache})
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.info(f"OpenAIPlugin: {archive.name} is up to date ({len(manifest)} files, "
+                        f"{hashed} re-hashed) in {duration_ms} ms")
+            return {'success': True, 'skipped': True, 'archive': str(archive), 'version': version,
+                    'files': len(manifest), 'sha256': cache['archive_sha256'],
+                    'compressed_bytes': archive_stat.st_size, 'duration_ms': duration_ms}
+
+        tmp = archive.with_name(archive.name + ".tmp")
+        try:
+            with open(tmp, 'wb') as raw:
+                gz = ParallelGzipWriter(raw, self.level, self.workers, self.chunk_bytes)
+                with tarfile.open(fileobj=gz, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+                    self._write_entries(tar, name, source_files, stats, manifest)
+                gz.close()
+            archive_sha256 = hash_file(tmp)
+            os.replace(tmp, archive)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        checksum = archive.with_name(archive.name + ".sha256")
+        checksum.write_text(f"{archive_sha256}  {archive.name}\n")
+        archive_stat = archive.stat()
+        self._save_cache(cache_path, {
+            'version': FORMAT_VERSION, 'key': key, 'archive_sha256': archive_sha256,
+            'archive_stat': [archive_stat.st_size, archive_stat.st_mtime_ns], 'files': file_cache
+        })
+
+        total = sum(entry['size'] for entry in manifest.values())
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"OpenAIPlugin: Packaged {len(manifest)} files ({total} bytes) into {archive.name} "
+                    f"({archive_stat.st_size} bytes) in {duration_ms} ms")
+        return {'success': True, 'skipped': False, 'archive': str(archive), 'version': version,
+                'files': len(manifest), 'bytes': total, 'compressed_bytes': archive_stat.st_size,
+                'sha256': archive_sha256, 'duration_ms': duration_ms}
+
+    def _manifest(self, source_files: Dict[str, Path], stats: Dict[str, os.stat_result],
+                  cached: Dict[str, list]):
+        """Size and sha256 per file; files whose stat matches the cache are not re-read"""
+        manifest, to_hash = {}, []
+        for relative in sorted(source_files):
+            stat = stats[relative]
+            known = cached.get(relative)
+            if known is not None and known[:3] == [stat.st_size, stat.st_mtime_ns, stat.st_ino]:
+                manifest[relative] = {'size': stat.st_size, 'sha256': known[3]}
+            else:
+                to_hash.append(relative)
+        if to_hash:
+            with ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) + 1)) as pool:
+                for relative, digest in zip(to_hash, pool.map(lambda r: hash_file(source_files[r]), to_hash)):
+                    manifest[relative] = {'size': stats[relative].st_size, 'sha256': digest}
+        return dict(sorted(manifest.items())), len(to_hash)
+
+    def _write_entries(self, tar: tarfile.TarFile, name: str, source_files: Dict[str, Path],
+                       stats: Dict[str, os.stat_result], manifest: Dict[str, Dict[str, Any]]):
+        manifest_bytes = json.dumps({'version': 1, 'files': manifest}, sort_keys=True).encode("utf-8")
+        directories = {name}
+        for relative in source_files:
+            parts = relative.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                directories.add(f"{name}/{'/'.join(parts[:depth])}")
+
+        entries = [(directory, None) for directory in directories]
+        entries += [(f"{name}/{relative}", relative) for relative in source_files]
+        entries.append((f"{name}/{MANIFEST_NAME}", MANIFEST_NAME))
+        for member, relative in sorted(entries):
+            info = tarfile.TarInfo(member)
+            info.mtime = self.source_date_epoch
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            if relative is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+            elif relative == MANIFEST_NAME:
+                info.mode = 0o644
+                info.size = len(manifest_bytes)
+                tar.addfile(info, io.BytesIO(manifest_bytes))
+            else:
+                stat = stats[relative]
+                info.mode = 0o755 if stat.st_mode & 0o111 else 0o644
+                info.size = manifest[relative]['size']
+                with open(source_files[relative], 'rb') as f:
+                    reader = _HashingReader(f)
+                    tar.addfile(info, reader)
+                if reader.digest.hexdigest() != manifest[relative]['sha256']:
+                    raise RuntimeError(f"OpenAIPlugin: {relative} changed while packaging")
+
+    def _load_cache(self, path: Path) -> Dict[str, Any]:
+        try:
+            with open(path, 'r') as f:
+                cache = json.load(f)
+            return cache if cache.get('version') == FORMAT_VERSION else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self, path: Path, cache: Dict[str, Any]):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+
+
+def benchmark_compression(size: int = 64 * 1024 * 1024, workers: Optional[int] = None,
+                          level: int = DEFAULT_LEVEL) -> Dict[str, Any]:
+    """Single-threaded gzip vs ParallelGzipWriter on `size` bytes of text-like data"""
+    import gzip
+    import random
+
+    rng = random.Random(0)
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9)))
+             for _ in range(5000)]
+    data = b" ".join(rng.choice(words) for _ in range(size // 6))[:size]
+
+    started = time.perf_counter()
+    single = gzip.compress(data, compresslevel=level, mtime=0)
+    single_seconds = time.perf_counter() - started
+
+    out = io.BytesIO()
+    started = time.perf_counter()
+    writer = ParallelGzipWriter(out, level, workers)
+    writer.write(data)
+    writer.close()
+    parallel_seconds = time.perf_counter() - started
+    assert gzip.decompress(out.getvalue()) == data
+
+    return {
+        'bytes': len(data),
+        'workers': writer.workers,
+        'gzip_seconds': round(single_seconds, 3),
+        'parallel_seconds': round(parallel_seconds, 3),
+        'speedup': round(single_seconds / parallel_seconds, 2),
+        'gzip_bytes': len(single),
+        'parallel_bytes': len(out.getvalue())
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Build the OpenAIPlugin release archive")
+    parser.add_argument("--source-dir", default=None, help="plugin checkout (default: this directory)")
+    parser.add_argument("--output-dir", default=None, help="archive directory (default: <source>/releases)")
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL)
+    parser.add_argument("--workers", type=int, default=None, help="compression threads (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="repackage even if inputs are unchanged")
+    parser.add_argument("--benchmark", action="store_true", help="compare against single-threaded gzip")
+    args = parser.parse_args()
+
+    # stdout carries only the JSON result (build.sh reads the archive path from it)
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    if args.benchmark:
+        print(json.dumps(benchmark_compression(workers=args.workers, level=args.level), indent=2))
+        sys.exit(0)
+
+    from lifecycle_manager import OpenAILifecycleManager
+    manager = OpenAILifecycleManager(source_dir=args.source_dir)
+    output_dir = Path(args.output_dir) if args.output_dir else manager.source_dir / "releases"
+    packager = ReleasePackager(output_dir, level=args.level, workers=args.workers)
+    try:
+        source_files = manager._list_release_files()
+    except FileNotFoundError as e:
+        print(json.dumps({'success': False, 'error': str(e)}, indent=2))
+        sys.exit(1)
+    result = packager.package(manager.plugin_data['name'], manager.plugin_data['version'],
+                              source_files, force=args.force)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Request Scheduler
+
+Per-API-key admission control for upstream chat calls. Each key gets a token
+bucket for requests and one for tokens, a bounded concurrency limit and
+round-robin fair queuing across users. Retryable upstream failures (429/5xx)
+are retried with jittered exponential backoff that honours `Retry-After`,
+and queue wait times are recorded so tail latency can be monitored.
+"""
+
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 4
+
+
+class RetryableUpstreamError(Exception):
+    """Raised by scheduled calls for failures worth retrying (429, 5xx, timeouts)"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds; HTTP dates are ignored"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """Cheap upper-bound token estimate: ~4 characters per token plus max_tokens"""
+    chars = sum(len(str(m.get('content') or '')) for m in request.get('messages', []))
+    return chars // 4 + 4 * len(request.get('messages', [])) + int(request.get('max_tokens') or 0)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` per second"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill()
+        # Requests larger than the bucket are admitted once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _KeyScheduler:
+    """Queues, buckets and concurrency state for a single API key"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 max_concurrency: int, clock: Callable[[], float]):
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0 * 5), clock)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute, clock)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        # user_id -> deque of (future, tokens, enqueued_at); order is the round-robin order
+        self.queues: "OrderedDict[str, Deque]" = OrderedDict()
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+
+class RequestScheduler:
+    """Fair, rate-limited scheduler for upstream OpenAI calls keyed by API key"""
+
+    def __init__(self,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+                 wait_samples: int = 2048):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+
+        self._keys: Dict[str, _KeyScheduler] = {}
+        self._wait_times: Deque[float] = deque(maxlen=wait_samples)
+        self.stats = {
+            'scheduled': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'throttled': 0
+        }
+
+    async def submit(self,
+                     api_key: str,
+                     user_id: str,
+                     call: Callable[[], Awaitable[Any]],
+                     estimated_tokens: int = 0) -> Any:
+        """
+        Run `call` once admitted for this key/user, retrying retryable failures.
+
+        `call` should raise RetryableUpstreamError for 429/5xx responses; any
+        other exception is propagated immediately.
+        """
+        self.stats['scheduled'] += 1
+        attempt = 0
+        while True:
+            await self._acquire(api_key, user_id, estimated_tokens)
+            try:
+                result = await call()
+                self.stats['completed'] += 1
+                return result
+            except RetryableUpstreamError as e:
+                if e.status == 429:
+                    self.stats['throttled'] += 1
+                if attempt >= self.max_retries:
+                    self.stats['failed'] += 1
+                    raise
+                delay = self._backoff(attempt, e.retry_after)
+                if e.retry_after is not None:
+                    # The limit is per key, so hold back every queued request
+                    state = self._key_state(api_key)
+                    state.blocked_until = max(state.blocked_until, self.clock() + e.retry_after)
+                attempt += 1
+                self.stats['retries'] += 1
+                logger.warning(f"OpenAIPlugin: Upstream call failed ({e.status}), retry {attempt} in {delay:.2f}s")
+            except Exception:
+                self.stats['failed'] += 1
+                raise
+            finally:
+                self._release(api_key)
+            await self.sleep(delay)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return counters and queue wait percentiles (seconds)"""
+        waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            **self.stats,
+            'queued': sum(state.queued() for state in self._keys.values()),
+            'in_flight': sum(state.in_flight for state in self._keys.values()),
+            'queue_wait_p50': percentile(0.50),
+            'queue_wait_p95': percentile(0.95),
+            'queue_wait_p99': percentile(0.99),
+            'queue_wait_max': waits[-1] if waits else 0.0
+        }
+
+    def _key_state(self, api_key: str) -> _KeyScheduler:
+        state = self._keys.get(api_key)
+        if state is None:
+            state = _KeyScheduler(self.requests_per_minute, self.tokens_per_minute,
+                                  self.max_concurrency, self.clock)
+            self._keys[api_key] = state
+        return state
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _acquire(self, api_key: str, user_id: str, tokens: int):
+        state = self._key_state(api_key)
+        future = asyncio.get_event_loop().create_future()
+        state.queues.setdefault(user_id, deque()).append((future, tokens, self.clock()))
+        self._dispatch(state)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just before cancellation; hand the slot back
+                self._release(api_key)
+            else:
+                self._discard(state, user_id, future)
+            raise
+
+    def _release(self, api_key: str):
+        state = self._keys[api_key]
+        state.in_flight -= 1
+        self._dispatch(state)
+
+    def _discard(self, state: _KeyScheduler, user_id: str, future: asyncio.Future):
+        queue = state.queues.get(user_id)
+        if queue is None:
+            return
+        for item in list(queue):
+            if item[0] is future:
+                queue.remove(item)
+        if not queue:
+            del state.queues[user_id]
+
+    def _dispatch(self, state: _KeyScheduler):
+        """Admit queued requests round-robin across users while limits allow"""
+        while state.queues and state.in_flight < state.max_concurrency:
+            now = self.clock()
+            user_id, queue = next(iter(state.queues.items()))
+            future, tokens, enqueued_at = queue[0]
+
+            wait = max(
+                state.blocked_until - now,
+                state.request_bucket.wait_time(1),
+                state.token_bucket.wait_time(tokens)
+            )
+            if wait > 0:
+                self._schedule_wakeup(state, wait)
+                return
+
+            queue.popleft()
+            # Rotate: this user goes to the back of the round-robin order
+            del state.queues[user_id]
+            if queue:
+                state.queues[user_id] = queue
+
+            if future.done():
+                continue
+
+            state.request_bucket.consume(1)
+            state.token_bucket.consume(tokens)
+            state.in_flight += 1
+            self._wait_times.append(now - enqueued_at)
+            future.set_result(None)
+
+    def _schedule_wakeup(self, state: _KeyScheduler, delay: float):
+        if state.wakeup is not None and not state.wakeup.cancelled():
+            state.wakeup.cancel()
+        loop = asyncio.get_event_loop()
+        state.wakeup = loop.call_later(delay, self._dispatch, state)
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Sharded Runner
+
+Multi-process version of the batch runner for large rollouts. The CPU-bound
+parts of a lifecycle operation (building and JSON-encoding module rows,
+hashing, result serialization) run on one core in a single process no
+matter how much async I/O overlaps. Here user IDs are partitioned across a
+pool of worker processes by a stable hash of the ID, so a user always lands
+on the same worker and no two workers touch the same rows.
+
+Each worker builds its own manager and its own database engine/sessions and
+runs an ordinary BatchRunner over its shard. Results come back over one
+queue as pre-serialized JSONL chunks (one message per batch), and the parent
+aggregates them into a single output stream and one progress line. Input is
+streamed: the parent holds at most one partial batch per worker plus a few
+queued batches, regardless of the number of users.
+
+The parent keeps every batch it sends to a worker until the worker's result
+chunks acknowledge those users (workers report in input order). If a worker
+dies, its unacknowledged users, whether in flight or still queued, are
+reported as failed rather than lost.
+"""
+
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import structlog
+
+from batch_runner import (
+    BatchRunner, DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, OPERATIONS, create_session_factory
+)
+from tracing import instrument_engine
+
+logger = structlog.get_logger()
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Input batches buffered per worker before the parent blocks
+QUEUE_BATCHES = 4
+POLL_SECONDS = 1.0
+
+
+def shard_for(user_id: str, shards: int) -> int:
+    """Stable shard index for a user (the same in every process and run)"""
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+
+def load_session_factory(spec: str) -> Callable[[], Any]:
+    """Import a session factory given as 'module:attribute'"""
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class _QueueOutput:
+    """TextIO stand-in shipping a worker's JSONL results to the parent once per batch"""
+
+    def __init__(self, shard: int, results):
+        self.shard = shard
+        self.results = results
+        self.runner: Optional[BatchRunner] = None
+        self._lines: List[str] = []
+        self._sent = (0, 0)
+
+    def write(self, text: str):
+        self._lines.append(text)
+
+    def flush(self):
+        if not self._lines:
+            return
+        succeeded, failed = self.runner.succeeded, self.runner.failed
+        self.results.put(('records', self.shard, "".join(self._lines),
+                          succeeded - self._sent[0], failed - self._sent[1]))
+        self._sent = (succeeded, failed)
+        self._lines = []
+
+
+def _iter_inbox(inbox) -> Iterator[str]:
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            return
+        yield from batch
+
+
+async def _run_worker(shard: int, config: Dict[str, Any], inbox, results) -> Dict[str, Any]:
+    from lifecycle_manager import OpenAILifecycleManager
+
+    manager = OpenAILifecycleManager(config['plugins_dir'], source_dir=config['source_dir'],
+                                     module_storage=config['module_storage'])
+    target_manager = None
+    if config['operation'] == "update":
+        # Built once per worker and shared by all of its users
+        target_manager = OpenAILifecycleManager(config['plugins_dir'], source_dir=config['target_source_dir'],
+                                                module_storage=config['module_storage'],
+                                                version=config['target_version'])
+    engine = None
+    if config['session_factory']:
+        session_factory = load_session_factory(config['session_factory'])
+    else:
+        engine, session_factory = create_session_factory(config['db_url'], pool_size=config['concurrency'])
+        if manager.tracer.enabled:
+            # Tracing reaches workers through the environment (see tracing.get_tracer)
+            instrument_engine(engine, manager.tracer)
+
+    output = _QueueOutput(shard, results)
+    runner = BatchRunner(
+        manager, session_factory, config['operation'],
+        concurrency=config['concurrency'],
+        batch_size=config['batch_size'],
+        commit_every=config['commit_every'],
+        target_manager=target_manager,
+        output=output
+    )
+    output.runner = runner
+    try:
+        return await runner.run(_iter_inbox(inbox))
+    finally:
+        await manager.fs.run(manager.tracer.flush)
+        if engine is not None:
+            await engine.dispose()
+
+
+def _worker_main(shard: int, config: Dict[str, Any], inbox, results):
+    """Process entry point: one event loop, one manager and one DB engine per worker"""
+    try:
+        summary = asyncio.run(_run_worker(shard, config, inbox, results))
+        results.put(('done', shard, summary))
+    except Exception as e:
+        results.put(('error', shard, str(e)))
+
+
+class ProgressAggregator:
+    """Merges per-worker result chunks into one output stream and progress line"""
+
+    def __init__(self, operation: str, output: TextIO, progress: Optional[TextIO] = None,
+                 progress_interval: float = 0.5):
+        self.operation = operation
+        self.output = output
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.succeeded = 0
+        self.failed = 0
+        self.per_shard: Dict[int, int] = {}
+        self.started = time.monotonic()
+        self._last_progress = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    def add(self, shard: int, lines: str, succeeded: int, failed: int):
+        self.output.write(lines)
+        self.output.flush()
+        self.succeeded += succeeded
+        self.failed += failed
+        self.per_shard[shard] = self.per_shard.get(shard, 0) + succeeded + failed
+        self.report()
+
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started, 1e-9)
+
+    def report(self, final: bool = False):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not final and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        self.progress.write(
+            f"\r{self.operation}: {self.processed} done "
+            f"({self.succeeded} ok, {self.failed} failed) "
+            f"{self.processed / self.elapsed():.1f} users/s across {len(self.per_shard)} workers"
+            + ("\n" if final else "")
+        )
+        self.progress.flush()
+
+
+class ShardedRunner:
+    """Fan a lifecycle operation out over worker processes, one shard of users each"""
+
+    def __init__(self,
+                 operation: str,
+                 workers: int = DEFAULT_WORKERS,
+                 db_url: Optional[str] = None,
+                 session_factory: Optional[str] = None,
+                 plugins_dir: Optional[str] = None,
+                 source_dir: Optional[str] = None,
+                 module_storage: str = "inline",
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 commit_every: int = 0,
+                 target_source_dir: Optional[str] = None,
+                 target_version: Optional[str] = None,
+                 output: Optional[TextIO] = None,
+                 progress: Optional[TextIO] = None,
+                 progress_interval: float = 0.5):
+        """
+        Args:
+            operation: one of OPERATIONS
+            workers: worker processes (shards)
+            db_url: database URL each worker opens its own engine for
+            session_factory: alternatively, an importable 'module:attribute'
+                session factory, used as is in every worker
+            plugins_dir, source_dir, module_storage: manager settings
+            concurrency, batch_size, commit_every: per-worker BatchRunner settings
+            target_source_dir, target_version: update only: the version users
+                move to (each worker builds its target manager from them)
+            output: aggregated JSONL result stream (default stdout)
+            progress: live progress stream such as stderr (None disables it)
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}', expected one of {', '.join(OPERATIONS)}")
+        if bool(db_url) == bool(session_factory):
+            raise ValueError("Give either db_url or session_factory")
+        if operation == "update" and not (target_source_dir or target_version):
+            raise ValueError("The update operation needs target_source_dir and/or target_version")
+        self.operation = operation
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.config = {
+            'operation': operation,
+            'db_url': db_url,
+            'session_factory': session_factory,
+            'plugins_dir': plugins_dir,
+            'source_dir': source_dir,
+            'module_storage': module_storage,
+            'concurrency': max(1, concurrency),
+            'batch_size': self.batch_size,
+            'commit_every': commit_every,
+            'target_source_dir': target_source_dir,
+            'target_version': target_version
+        }
+        self.aggregator = ProgressAggregator(operation, output if output is not None else sys.stdout,
+                                             progress, progress_interval)
+        self.worker_summaries: Dict[int, Dict[str, Any]] = {}
+        self.worker_errors: Dict[int, str] = {}
+
+        # Per shard: sent batches not yet acknowledged by result chunks, and
+        # how many users of the first one were; guarded by _inflight_lock
+        self._inflight: List[deque] = [deque() for _ in range(self.workers)]
+        self._acked = [0] * self.workers
+        self._exited: set = set()
+        self._inflight_lock = threading.Lock()
+
+    async def run(self, user_ids: Iterable[str]) -> Dict[str, Any]:
+        """Process all user IDs across the worker pool and return a summary"""
+        if self.operation in ("install", "update"):
+            await self._publish_once()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._run_pool, user_ids)
+
+    def get_summary(self) -> Dict[str, Any]:
+        aggregator = self.aggregator
+        elapsed = aggregator.elapsed()
+        return {
+            'operation': self.operation,
+            'workers': self.workers,
+            'processed': aggregator.processed,
+            'succeeded': aggregator.succeeded,
+            'failed': aggregator.failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'users_per_second': round(aggregator.processed / elapsed, 2),
+            'per_worker': [aggregator.per_shard.get(shard, 0) for shard in range(self.workers)],
+            'worker_errors': {str(shard): error for shard, error in self.worker_errors.items()}
+        }
+
+    async def _publish_once(self):
+        """Publish the shared (or update target) version up front so workers don't race to build it"""
+        from lifecycle_manager import OpenAILifecycleManager
+        if self.operation == "update":
+            manager = OpenAILifecycleManager(self.config['plugins_dir'], source_dir=self.config['target_source_dir'],
+                                             version=self.config['target_version'])
+        else:
+            manager = OpenAILifecycleManager(self.config['plugins_dir'], source_dir=self.config['source_dir'])
+        if await manager.fs.run(manager.version_store.resolve, manager.shared_path.name) is None:
+            result = await manager.publish_shared_version()
+            if not result['success']:
+                raise RuntimeError(f"Publishing the shared version failed: {result.get('error')}")
+
+    def _run_pool(self, user_ids: Iterable[str]) -> Dict[str, Any]:
+        # spawn: workers must not inherit the parent's event loop, threads or DB connections
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        inboxes = [context.Queue(maxsize=QUEUE_BATCHES) for _ in range(self.workers)]
+        processes = [
+            context.Process(target=_worker_main, args=(shard, self.config, inboxes[shard], results), daemon=True)
+            for shard in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        self.aggregator.started = time.monotonic()
+        feeder = threading.Thread(target=self._feed, args=(user_ids, inboxes, processes, results), daemon=True)
+        feeder.start()
+
+        running = set(range(self.workers))
+
+        def handle(message):
+            kind, shard = message[0], message[1]
+            if kind == 'records':
+                self._acknowledge(shard, message[3] + message[4])
+                self.aggregator.add(shard, *message[2:])
+            elif kind == 'unsent':
+                self.aggregator.add(shard, *message[2:])
+            elif kind == 'done':
+                self.worker_summaries[shard] = message[2]
+                self._worker_exited(shard, "Worker finished without reporting this user")
+                running.discard(shard)
+            else:
+                logger.error(f"OpenAIPlugin: Shard {shard} failed: {message[2]}")
+                self.worker_errors[shard] = message[2]
+                self._worker_exited(shard, f"Worker for shard {shard} failed: {message[2]}")
+                running.discard(shard)
+
+        while running:
+            try:
+                handle(results.get(timeout=POLL_SECONDS))
+            except queue.Empty:
+                dead = [shard for shard in running if not processes[shard].is_alive()]
+                if not dead:
+                    continue
+                # Take in whatever the dead workers managed to send before exiting
+                while True:
+                    try:
+                        handle(results.get_nowait())
+                    except queue.Empty:
+                        break
+                for shard in dead:
+                    if shard in running:
+                        exitcode = processes[shard].exitcode
+                        self.worker_errors[shard] = f"worker exited with code {exitcode}"
+                        self._worker_exited(shard, f"Worker for shard {shard} exited with code {exitcode}")
+                        running.discard(shard)
+
+        feeder.join()
+        # Failure records the feeder produced for users of dead workers
+        while True:
+            try:
+                message = results.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == 'unsent':
+                self.aggregator.add(message[1], *message[2:])
+        for process in processes:
+            process.join()
+
+        self.aggregator.report(final=True)
+        return self.get_summary()
+
+    def _feed(self, user_ids: Iterable[str], inboxes: list, processes: list, results):
+        pending: List[List[str]] = [[] for _ in range(self.workers)]
+        for user_id in user_ids:
+            shard = shard_for(user_id, self.workers)
+            pending[shard].append(user_id)
+            if len(pending[shard]) >= self.batch_size:
+                self._send(shard, pending[shard], inboxes, processes, results)
+                pending[shard] = []
+        for shard in range(self.workers):
+            if pending[shard]:
+                self._send(shard, pending[shard], inboxes, processes, results)
+            self._send(shard, None, inboxes, processes, results)
+
+    def _send(self, shard: int, batch: Optional[List[str]], inboxes: list, processes: list, results):
+        if batch:
+            with self._inflight_lock:
+                exited = shard in self._exited
+                if not exited:
+                    # From here on the parent reports these users if the worker dies
+                    self._inflight[shard].append(batch)
+            if exited:
+                # The worker is gone; report its users as failed rather than losing them
+                results.put(('unsent', shard, self._failure_lines(batch, f'Worker for shard {shard} is not running'),
+                             0, len(batch)))
+                return
+        while processes[shard].is_alive():
+            try:
+                inboxes[shard].put(batch, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _acknowledge(self, shard: int, users: int):
+        """Drop `users` reported users from the front of the shard's in-flight batches"""
+        with self._inflight_lock:
+            inflight = self._inflight[shard]
+            acked = self._acked[shard] + users
+            while inflight and acked >= len(inflight[0]):
+                acked -= len(inflight.popleft())
+            self._acked[shard] = acked
+
+    def _worker_exited(self, shard: int, reason: str):
+        """Report the shard's unacknowledged users as failed; later batches are failed by _send"""
+        with self._inflight_lock:
+            self._exited.add(shard)
+            inflight, self._inflight[shard] = self._inflight[shard], deque()
+            skip, self._acked[shard] = self._acked[shard], 0
+        users = [user_id for batch in inflight for user_id in batch][skip:]
+        if users:
+            logger.error(f"OpenAIPlugin: Shard {shard} exited with {len(users)} users unreported")
+            self.aggregator.add(shard, self._failure_lines(users, reason), 0, len(users))
+
+    def _failure_lines(self, users: List[str], reason: str) -> str:
+        error = {'error': reason}
+        return "".join(
+            json.dumps({'user_id': user_id, 'operation': self.operation, 'success': False,
+                        'duration_ms': 0.0, 'result': error}) + "\n"
+            for user_id in users
+        )
+
+
+def benchmark_speedup(users: int = 20000,
+                      worker_counts: Iterable[int] = (1, 2, 4, 8),
+                      operation: str = "install",
+                      **runner_args) -> Dict[str, Any]:
+    """
+    Run the same job with increasing worker counts and report throughput,
+    speedup over one worker and parallel efficiency (speedup / workers).
+
+    Every run gets its own user ids, so each one does the same real work
+    instead of failing fast on rows an earlier run created; they are
+    installed first (untimed) for other operations and deleted again after
+    the run. Speedup is only reported when every run completed without
+    failures.
+    """
+    runs = []
+    baseline = None
+    for run, workers in enumerate(worker_counts):
+        user_ids = [f"bench_{run}_{workers}w_user_{i:08d}" for i in range(users)]
+        with open(os.devnull, "w") as sink:
+            if operation != "install":
+                # Untimed setup: the measured operation needs installed users
+                setup = ShardedRunner("install", workers=workers, output=sink, **runner_args)
+                asyncio.run(setup.run(iter(user_ids)))
+            runner = ShardedRunner(operation, workers=workers, output=sink, **runner_args)
+            summary = asyncio.run(runner.run(iter(user_ids)))
+            if operation != "delete":
+                cleanup = ShardedRunner("delete", workers=workers, output=sink, **runner_args)
+                asyncio.run(cleanup.run(iter(user_ids)))
+        if summary['failed']:
+            raise RuntimeError(f"Benchmark run with {workers} workers had {summary['failed']} failed users; "
+                               f"speedup would compare unequal work")
+        if baseline is None:
+            baseline = summary['elapsed_seconds']
+        speedup = baseline / summary['elapsed_seconds']
+        runs.append({
+            'workers': workers,
+            'elapsed_seconds': summary['elapsed_seconds'],
+            'users_per_second': summary['users_per_second'],
+            'speedup': round(speedup, 2),
+            'efficiency': round(speedup / workers, 2),
+            'failed': summary['failed']
+        })
+    return {'users': users, 'operation': operation, 'cpu_count': os.cpu_count(), 'runs': runs}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded runner speedup benchmark")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--operation", choices=OPERATIONS, default="install")
+    parser.add_argument("--db-url", default=os.environ.get("BRAINDRIVE_DATABASE_URL"))
+    parser.add_argument("--session-factory", help="'module:attribute' session factory instead of --db-url")
+    parser.add_argument("--plugins-dir", required=True)
+    parser.add_argument("--source-dir", help="built plugin checkout to publish from")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    report = benchmark_speedup(
+        args.users,
+        [int(n) for n in args.workers.split(",")],
+        args.operation,
+        db_url=None if args.session_factory else args.db_url,
+        session_factory=args.session_factory,
+        plugins_dir=args.plugins_dir,
+        source_dir=args.source_dir,
+        concurrency=args.concurrency
+    )
+    print(json.dumps(report, indent=2))
@@ -8,8 +8,10 @@ it works correctly with the new multi-user plugin system.
 
 import asyncio
 import json
+import os
 import tempfile
 import shutil
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Dict, Any
 import structlog
@@ -25,15 +27,60 @@ class MockAsyncSession:
         }
         self.committed = False
         self.rolled_back = False
+        self.commit_count = 0
+        self.fail_user_id = None
+        self.crash_user_id = None
 
     async def execute(self, query, params=None):
         """Mock execute method"""
         query_str = str(query)
 
-        if "INSERT INTO plugin" in query_str:
+        if self.crash_user_id and isinstance(params, dict) and params.get('user_id') == self.crash_user_id:
+            # Simulate a worker process dying abruptly (no cleanup, no results sent)
+            os._exit(3)
+
+        if self.fail_user_id and isinstance(params, dict) and params.get('user_id') == self.fail_user_id \
+                and "INSERT INTO module" in query_str:
+            raise RuntimeError(f"Simulated failure for {self.fail_user_id}")
+
+        if "UPDATE plugin SET config_fields" in query_str or "UPDATE module SET config_fields" in query_str:
+            table, key = ('plugins', 'plugin_id') if "UPDATE plugin" in query_str else ('modules', 'module_id')
+            updated = 0
+            for row_params in (params if isinstance(params, list) else [params]):
+                row = self.data[table].get(row_params[key])
+                if row is not None and row['user_id'] == row_params['user_id']:
+                    row['config_fields'] = row_params['config_fields']
+                    updated += 1
+            return MockResult(rowcount=updated)
+
+        if "plugin_user_opt_out" in query_str and "CREATE TABLE" not in query_str:
+            opt_outs = self.data.setdefault('opt_outs', {})
+            key = (params['user_id'], params['plugin_slug'])
+            if query_str.lstrip().startswith("INSERT"):
+                opt_outs.setdefault(key, params)
+                return MockResult(rowcount=1)
+            return MockResult(fetchone_data=MockRow(opt_outs[key]) if key in opt_outs else None)
+        if "plugin_tenant_enablement" in query_str and "CREATE TABLE" not in query_str:
+            enablement = self.data.setdefault('tenant_enablement', {})
+            key = (params['tenant_id'], params['plugin_slug'])
+            if query_str.lstrip().startswith("INSERT"):
+                enablement[key] = params
+                return MockResult(rowcount=1)
+            if query_str.lstrip().startswith("DELETE"):
+                return MockResult(rowcount=1 if enablement.pop(key, None) else 0)
+            return MockResult(fetchone_data=MockRow(enablement[key]) if key in enablement else None)
+        elif "INSERT INTO plugin" in query_str:
             plugin_id = params['id']
             self.data['plugins'][plugin_id] = params
             return MockResult(rowcount=1)
+        elif "INSERT INTO module_definition" in query_str:
+            self.data.setdefault('module_definitions', {}).setdefault(params['id'], params)
+            return MockResult(rowcount=1)
+        elif "CREATE TABLE" in query_str:
+            return MockResult()
+        elif "FROM module_definition" in query_str:
+            definitions = self.data.get('module_definitions', {})
+            return MockResult(fetchall_data=[MockRow(definitions[i]) for i in params['ids'] if i in definitions])
         elif "INSERT INTO module" in query_str:
             module_id = params['id']
             self.data['modules'][module_id] = params
@@ -51,13 +98,57 @@ class MockAsyncSession:
                 del self.data['plugins'][plugin_id]
                 return MockResult(rowcount=1)
             return MockResult(rowcount=0)
-        elif "SELECT" in query_str and "plugin" in query_str:
+        elif "GROUP BY version" in query_str:
+            counts = {}
+            for plugin_data in self.data['plugins'].values():
+                if plugin_data['plugin_slug'] == params['plugin_slug']:
+                    counts[plugin_data['version']] = counts.get(plugin_data['version'], 0) + 1
+            return MockResult(fetchall_data=[MockRow({'version': v, 'users': c}) for v, c in counts.items()])
+        elif "UPDATE plugin SET" in query_str and "latest_version" in query_str:
+            updated = 0
+            for plugin_data in self.data['plugins'].values():
+                if plugin_data['plugin_slug'] != params['plugin_slug']:
+                    continue
+                flag = plugin_data['version'] in params['outdated']
+                if (plugin_data.get('latest_version') == params['latest_version'] and
+                        plugin_data.get('update_available') is not None and
+                        bool(plugin_data['update_available']) == flag):
+                    continue
+                plugin_data['update_available'] = flag
+                plugin_data['latest_version'] = params['latest_version']
+                plugin_data['last_update_check'] = params['checked_at']
+                updated += 1
+            return MockResult(rowcount=updated)
+        elif "ORDER BY updated_at, id" in query_str:
+            rows = sorted((p for p in self.data['plugins'].values() if p['plugin_slug'] == params['plugin_slug']),
+                          key=lambda p: (p['updated_at'], p['id']))
+            if 'watermark' in params:
+                rows = [p for p in rows if (p['updated_at'], p['id']) > (params['watermark'], params['last_id'])]
+            return MockResult(fetchall_data=[MockRow(p) for p in rows[:params['limit']]])
+        elif "GROUP BY plugin_id" in query_str:
+            counts = {}
+            for module_data in self.data['modules'].values():
+                if module_data['plugin_id'] in params['plugin_ids']:
+                    counts[module_data['plugin_id']] = counts.get(module_data['plugin_id'], 0) + 1
+            return MockResult(fetchall_data=[MockRow({'plugin_id': p, 'modules': c}) for p, c in counts.items()])
+        elif "ORDER BY user_id" in query_str and "FROM plugin" in query_str:
+            return MockResult(fetchall_data=sorted(
+                (MockRow({'user_id': p['user_id']}) for p in self.data['plugins'].values()
+                 if p['plugin_slug'] == params['plugin_slug']),
+                key=lambda row: row.user_id
+            ))
+        elif "user_id IN" in query_str and "FROM plugin" in query_str:
+            return MockResult(fetchall_data=[
+                MockRow(p) for p in self.data['plugins'].values()
+                if p['plugin_slug'] == params['plugin_slug'] and p['user_id'] in params['user_ids']
+            ])
+        elif "SELECT" in query_str and "FROM plugin" in query_str:
             plugin_id = f"{params['user_id']}_{params['plugin_slug']}"
             if plugin_id in self.data['plugins']:
                 plugin_data = self.data['plugins'][plugin_id]
                 return MockResult(fetchone_data=MockRow(plugin_data))
             return MockResult(fetchone_data=None)
-        elif "SELECT" in query_str and "module" in query_str:
+        elif "SELECT" in query_str and "FROM module" in query_str:
             modules = []
             for module_id, module_data in self.data['modules'].items():
                 if module_data['plugin_id'] == params['plugin_id']:
@@ -66,14 +157,70 @@ class MockAsyncSession:
 
         return MockResult()
 
+    async def stream(self, query, params=None):
+        """Mock server-side cursor over the installed users or the plugin/module join used by config export"""
+        if "JOIN" not in str(query):
+            return MockStreamResult([MockRow({'user_id': p['user_id']})
+                                     for p in sorted(self.data['plugins'].values(), key=lambda p: p['user_id'])
+                                     if p['plugin_slug'] == params['plugin_slug']])
+        rows = []
+        for plugin_data in sorted(self.data['plugins'].values(), key=lambda p: p['user_id']):
+            if plugin_data['plugin_slug'] != params['plugin_slug']:
+                continue
+            modules = sorted((m for m in self.data['modules'].values() if m['plugin_id'] == plugin_data['id']),
+                             key=lambda m: m['name'])
+            for module_data in modules or [None]:
+                rows.append(MockRow({
+                    'user_id': plugin_data['user_id'],
+                    'plugin_id': plugin_data['id'],
+                    'version': plugin_data['version'],
+                    'plugin_config': plugin_data['config_fields'],
+                    'module_name': module_data['name'] if module_data else None,
+                    'module_config': module_data['config_fields'] if module_data else None
+                }))
+        return MockStreamResult(rows)
+
     async def commit(self):
         """Mock commit method"""
         self.committed = True
+        self.commit_count += 1
+
+    async def begin_nested(self):
+        """Mock savepoint: restores a snapshot of the data on rollback"""
+        return MockSavepoint(self)
 
     async def rollback(self):
         """Mock rollback method"""
         self.rolled_back = True
 
+class MockSavepoint:
+    """Mock nested transaction (savepoint)"""
+
+    def __init__(self, session):
+        import copy
+        self.session = session
+        self.snapshot = copy.deepcopy(session.data)
+        self.is_active = True
+
+    async def commit(self):
+        self.is_active = False
+
+    async def rollback(self):
+        self.session.data = self.snapshot
+        self.is_active = False
+
+class MockStreamResult:
+    """Mock AsyncResult returned by stream()"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.partition_sizes = []
+
+    async def partitions(self, size):
+        for start in range(0, len(self.rows), size):
+            self.partition_sizes.append(len(self.rows[start:start + size]))
+            yield self.rows[start:start + size]
+
 class MockResult:
     """Mock database result"""
 
@@ -95,6 +242,18 @@ class MockRow:
         for key, value in data.items():
             setattr(self, key, value)
 
+@asynccontextmanager
+async def mock_session_factory():
+    """Fresh mock session per use; importable by worker processes as 'test_lifecycle_manager:mock_session_factory'"""
+    yield MockAsyncSession()
+
+@asynccontextmanager
+async def crashing_session_factory():
+    """Like mock_session_factory, but the worker process dies when it reaches user 'crash_user'"""
+    db = MockAsyncSession()
+    db.crash_user_id = "crash_user"
+    yield db
+
 logger = structlog.get_logger()
 
 class OpenAILifecycleManagerTester:
@@ -163,8 +322,8 @@ class OpenAILifecycleManagerTester:
             sys.path.append(str(Path(__file__).parent))
             from lifecycle_manager import OpenAILifecycleManager
 
-            # Initialize manager with test directory
-            manager = OpenAILifecycleManager(str(self.temp_dir))
+            # Initialize manager with test directory, building from the mock plugin files
+            manager = OpenAILifecycleManager(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
 
             # Test 1: Plugin Installation
             await self._test_plugin_installation(manager)
@@ -181,6 +340,81 @@ class OpenAILifecycleManagerTester:
             # Test 5: File Operations
             await self._test_file_operations(manager)
 
+            # Test 6: Model Catalog Cache
+            await self._test_model_catalog()
+
+            # Test 7: Completion Cache
+            await self._test_completion_cache(manager)
+
+            # Test 8: Request Scheduler
+            await self._test_request_scheduler()
+
+            # Test 9: Context Window Trimming
+            await self._test_context_window(manager)
+
+            # Test 10: Conversation Store
+            await self._test_conversation_store(manager)
+
+            # Test 11: Staged Version Activation
+            await self._test_version_activation(manager)
+
+            # Test 12: Version Garbage Collection
+            await self._test_version_gc(manager)
+
+            # Test 13: Precompressed Bundle Artifacts
+            await self._test_bundle_artifacts(manager)
+
+            # Test 14: Bundle Server
+            await self._test_bundle_server(manager)
+
+            # Test 15: File Watcher Invalidation
+            await self._test_file_watcher(manager)
+
+            # Test 16: Event Loop Responsiveness During Install
+            await self._test_event_loop_lag(OpenAILifecycleManager)
+
+            # Test 17: Batch Runner
+            await self._test_batch_runner(OpenAILifecycleManager)
+
+            # Test 18: Fleet Update Check
+            await self._test_update_checker(OpenAILifecycleManager)
+
+            # Test 19: Delta Version Builds
+            await self._test_version_delta(OpenAILifecycleManager)
+
+            # Test 20: Module Definition Templates
+            await self._test_module_templates(OpenAILifecycleManager)
+
+            # Test 21: Unit of Work
+            await self._test_unit_of_work(OpenAILifecycleManager)
+
+            # Test 22: Streaming Config Export/Import
+            await self._test_config_export(OpenAILifecycleManager)
+
+            # Test 23: Lazy Installation
+            await self._test_lazy_install(OpenAILifecycleManager)
+
+            # Test 24: Compact Active Users
+            await self._test_compact_active_users(OpenAILifecycleManager)
+
+            # Test 25: State Reconciler
+            await self._test_reconciler(OpenAILifecycleManager)
+
+            # Test 26: Sharded Runner
+            await self._test_sharded_runner()
+
+            # Test 27: Integrity Verification
+            await self._test_integrity_verification(OpenAILifecycleManager)
+
+            # Test 28: Trace Spans
+            await self._test_trace_spans(OpenAILifecycleManager)
+
+            # Test 29: Warm Start
+            await self._test_warm_start(OpenAILifecycleManager)
+
+            # Test 30: Release Packaging
+            await self._test_release_packaging(OpenAILifecycleManager)
+
             # Compile results
             passed_tests = sum(1 for result in self.test_results if result['passed'])
             total_tests = len(self.test_results)
@@ -378,6 +612,1919 @@ class OpenAILifecycleManagerTester:
                 'error': str(e)
             })
 
+    async def _test_model_catalog(self):
+        """Test model catalog caching and ETag revalidation"""
+        try:
+            from model_catalog import ModelCatalogCache
+
+            now = [0.0]
+            calls = []
+            body = json.dumps({'data': [
+                {'id': 'gpt-4o'}, {'id': 'whisper-1'}, {'id': 'o3-mini'}, {'id': 'gpt-3.5-turbo'}
+            ]}).encode()
+
+            async def fake_fetcher(url, headers):
+                calls.append(dict(headers))
+                if headers.get('If-None-Match') == '"v1"':
+                    return 304, {'ETag': '"v1"'}, b''
+                return 200, {'ETag': '"v1"'}, body
+
+            catalog = ModelCatalogCache(fetcher=fake_fetcher, fresh_ttl=10, stale_ttl=10,
+                                        clock=lambda: now[0])
+
+            first = await catalog.get_chat_models('sk-test')
+            second = await catalog.get_models('sk-test')
+            now[0] = 15  # stale: served immediately, revalidated in background
+            stale = await catalog.get_models('sk-test')
+            await asyncio.sleep(0)
+            now[0] = 40  # expired: revalidated synchronously
+            expired = await catalog.get_models('sk-test')
+
+            success = (
+                [m['value'] for m in first] == ['gpt-3.5-turbo', 'gpt-4o', 'o3-mini'] and
+                second['cache'] == 'hit' and
+                stale['cache'] == 'stale' and
+                expired['cache'] == 'revalidated' and
+                len(calls) == 3 and
+                calls[1].get('If-None-Match') == '"v1"' and
+                catalog.get_stats()['not_modified'] == 2
+            )
+
+            self.test_results.append({
+                'test_name': 'Model Catalog Cache',
+                'passed': success,
+                'details': catalog.get_stats(),
+                'error': None if success else 'Unexpected cache behaviour'
+            })
+
+            if success:
+                logger.info("✓ Model catalog cache test passed")
+            else:
+                logger.error("✗ Model catalog cache test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Model catalog cache test error: {e}")
+            self.test_results.append({
+                'test_name': 'Model Catalog Cache',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_completion_cache(self, manager):
+        """Test deterministic completion caching and its disk tier"""
+        try:
+            from completion_cache import CompletionCache
+
+            chat_module = next(m for m in manager.module_data if m['name'] == 'ComponentOpenAIChat')
+            disabled = CompletionCache.from_config(chat_module['config_fields'])
+
+            disk_path = self.temp_dir / "completion_cache"
+            cache = CompletionCache.from_config(
+                {'response_cache_enabled': True, 'response_cache_disk': True,
+                 'response_cache_max_entries': 1},
+                disk_path=disk_path
+            )
+
+            upstream_calls = []
+
+            async def fetch(request):
+                upstream_calls.append(request)
+                return {'choices': [{'message': {'role': 'assistant', 'content': 'Hi!'}}],
+                        'usage': {'total_tokens': 12}}
+
+            greeting = {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'Hello'}],
+                        'max_tokens': 100, 'temperature': 0}
+            other = dict(greeting, messages=[{'role': 'user', 'content': 'Bye'}])
+            creative = dict(greeting, temperature=0.7)
+
+            await cache.get_or_fetch(greeting, fetch, 'sk-a')
+            await cache.get_or_fetch(dict(greeting, user='someone-else'), fetch, 'sk-a')
+            await cache.get_or_fetch(other, fetch, 'sk-a')     # evicts greeting from memory
+            await cache.get_or_fetch(greeting, fetch, 'sk-a')  # served from disk
+            await cache.get_or_fetch(creative, fetch, 'sk-a')
+            await cache.get_or_fetch(creative, fetch, 'sk-a')
+            # Unparseable temperatures bypass the cache instead of raising
+            await cache.get_or_fetch(dict(greeting, temperature='zero'), fetch, 'sk-a')
+            await cache.get_or_fetch(dict(greeting, temperature=[0]), fetch, 'sk-a')
+            # Other credentials never see sk-a's entries; no key means no caching
+            await cache.get_or_fetch(greeting, fetch, 'sk-b')
+            await cache.get_or_fetch(greeting, fetch, 'sk-a', organization='org-2')
+            await cache.get_or_fetch(greeting, fetch)
+
+            shared = CompletionCache(share_across_keys=True)
+            await shared.get_or_fetch(greeting, fetch, 'sk-a')
+            await shared.get_or_fetch(greeting, fetch, 'sk-b')
+
+            stats = cache.get_stats()
+            success = (
+                disabled is None and
+                len(upstream_calls) == 10 and
+                shared.get_stats()['hits'] == 1 and
+                stats['hits'] == 1 and
+                stats['disk_hits'] == 1 and
+                stats['bypassed'] == 5 and
+                stats['disk_bytes'] > 0 and
+                stats['tokens_saved'] == 24 and
+                stats['bytes_saved'] > 0
+            )
+
+            self.test_results.append({
+                'test_name': 'Completion Cache',
+                'passed': success,
+                'details': stats,
+                'error': None if success else 'Unexpected cache behaviour'
+            })
+
+            if success:
+                logger.info("✓ Completion cache test passed")
+            else:
+                logger.error("✗ Completion cache test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Completion cache test error: {e}")
+            self.test_results.append({
+                'test_name': 'Completion Cache',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_request_scheduler(self):
+        """Test fair queuing and Retry-After handling in the request scheduler"""
+        try:
+            from request_scheduler import RequestScheduler, RetryableUpstreamError
+
+            sleeps = []
+
+            async def fake_sleep(delay):
+                sleeps.append(delay)
+
+            scheduler = RequestScheduler(max_concurrency=1, sleep=fake_sleep)
+            order = []
+
+            def make_call(user_id, index):
+                async def call():
+                    order.append(user_id)
+                    await asyncio.sleep(0)
+                    return index
+                return call
+
+            # user_a floods the queue first; user_b must not wait behind all of it
+            tasks = [scheduler.submit('sk-test', 'user_a', make_call('user_a', i)) for i in range(4)]
+            tasks.append(scheduler.submit('sk-test', 'user_b', make_call('user_b', 0)))
+            await asyncio.gather(*tasks)
+
+            attempts = []
+
+            async def throttled_call():
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise RetryableUpstreamError('rate limited', status=429, retry_after=0.01)
+                return 'ok'
+
+            retried = await scheduler.submit('sk-test', 'user_a', throttled_call)
+            metrics = scheduler.get_metrics()
+
+            success = (
+                order.index('user_b') <= 2 and
+                retried == 'ok' and
+                len(attempts) == 2 and
+                sleeps and sleeps[0] >= 0.01 and
+                metrics['throttled'] == 1 and
+                metrics['completed'] == 6 and
+                metrics['in_flight'] == 0
+            )
+
+            self.test_results.append({
+                'test_name': 'Request Scheduler',
+                'passed': success,
+                'details': metrics,
+                'error': None if success else f'Unexpected scheduling order {order}'
+            })
+
+            if success:
+                logger.info("✓ Request scheduler test passed")
+            else:
+                logger.error("✗ Request scheduler test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Request scheduler test error: {e}")
+            self.test_results.append({
+                'test_name': 'Request Scheduler',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_context_window(self, manager):
+        """Test incremental token estimation and history trimming"""
+        try:
+            from context_window import ContextWindowManager
+
+            chat_module = next(m for m in manager.module_data if m['name'] == 'ComponentOpenAIChat')
+            context = ContextWindowManager.from_config(
+                dict(chat_module['config_fields'], max_context_tokens=1000), summarizer=None
+            )
+            context.safety_margin = 0
+
+            history = [{'role': 'system', 'content': 'You are helpful.'}]
+            for turn in range(40):
+                history.append({'role': 'user', 'content': f'Question {turn} ' + 'word ' * 40})
+                history.append({'role': 'assistant', 'content': f'Answer {turn} ' + 'word ' * 40})
+
+            first = await context.prepare('conv-1', history[:3], 'gpt-4o', 500)
+            estimated_before = context.stats['messages_estimated']
+            second = await context.prepare('conv-1', history, 'gpt-4o', 500)
+            newly_estimated = context.stats['messages_estimated'] - estimated_before
+
+            async def summarizer(messages):
+                return f'{len(messages)} earlier messages'
+
+            context.summarizer = summarizer
+            summarized = await context.prepare('conv-1', history, 'gpt-4o', 500)
+
+            success = (
+                first['dropped'] == 0 and
+                newly_estimated == len(history) - 3 and
+                second['dropped'] > 0 and
+                second['messages'][0]['role'] == 'system' and
+                second['messages'][-1] == history[-1] and
+                second['estimated_tokens'] <= context.prompt_budget('gpt-4o', 500) and
+                summarized['summarized'] and
+                summarized['estimated_tokens'] <= context.prompt_budget('gpt-4o', 500)
+            )
+
+            self.test_results.append({
+                'test_name': 'Context Window Trimming',
+                'passed': success,
+                'details': context.get_stats(),
+                'error': None if success else 'Unexpected trimming result'
+            })
+
+            if success:
+                logger.info("✓ Context window trimming test passed")
+            else:
+                logger.error("✗ Context window trimming test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Context window trimming test error: {e}")
+            self.test_results.append({
+                'test_name': 'Context Window Trimming',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_conversation_store(self, manager):
+        """Test append-only conversation log with cursor paging"""
+        try:
+            from conversation_store import ConversationStore
+
+            store = manager.conversation_store
+            store.segment_max_bytes = 2048  # force several segments
+
+            await store.append(self.test_user_id, 'conv-1', {'role': 'user', 'content': 'first'})
+            await store.append_many(self.test_user_id, 'conv-1', [
+                {'role': 'assistant' if i % 2 else 'user', 'content': f'message {i}'} for i in range(1, 300)
+            ])
+
+            latest = await store.get_messages(self.test_user_id, 'conv-1', limit=20)
+            older = await store.get_messages(self.test_user_id, 'conv-1', limit=20, before=latest['next_cursor'])
+
+            # A fresh instance must read the same history back from disk
+            reopened = ConversationStore(store.root_path)
+            oldest = await reopened.get_messages(self.test_user_id, 'conv-1', limit=5, before='5')
+            conversations = await reopened.list_conversations(self.test_user_id)
+            segments = list(store.conversation_dir(self.test_user_id, 'conv-1').glob('seg-*.log'))
+
+            # Deleting a user waits for an in-flight append instead of racing it
+            batch = [{'role': 'user', 'content': f'racing {i}'} for i in range(200)]
+            await asyncio.gather(store.append_many('conv_race_user', 'conv-1', batch),
+                                 store.delete_user('conv_race_user'))
+            raced = await store.get_messages('conv_race_user', 'conv-1', limit=1)
+
+            # Uninstalling removes the user's chat history with their rows
+            db = MockAsyncSession()
+            await manager._create_database_records('conv_uninstall_user', db)
+            await store.append('conv_uninstall_user', 'conv-1', {'role': 'user', 'content': 'bye'})
+            uninstalled = await manager._perform_user_uninstallation('conv_uninstall_user', db)
+            remaining = await store.list_conversations('conv_uninstall_user')
+
+            # Inside a unit of work the history waits for the caller's commit
+            deferred = {}
+            for user_id, committed in (('conv_rollback_user', False), ('conv_commit_user', True)):
+                await manager._create_database_records(user_id, db)
+                await store.append(user_id, 'conv-1', {'role': 'user', 'content': 'hi'})
+                async with manager.unit_of_work(db):
+                    await manager._perform_user_uninstallation(user_id, db)
+                    before_commit = await store.list_conversations(user_id)
+                    if committed:
+                        await db.commit()
+                        await manager.run_post_commit(db)
+                    else:
+                        await db.rollback()
+                        manager.discard_post_commit(db)
+                deferred[user_id] = (len(before_commit), len(await store.list_conversations(user_id)))
+
+            # A failed file deletion does not fail the committed uninstall
+            await manager._create_database_records('conv_stuck_user', db)
+            original_delete = store.delete_user
+
+            async def failing_delete(user_id):
+                raise PermissionError("read-only")
+            store.delete_user = failing_delete
+            try:
+                stuck = await manager._perform_user_uninstallation('conv_stuck_user', db)
+            finally:
+                store.delete_user = original_delete
+
+            success = (
+                latest['total'] == 300 and
+                [m['seq'] for m in latest['messages']] == list(range(280, 300)) and
+                latest['messages'][-1]['content'] == 'message 299' and
+                [m['seq'] for m in older['messages']] == list(range(260, 280)) and
+                oldest['messages'][0]['content'] == 'first' and
+                oldest['next_cursor'] is None and
+                conversations[0]['message_count'] == 300 and
+                len(segments) > 1 and
+                raced['total'] in (0, 200) and
+                uninstalled['success'] and remaining == [] and
+                deferred == {'conv_rollback_user': (1, 1), 'conv_commit_user': (1, 0)} and
+                stuck['success']
+            )
+
+            self.test_results.append({
+                'test_name': 'Conversation Store',
+                'passed': success,
+                'details': {'segments': len(segments), 'total': latest['total']},
+                'error': None if success else 'Unexpected paging result'
+            })
+
+            if success:
+                logger.info("✓ Conversation store test passed")
+            else:
+                logger.error("✗ Conversation store test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Conversation store test error: {e}")
+            self.test_results.append({
+                'test_name': 'Conversation Store',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_version_activation(self, manager):
+        """Test staged publishing, validation gating and rollback"""
+        try:
+            bundle = manager.source_dir / "dist" / "remoteEntry.js"
+            original_bundle = bundle.read_text()
+
+            first = await manager.publish_shared_version(self.test_user_id)
+            bundle.write_text("// Mock OpenAIPlugin bundle v2")
+            second = await manager.publish_shared_version(self.test_user_id)
+            served_after_update = (manager.shared_path / "dist" / "remoteEntry.js").read_text()
+
+            # An invalid build must never replace the live version
+            bundle.write_text("")
+            rejected = await manager.publish_shared_version(self.test_user_id)
+            served_after_rejection = (manager.shared_path / "dist" / "remoteEntry.js").read_text()
+
+            rollback = await manager.rollback_version()
+            served_after_rollback = (manager.shared_path / "dist" / "remoteEntry.js").read_text()
+            bundle.write_text(original_bundle)
+
+            staging_left = list(manager.version_store.staging_path.iterdir())
+
+            success = (
+                first['success'] and second['success'] and
+                not rejected['success'] and
+                served_after_update == "// Mock OpenAIPlugin bundle v2" and
+                served_after_rejection == served_after_update and
+                rollback['success'] and rollback['build'] == first['build'] and
+                served_after_rollback == original_bundle and
+                manager.version_store.active_build().name == first['build'] and
+                manager.shared_path.is_symlink() and
+                not staging_left
+            )
+
+            self.test_results.append({
+                'test_name': 'Staged Version Activation',
+                'passed': success,
+                'details': {'builds': manager.version_store.list_builds()},
+                'error': None if success else 'Unexpected activation result'
+            })
+
+            if success:
+                logger.info("✓ Staged version activation test passed")
+            else:
+                logger.error("✗ Staged version activation test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Staged version activation test error: {e}")
+            self.test_results.append({
+                'test_name': 'Staged Version Activation',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_version_gc(self, manager):
+        """Test reference-counted collection of unused shared versions"""
+        try:
+            db = MockAsyncSession()
+            await manager._create_database_records("gc_user", db)
+
+            # An old version nobody uses any more
+            store = manager.version_store
+            staging = store.create_staging("v0.9.0")
+            (staging / "dist").mkdir()
+            (staging / "dist" / "remoteEntry.js").write_bytes(b"x" * 100000)
+            # Shared with the active build: deleting this link frees nothing
+            linked_source = manager.shared_path / "dist" / "gc_linked.js"
+            linked_source.write_bytes(b"z" * 200000)
+            os.link(linked_source, staging / "dist" / "linked.js")
+            linked_size = linked_source.stat().st_size
+            store.commit(staging, "v0.9.0", activate=False)
+
+            dry_run = await manager.collect_unused_versions(db, dry_run=True)
+            report = await manager.collect_unused_versions(db, bytes_per_second=0)
+
+            # Background mode: one task at a time, on its own session
+            staging = store.create_staging("v0.8.0")
+            (staging / "old.js").write_bytes(b"y" * 1000)
+            store.commit(staging, "v0.8.0", activate=False)
+
+            @asynccontextmanager
+            async def session_factory():
+                yield db
+
+            without_factory = await manager.collect_unused_versions(db, background=True)
+            scheduled = await manager.collect_unused_versions(db, background=True, bytes_per_second=0,
+                                                              session_factory=session_factory)
+            repeat = await manager.collect_unused_versions(db, background=True, session_factory=session_factory)
+            background_report = await manager.version_gc._task
+
+            success = (
+                dry_run['success'] and dry_run['bytes_reclaimed'] == 0 and
+                'v0.9.0' in dry_run['stale_pointers'] and
+                report['success'] and
+                report['user_counts'] == {'v1.0.0': 1} and
+                100000 <= report['bytes_reclaimed'] < 100000 + linked_size and
+                linked_source.exists() and linked_source.stat().st_nlink == 1 and
+                not without_factory['success'] and
+                scheduled['scheduled'] and repeat['running'] and
+                background_report['bytes_reclaimed'] >= 1000 and
+                not (store.plugin_root / "v0.8.0").exists() and
+                not (store.plugin_root / "v0.9.0").exists() and
+                (manager.shared_path / "dist" / "remoteEntry.js").exists() and
+                not list((store.plugin_root / ".trash").iterdir())
+            )
+            linked_source.unlink()
+
+            self.test_results.append({
+                'test_name': 'Version Garbage Collection',
+                'passed': success,
+                'details': report,
+                'error': None if success else 'Unexpected collection result'
+            })
+
+            if success:
+                logger.info("✓ Version garbage collection test passed")
+            else:
+                logger.error("✗ Version garbage collection test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Version garbage collection test error: {e}")
+            self.test_results.append({
+                'test_name': 'Version Garbage Collection',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_bundle_artifacts(self, manager):
+        """Test precompressed variants and the asset manifest written at publish"""
+        try:
+            import gzip
+            from bundle_artifacts import load_asset_manifest, select_variant
+
+            bundle = manager.source_dir / "dist" / "remoteEntry.js"
+            original_bundle = bundle.read_text()
+            bundle.write_text("console.log('OpenAIPlugin loaded');\n" * 200)
+            (manager.source_dir / "dist" / "main.3f2a9c1b.js").write_text("var chunk = 1;\n" * 100)
+            result = await manager.publish_shared_version(self.test_user_id)
+            bundle.write_text(original_bundle)
+            (manager.source_dir / "dist" / "main.3f2a9c1b.js").unlink()
+
+            manifest = load_asset_manifest(manager.shared_path)
+            entry = manifest['files']['remoteEntry.js']
+            gz_path = manager.shared_path / "dist" / entry['variants']['gzip']['file']
+
+            success = (
+                result['success'] and
+                result['artifacts']['compressed_bytes'] < result['artifacts']['original_bytes'] and
+                gzip.decompress(gz_path.read_bytes()) == (manager.shared_path / "dist" / "remoteEntry.js").read_bytes() and
+                entry['etag'].startswith('"') and
+                'immutable' not in entry['cache_control'] and
+                'immutable' in manifest['files']['main.3f2a9c1b.js']['cache_control'] and
+                select_variant(entry, 'gzip, deflate') == 'gzip' and
+                select_variant(entry, 'gzip;q=0, identity') is None
+            )
+
+            self.test_results.append({
+                'test_name': 'Precompressed Bundle Artifacts',
+                'passed': success,
+                'details': result.get('artifacts', {}),
+                'error': None if success else 'Unexpected artifact output'
+            })
+
+            if success:
+                logger.info("✓ Precompressed bundle artifacts test passed")
+            else:
+                logger.error("✗ Precompressed bundle artifacts test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Precompressed bundle artifacts test error: {e}")
+            self.test_results.append({
+                'test_name': 'Precompressed Bundle Artifacts',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_bundle_server(self, manager):
+        """Test cached, conditional and ranged bundle serving across a version switch"""
+        try:
+            import gzip
+
+            server = manager.bundle_server
+            bundle_bytes = (manager.shared_path / "dist" / "remoteEntry.js").read_bytes()
+
+            full = server.get_asset("remoteEntry.js", {'Accept-Encoding': 'gzip, br;q=0'})
+            again = server.get_asset("remoteEntry.js", {'Accept-Encoding': 'gzip'})
+            conditional = server.get_asset("remoteEntry.js", {'If-None-Match': full['headers']['ETag'],
+                                                               'Accept-Encoding': 'gzip'})
+            partial = server.get_asset("dist/remoteEntry.js", {'Range': 'bytes=0-9'})
+            unsatisfiable = server.get_asset("remoteEntry.js", {'Range': 'bytes=999999-'})
+            escaped = server.get_asset("../package.json")
+
+            # Publishing a new build must be visible on the next request
+            bundle = manager.source_dir / "dist" / "remoteEntry.js"
+            original_bundle = bundle.read_text()
+            bundle.write_text("// switched bundle")
+            await manager.publish_shared_version(self.test_user_id)
+            switched = server.get_asset("remoteEntry.js")
+            bundle.write_text(original_bundle)
+
+            # The coroutine variant reads misses on the filesystem executor, then serves from cache
+            from bundle_server import BundleServer
+            async_server = BundleServer(manager.shared_path.parent, fs=manager.fs)
+            fetched = await async_server.fetch_asset("remoteEntry.js")
+            refetched = await async_server.fetch_asset("remoteEntry.js", {'Range': 'bytes=0-9'})
+            fetched_missing = await async_server.fetch_asset("missing.js")
+
+            success = (
+                full['status'] == 200 and
+                full['headers'].get('Content-Encoding') == 'gzip' and
+                gzip.decompress(bytes(full['body'])) == bundle_bytes and
+                server.get_stats()['cache_hits'] >= 1 and
+                again['headers']['ETag'] == full['headers']['ETag'] and
+                conditional['status'] == 304 and
+                partial['status'] == 206 and bytes(partial['body']) == bundle_bytes[:10] and
+                unsatisfiable['status'] == 416 and
+                escaped['status'] == 404 and
+                bytes(switched['body']) == b"// switched bundle" and
+                bytes(fetched['body']) == b"// switched bundle" and
+                refetched['status'] == 206 and bytes(refetched['body']) == b"// switche" and
+                fetched_missing['status'] == 404 and
+                async_server.stats['cache_misses'] == 1 and async_server.stats['cache_hits'] == 1
+            )
+
+            self.test_results.append({
+                'test_name': 'Bundle Server',
+                'passed': success,
+                'details': server.get_stats(),
+                'error': None if success else 'Unexpected bundle response'
+            })
+
+            if success:
+                logger.info("✓ Bundle server test passed")
+            else:
+                logger.error("✗ Bundle server test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Bundle server test error: {e}")
+            self.test_results.append({
+                'test_name': 'Bundle Server',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_file_watcher(self, manager):
+        """Test that watched health/validation caches follow file changes"""
+        try:
+            results = {}
+            for use_inotify in (True, False):
+                pushed = []
+                manager._health_listeners = []
+                manager.add_health_listener(lambda health, reason: pushed.append((health['healthy'], reason)))
+                started = await manager.start_file_watcher(poll_interval=0.05, use_inotify=use_inotify)
+
+                package_json = manager.shared_path / "package.json"
+                original = package_json.read_text()
+                healthy = await manager._get_plugin_health_impl(self.test_user_id, manager.shared_path)
+                cached = await manager._get_plugin_health_impl(self.test_user_id, manager.shared_path)
+
+                package_json.write_text("{ not json")
+                for _ in range(50):
+                    await asyncio.sleep(0.02)
+                    if pushed:
+                        break
+                broken = await manager._get_plugin_health_impl(self.test_user_id, manager.shared_path)
+                validation = await manager._validate_installation_impl(self.test_user_id, manager.shared_path)
+                package_json.write_text(original)
+                await asyncio.sleep(0.2)
+                await manager.stop_file_watcher()
+
+                results[started['mode']] = (
+                    healthy['healthy'] and cached == healthy and
+                    not broken['healthy'] and not validation['valid'] and
+                    pushed and pushed[0][0] is False
+                )
+            manager._health_listeners = []
+
+            # A probe that overlaps a change event must not cache its (stale) result
+            await manager.start_file_watcher(poll_interval=0.05, use_inotify=False)
+
+            async def racing_probe(user_id, plugin_dir):
+                manager._on_plugin_files_changed("changed during probe")
+                return {'healthy': True}
+
+            await manager._cached_probe('race', manager.shared_path, racing_probe, self.test_user_id)
+            results['race'] = ('race', str(manager.shared_path)) not in manager._probe_cache
+            await manager.stop_file_watcher()
+
+            success = results.get('polling', False) and all(results.values())
+
+            self.test_results.append({
+                'test_name': 'File Watcher Invalidation',
+                'passed': success,
+                'details': results,
+                'error': None if success else 'Cached results were not invalidated'
+            })
+
+            if success:
+                logger.info("✓ File watcher invalidation test passed")
+            else:
+                logger.error("✗ File watcher invalidation test failed")
+
+        except Exception as e:
+            logger.error(f"✗ File watcher invalidation test error: {e}")
+            self.test_results.append({
+                'test_name': 'File Watcher Invalidation',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_event_loop_lag(self, manager_class):
+        """Test that a large install leaves the event loop free for status queries"""
+        try:
+            # Build a large plugin source tree: thousands of small files plus a few big ones
+            large_root = self.temp_dir / "large"
+            source_dir = large_root / "OpenAIPlugin"
+            shutil.copytree(self.temp_dir / "OpenAIPlugin", source_dir)
+            for i in range(40):
+                chunk_dir = source_dir / "assets" / f"chunk{i}"
+                chunk_dir.mkdir(parents=True)
+                for j in range(50):
+                    (chunk_dir / f"file{j}.txt").write_text(f"asset {i}/{j}\n" * 20)
+            for i in range(16):
+                (source_dir / "assets" / f"blob{i}.bin").write_bytes(bytes(1024 * 1024))
+            (source_dir / "dist" / "vendor.js").write_text("console.log('vendor');\n" * 40000)
+
+            large_manager = manager_class(str(large_root / "plugins"), source_dir=str(source_dir))
+            status_path = self.temp_dir / "OpenAIPlugin"
+
+            lag_samples = []
+            status_queries = 0
+            done = asyncio.Event()
+
+            async def monitor_lag():
+                loop = asyncio.get_event_loop()
+                while not done.is_set():
+                    started = loop.time()
+                    await asyncio.sleep(0.005)
+                    lag_samples.append(loop.time() - started - 0.005)
+
+            async def query_status():
+                nonlocal status_queries
+                while not done.is_set():
+                    await large_manager._get_plugin_health_impl(self.test_user_id, status_path)
+                    status_queries += 1
+                    await asyncio.sleep(0.01)
+
+            async def install():
+                try:
+                    return await large_manager.publish_shared_version()
+                finally:
+                    done.set()
+
+            publish_result, _, _ = await asyncio.gather(install(), monitor_lag(), query_status())
+
+            max_lag = max(lag_samples) if lag_samples else 0.0
+            copied = sum(1 for p in large_manager.shared_path.rglob('*') if p.is_file())
+            success = (
+                publish_result['success'] and
+                copied >= 2000 and
+                status_queries > 0 and
+                max_lag < 0.2
+            )
+
+            self.test_results.append({
+                'test_name': 'Event Loop Responsiveness',
+                'passed': success,
+                'details': {
+                    'files_copied': copied,
+                    'status_queries': status_queries,
+                    'max_lag_ms': round(max_lag * 1000, 1)
+                },
+                'error': None if success else f'Event loop lag {max_lag * 1000:.1f}ms during install'
+            })
+
+            if success:
+                logger.info("✓ Event loop responsiveness test passed")
+            else:
+                logger.error("✗ Event loop responsiveness test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Event loop responsiveness test error: {e}")
+            self.test_results.append({
+                'test_name': 'Event Loop Responsiveness',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_batch_runner(self, manager_class):
+        """Test batch operations over a stream of user IDs with JSONL output"""
+        try:
+            import io
+            from contextlib import asynccontextmanager
+            from batch_runner import BatchRunner, OPERATIONS, iter_user_ids
+
+            db = MockAsyncSession()
+
+            @asynccontextmanager
+            async def session_factory():
+                yield db
+
+            def make_manager():
+                return manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+
+            user_list = "# fleet\n" + "\n".join(f"batch_user_{i}" for i in range(20)) + "\n\n"
+
+            async def run(manager, operation, target_manager=None):
+                output, progress = io.StringIO(), io.StringIO()
+                runner = BatchRunner(manager, session_factory, operation, concurrency=4, batch_size=7,
+                                     output=output, progress=progress, target_manager=target_manager)
+                summary = await runner.run(iter_user_ids(io.StringIO(user_list)))
+                records = [json.loads(line) for line in output.getvalue().splitlines()]
+                return summary, records, progress.getvalue()
+
+            installer = make_manager()
+            install_summary, install_records, progress_text = await run(installer, "install")
+            status_summary, status_records, _ = await run(installer, "status")
+            export_summary, export_records, _ = await run(installer, "export")
+            # Update moves every user to a target version built once for the run, keeping their config
+            db.data['plugins']["batch_user_3_" + installer.plugin_slug]['config_fields'] = json.dumps({'theme': 'dark'})
+            try:
+                BatchRunner(make_manager(), session_factory, "update")
+                untargeted_rejected = False
+            except ValueError:
+                untargeted_rejected = True
+            target = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"), version="1.1.0")
+            await installer.conversation_store.append("batch_user_5", "conv-1", {'role': 'user', 'content': 'kept'})
+            update_summary, _, _ = await run(make_manager(), "update", target_manager=target)
+            updated = (
+                'update' in OPERATIONS and untargeted_rejected and update_summary['succeeded'] == 20 and
+                all(row['version'] == '1.1.0' for row in db.data['plugins'].values()) and
+                json.loads(db.data['plugins']["batch_user_3_" + installer.plugin_slug]['config_fields']) ==
+                {'theme': 'dark'} and
+                target.version_store.resolve("v1.1.0") is not None and
+                len(await installer.conversation_store.list_conversations("batch_user_5")) == 1
+            )
+            # A fresh manager stands in for a new CLI process that never saw the installs
+            delete_summary, delete_records, _ = await run(make_manager(), "delete")
+
+            success = (
+                install_summary['succeeded'] == 20 and len(install_records) == 20 and
+                all(r['result']['status'] == 'healthy' for r in status_records) and
+                export_summary['succeeded'] == 20 and
+                all('module_configs' in r['result']['data'] for r in export_records) and
+                delete_summary['succeeded'] == 20 and not db.data['plugins'] and
+                'users/s' in progress_text and updated
+            )
+
+            self.test_results.append({
+                'test_name': 'Batch Runner',
+                'passed': success,
+                'details': {
+                    'install': install_summary,
+                    'status': status_summary,
+                    'export': export_summary,
+                    'update': update_summary,
+                    'delete': delete_summary
+                },
+                'error': None if success else 'Batch operations did not complete for every user'
+            })
+
+            if success:
+                logger.info("✓ Batch runner test passed")
+            else:
+                logger.error("✗ Batch runner test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Batch runner test error: {e}")
+            self.test_results.append({
+                'test_name': 'Batch Runner',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+
+    async def _test_update_checker(self, manager_class):
+        """Test one conditional upstream check flagging every user's row"""
+        server = None
+        try:
+            import threading
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+            from update_checker import UpdateChecker
+
+            requests_seen = []
+
+            class FakeReleaseHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    requests_seen.append(self.headers.get('If-None-Match'))
+                    if self.headers.get('If-None-Match') == '"release-1.1.0"':
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                    body = json.dumps({'tag_name': 'v1.1.0', 'name': 'OpenAIPlugin 1.1.0'}).encode()
+                    self.send_response(200)
+                    self.send_header('ETag', '"release-1.1.0"')
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            server = HTTPServer(('127.0.0.1', 0), FakeReleaseHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            release_url = f"http://127.0.0.1:{server.server_port}/repos/OpenAIPlugin/releases/latest"
+
+            manager = manager_class(str(self.temp_dir / "update_check"), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            manager.plugin_data['update_check_url'] = release_url
+
+            db = MockAsyncSession()
+            for i in range(5):
+                await manager._create_database_records(f"update_user_{i}", db)
+            # One user is already on the latest release
+            db.data['plugins'][f"update_user_0_{manager.plugin_slug}"]['version'] = '1.1.0'
+
+            first = await manager.check_for_updates(db)
+            cached = await manager.check_for_updates(db)
+            # Inside a unit of work the caller owns the transaction
+            commits = db.commit_count
+            async with manager.unit_of_work(db):
+                in_unit = await manager.check_for_updates(db)
+            owned = in_unit['success'] and db.commit_count == commits
+            # A failed flag write only rolls back its own savepoint
+            real_execute = db.execute
+
+            async def failing_execute(query, params=None):
+                if "latest_version" in str(query) and "UPDATE plugin SET" in str(query):
+                    raise RuntimeError("flag write failed")
+                return await real_execute(query, params)
+
+            async with manager.unit_of_work(db):
+                await manager._create_database_records("update_user_late", db)
+                db.execute = failing_execute
+                try:
+                    failed = await manager.check_for_updates(db)
+                finally:
+                    db.execute = real_execute
+            contained = (not failed['success'] and not db.rolled_back and
+                         f"update_user_late_{manager.plugin_slug}" in db.data['plugins'])
+            db.data['plugins'].pop(f"update_user_late_{manager.plugin_slug}")
+            # A restarted checker revalidates with the persisted ETag
+            manager._update_checker = UpdateChecker(cache_path=manager.data_path / "update-check.json", min_interval=0)
+            revalidated = await manager.check_for_updates(db)
+
+            flags = {row['user_id']: row['update_available'] for row in db.data['plugins'].values()}
+            success = (
+                first['success'] and first['latest_version'] == '1.1.0' and first['cache'] == 'fetched' and
+                first['rows_updated'] == 5 and first['users_with_update'] == 4 and
+                cached['cache'] == 'hit' and revalidated['cache'] == 'not_modified' and
+                cached['rows_updated'] == 0 and in_unit['rows_updated'] == 0 and
+                revalidated['rows_updated'] == 0 and contained and
+                requests_seen == [None, '"release-1.1.0"'] and owned and
+                flags['update_user_0'] is False and
+                all(flags[f"update_user_{i}"] for i in range(1, 5)) and
+                all(row['latest_version'] == '1.1.0' for row in db.data['plugins'].values())
+            )
+
+            self.test_results.append({
+                'test_name': 'Fleet Update Check',
+                'passed': success,
+                'details': {'first': first, 'revalidated': revalidated, 'upstream_requests': len(requests_seen)},
+                'error': None if success else 'Update flags or conditional requests were wrong'
+            })
+
+            if success:
+                logger.info("✓ Fleet update check test passed")
+            else:
+                logger.error("✗ Fleet update check test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Fleet update check test error: {e}")
+            self.test_results.append({
+                'test_name': 'Fleet Update Check',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    async def _test_version_delta(self, manager_class):
+        """Test that upgrades link unchanged files and write only changed bytes"""
+        try:
+            import tarfile
+            import version_delta
+
+            delta_root = self.temp_dir / "delta"
+            source_dir = delta_root / "OpenAIPlugin"
+            shutil.copytree(self.temp_dir / "OpenAIPlugin", source_dir)
+            (source_dir / "assets").mkdir(exist_ok=True)
+            (source_dir / "assets" / "large.bin").write_bytes(bytes(256 * 1024))
+
+            manager = manager_class(str(delta_root / "plugins"), source_dir=str(source_dir))
+            first = await manager.publish_shared_version()
+            old_build = manager.version_store.resolve(manager.shared_path.name)
+
+            (source_dir / "dist" / "remoteEntry.js").write_text("console.log('OpenAIPlugin v2');")
+            (source_dir / "dist" / "chunk.3f2a9c1b.js").write_text("console.log('new chunk');")
+            (source_dir / "README.md").unlink()
+            second = await manager.publish_shared_version()
+            new_build = manager.version_store.resolve(manager.shared_path.name)
+            report = second.get('delta', {})
+
+            linked = (old_build / "assets" / "large.bin").stat().st_ino == (new_build / "assets" / "large.bin").stat().st_ino
+            rewritten = (new_build / "dist" / "remoteEntry.js").read_text() == "console.log('OpenAIPlugin v2');"
+
+            # Diff the live build against a release archive of the source
+            archive = delta_root / "OpenAIPlugin-release.tar.gz"
+            with tarfile.open(archive, "w:gz") as tf:
+                tf.add(source_dir, arcname="OpenAIPlugin-release")
+            archive_diff = await manager.diff_versions(manager.shared_path.name, str(archive))
+            from_archive = version_delta.build_delta(new_build, archive, delta_root / "from-archive")
+
+            success = (
+                first['success'] and 'delta' not in first and
+                second['success'] and
+                report.get('changed') == ['dist/remoteEntry.js'] and
+                report.get('added') == ['dist/chunk.3f2a9c1b.js'] and
+                report.get('removed') == ['README.md'] and
+                report.get('bytes_saved', 0) >= 256 * 1024 and
+                linked and rewritten and
+                archive_diff['success'] and not archive_diff['changed'] and
+                [e['path'] for e in archive_diff['removed']] == ['lifecycle_manager.py'] and
+                from_archive['bytes_written'] == 0 and
+                (delta_root / "from-archive" / "assets" / "large.bin").exists()
+            )
+
+            self.test_results.append({
+                'test_name': 'Delta Version Builds',
+                'passed': success,
+                'details': {
+                    'bytes_total': report.get('bytes_total'),
+                    'bytes_written': report.get('bytes_written'),
+                    'bytes_saved': report.get('bytes_saved')
+                },
+                'error': None if success else 'Delta build did not match the expected diff'
+            })
+
+            if success:
+                logger.info("✓ Delta version build test passed")
+            else:
+                logger.error("✗ Delta version build test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Delta version build test error: {e}")
+            self.test_results.append({
+                'test_name': 'Delta Version Builds',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_module_templates(self, manager_class):
+        """Test slim per-user module rows merged with shared definitions on read"""
+        try:
+            db = MockAsyncSession()
+            inline = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            templated = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"),
+                                      module_storage="template")
+
+            await inline._create_database_records("inline_user", db)
+            inline_bytes = sum(len(json.dumps(m)) for m in db.data['modules'].values())
+            db.data['modules'].clear()
+
+            for i in range(3):
+                await templated._create_database_records(f"template_user_{i}", db)
+            template_rows = [m for m in db.data['modules'].values() if m['user_id'] == 'template_user_0']
+            template_bytes = sum(len(json.dumps(m)) for m in template_rows)
+
+            # A user override on one config field survives the merge
+            chat_row = next(m for m in template_rows if m['name'] == 'ComponentOpenAIChat')
+            chat_row['config_fields'] = json.dumps({'temperature': {'default': 0.2}})
+
+            fresh_reader = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"),
+                                         module_storage="template")
+            merged = {m['name']: m for m in await fresh_reader.get_user_modules("template_user_0", db)}
+            chat = merged['ComponentOpenAIChat']
+            expected_chat = next(m for m in inline.module_data if m['name'] == 'ComponentOpenAIChat')
+
+            success = (
+                len(db.data.get('module_definitions', {})) == 2 and
+                all(m['definition_id'] and m['props'] is None for m in db.data['modules'].values()) and
+                template_bytes * 2 < inline_bytes and
+                chat['layout'] == expected_chat['layout'] and
+                chat['tags'] == expected_chat['tags'] and
+                chat['config_fields']['temperature'] == dict(expected_chat['config_fields']['temperature'], default=0.2) and
+                chat['config_fields']['max_tokens'] == expected_chat['config_fields']['max_tokens'] and
+                merged['ComponentOpenAIStatus']['required_services'] == {'api': {'methods': ['get'], 'version': '1.0.0'}}
+            )
+
+            self.test_results.append({
+                'test_name': 'Module Definition Templates',
+                'passed': success,
+                'details': {'inline_row_bytes': inline_bytes, 'template_row_bytes': template_bytes},
+                'error': None if success else 'Template rows or merged read path were wrong'
+            })
+
+            if success:
+                logger.info("✓ Module definition template test passed")
+            else:
+                logger.error("✗ Module definition template test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Module definition template test error: {e}")
+            self.test_results.append({
+                'test_name': 'Module Definition Templates',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_unit_of_work(self, manager_class):
+        """Test caller-controlled transactions with per-user savepoints"""
+        try:
+            import io
+            from contextlib import asynccontextmanager
+            from batch_runner import BatchRunner
+
+            manager = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            db = MockAsyncSession()
+            db.fail_user_id = "uow_user_2"
+
+            async with manager.unit_of_work(db):
+                results = [await manager._create_database_records(f"uow_user_{i}", db) for i in range(5)]
+                commits_inside = db.commit_count
+                await db.commit()
+
+            installed = sorted(p['user_id'] for p in db.data['plugins'].values())
+            isolated = (
+                commits_inside == 0 and db.commit_count == 1 and
+                [r['success'] for r in results] == [True, True, False, True, True] and
+                installed == ['uow_user_0', 'uow_user_1', 'uow_user_3', 'uow_user_4'] and
+                not any(m['user_id'] == 'uow_user_2' for m in db.data['modules'].values())
+            )
+
+            # Outside a unit of work the manager still commits per user
+            await manager._create_database_records("uow_user_standalone", db)
+            standalone_commit = db.commit_count == 2
+
+            # Group commit through the batch runner: 2 workers, commit every 5 users
+            group_db = MockAsyncSession()
+
+            @asynccontextmanager
+            async def session_factory():
+                yield group_db
+
+            runner = BatchRunner(manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin")),
+                                 session_factory, "install", concurrency=2, batch_size=100,
+                                 commit_every=5, output=io.StringIO())
+            summary = await runner.run(f"group_user_{i}" for i in range(20))
+            grouped = summary['succeeded'] == 20 and group_db.commit_count == 4 and len(group_db.data['plugins']) == 20
+
+            success = isolated and standalone_commit and grouped
+
+            self.test_results.append({
+                'test_name': 'Unit of Work',
+                'passed': success,
+                'details': {'isolated': isolated, 'standalone_commit': standalone_commit,
+                            'group_commits': group_db.commit_count},
+                'error': None if success else 'Transactions were not controlled by the caller'
+            })
+
+            if success:
+                logger.info("✓ Unit of work test passed")
+            else:
+                logger.error("✗ Unit of work test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Unit of work test error: {e}")
+            self.test_results.append({
+                'test_name': 'Unit of Work',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_config_export(self, manager_class):
+        """Test streaming gzip JSONL export and batched re-import of config_fields"""
+        try:
+            import gzip
+            from config_export import iter_user_configs
+
+            manager = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            db = MockAsyncSession()
+            for i in range(25):
+                await manager._create_database_records(f"export_user_{i:02d}", db)
+                plugin_id = f"export_user_{i:02d}_{manager.plugin_slug}"
+                db.data['plugins'][plugin_id]['config_fields'] = json.dumps({'theme': f"theme-{i}"})
+                db.data['modules'][f"{plugin_id}_ComponentOpenAIChat"]['config_fields'] = json.dumps({'temperature': i / 100})
+
+            streamed = [record async for record in iter_user_configs(db, manager.plugin_slug, chunk_size=7)]
+            export_path = self.temp_dir / "backups" / "configs.jsonl.gz"
+            exported = await manager.export_all_configs(db, str(export_path), chunk_size=7)
+            with gzip.open(export_path, 'rt') as f:
+                lines = [json.loads(line) for line in f]
+
+            # Wipe the configs, then restore them from the backup in batches of 10
+            for row in list(db.data['plugins'].values()) + list(db.data['modules'].values()):
+                row['config_fields'] = json.dumps({})
+            commits_before = db.commit_count
+            imported = await manager.import_all_configs(db, str(export_path), batch_size=10)
+
+            restored = all(
+                json.loads(db.data['plugins'][f"export_user_{i:02d}_{manager.plugin_slug}"]['config_fields']) == {'theme': f"theme-{i}"}
+                and json.loads(db.data['modules'][f"export_user_{i:02d}_{manager.plugin_slug}_ComponentOpenAIChat"]['config_fields']) == {'temperature': i / 100}
+                for i in range(25)
+            )
+
+            success = (
+                len(streamed) == 25 and
+                streamed[3]['modules']['ComponentOpenAIChat'] == {'temperature': 0.03} and
+                set(streamed[3]['modules']) == {'ComponentOpenAIChat', 'ComponentOpenAIStatus'} and
+                exported['success'] and exported['users'] == 25 and lines == streamed and
+                imported['success'] and imported['users'] == 25 and
+                imported['plugins_updated'] == 25 and imported['modules_updated'] == 50 and
+                db.commit_count - commits_before == 3 and
+                restored
+            )
+
+            self.test_results.append({
+                'test_name': 'Streaming Config Export',
+                'passed': success,
+                'details': {'exported': exported, 'imported': imported},
+                'error': None if success else 'Exported or re-imported config did not round-trip'
+            })
+
+            if success:
+                logger.info("✓ Streaming config export test passed")
+            else:
+                logger.error("✗ Streaming config export test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Streaming config export test error: {e}")
+            self.test_results.append({
+                'test_name': 'Streaming Config Export',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_lazy_install(self, manager_class):
+        """Test tenant enablement with per-user rows created on first lookup"""
+        try:
+            db = MockAsyncSession()
+            manager = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            manager.configure_lazy_install(
+                tenant_resolver=lambda user_id: user_id.split(":")[0] if ":" in user_id else None)
+
+            enabled = await manager.enable_for_tenant(db, "acme")
+            rows_after_enable = len(db.data['plugins'])
+
+            # Concurrent first lookups for the same user materialize exactly once
+            statuses = await asyncio.gather(*(manager.get_plugin_status("acme:alice", db) for _ in range(5)))
+            modules = await manager.get_user_modules("acme:bob", db)
+            outsider = await manager.get_plugin_status("globex:carol", db)
+            no_tenant = await manager.get_plugin_status("dave", db)
+
+            # A second process (fresh manager) sees the enablement and the existing rows
+            other_process = manager_class(str(self.temp_dir), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            other_process.configure_lazy_install(
+                tenant_resolver=lambda user_id: user_id.split(":")[0] if ":" in user_id else None)
+            again = await other_process.get_plugin_status("acme:alice", db)
+
+            # An uninstalled user stays uninstalled while the tenant is enabled
+            uninstalled = await manager.delete_plugin("acme:bob", db)
+            after_uninstall = await other_process.get_plugin_status("acme:bob", db)
+
+            # A lost insert race rolls back only its savepoint, not the caller's session
+            db.rolled_back = False
+            db.fail_user_id = "acme:frank"
+            lost_race = await manager.get_plugin_status("acme:frank", db)
+            db.fail_user_id = None
+
+            await manager.disable_for_tenant(db, "acme")
+            after_disable = await manager.get_plugin_status("acme:erin", db)
+
+            success = (
+                enabled['success'] and rows_after_enable == 0 and
+                all(s['exists'] and s['status'] == 'healthy' for s in statuses) and
+                manager._lazy_installer.stats['materialized'] == 2 and
+                {m['name'] for m in modules} == {'ComponentOpenAIStatus', 'ComponentOpenAIChat'} and
+                not outsider['exists'] and not no_tenant['exists'] and
+                again['exists'] and other_process._lazy_installer.stats['materialized'] == 0 and
+                uninstalled['success'] and not after_uninstall['exists'] and
+                other_process._lazy_installer.stats['opted_out'] == 1 and
+                not lost_race['exists'] and not db.rolled_back and
+                not after_disable['exists'] and
+                len(db.data['plugins']) == 1
+            )
+
+            self.test_results.append({
+                'test_name': 'Lazy Installation',
+                'passed': success,
+                'details': {'stats': manager._lazy_installer.get_stats(), 'plugin_rows': len(db.data['plugins'])},
+                'error': None if success else 'Rows were not materialized exactly once on first use'
+            })
+
+            if success:
+                logger.info("✓ Lazy installation test passed")
+            else:
+                logger.error("✗ Lazy installation test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Lazy installation test error: {e}")
+            self.test_results.append({
+                'test_name': 'Lazy Installation',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_compact_active_users(self, manager_class):
+        """Test CompactUserSet against set() semantics, memory use and mmap sharing"""
+        try:
+            import random
+            from user_set import CompactUserSet, benchmark_memory
+
+            # Same answers as a plain set under random churn, with compactions
+            rng = random.Random(7)
+            reference, compact = set(), CompactUserSet(compact_threshold=16)
+            for _ in range(3000):
+                user_id = f"user_{rng.randrange(500)}"
+                if rng.random() < 0.6:
+                    reference.add(user_id)
+                    compact.add(user_id)
+                else:
+                    reference.discard(user_id)
+                    compact.discard(user_id)
+            parity = (
+                set(compact) == reference and len(compact) == len(reference) and
+                all((f"user_{i}" in compact) == (f"user_{i}" in reference) for i in range(600))
+            )
+
+            benchmark = benchmark_memory(100_000, lookups=1000)
+
+            # One process snapshots; another maps it and layers its own changes on top
+            manager = manager_class(str(self.temp_dir))
+            worker = manager_class(str(self.temp_dir))
+            for i in range(1000):
+                manager.active_users.add(f"fleet_user_{i}")
+            worker.active_users.add("worker_only_user")
+            saved = await manager.save_active_users()
+            loaded = await worker.load_active_users()
+            shared_view = (
+                worker.active_users.shared and "fleet_user_999" in worker.active_users and
+                "worker_only_user" in worker.active_users and len(worker.active_users) == 1001
+            )
+            manager.active_users.discard("fleet_user_0")
+            manager.active_users.add("fleet_user_new")
+            await manager.save_active_users()
+            await worker.load_active_users()
+            refreshed = ("fleet_user_0" not in worker.active_users and
+                         "fleet_user_new" in worker.active_users and
+                         "worker_only_user" in worker.active_users)
+
+            # Changes made on the loop while the snapshot file is being written survive the swap
+            manager.active_users.add("fleet_user_pending")
+            saving = asyncio.ensure_future(manager.save_active_users())
+            await asyncio.sleep(0)
+            manager.active_users.add("added_during_save")
+            manager.active_users.discard("fleet_user_1")
+            manager.active_users.discard("fleet_user_pending")
+            during_save = await saving
+            kept_changes = (
+                during_save['success'] and manager.active_users.shared and
+                "added_during_save" in manager.active_users and
+                "fleet_user_1" not in manager.active_users and
+                "fleet_user_pending" not in manager.active_users and
+                "fleet_user_2" in manager.active_users
+            )
+
+            success = (
+                parity and saved['success'] and loaded['success'] and shared_view and refreshed and kept_changes and
+                isinstance(manager.active_users, CompactUserSet) and
+                benchmark['compact']['heap_bytes'] * 2 < benchmark['set']['heap_bytes']
+            )
+
+            self.test_results.append({
+                'test_name': 'Compact Active Users',
+                'passed': success,
+                'details': {'benchmark_100k': benchmark, 'snapshot': saved},
+                'error': None if success else 'Compact set diverged from set() or was not smaller'
+            })
+
+            if success:
+                logger.info(f"✓ Compact active users test passed ({benchmark['ratio']}x smaller than set)")
+            else:
+                logger.error("✗ Compact active users test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Compact active users test error: {e}")
+            self.test_results.append({
+                'test_name': 'Compact Active Users',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_reconciler(self, manager_class):
+        """Test incremental DB/memory/disk reconciliation with a persisted cursor"""
+        try:
+            plugins_dir = self.temp_dir / "reconcile"
+            source_dir = str(self.temp_dir / "OpenAIPlugin")
+            db = MockAsyncSession()
+            manager = manager_class(str(plugins_dir), source_dir=source_dir)
+            await manager.publish_shared_version()
+            for i in range(12):
+                await manager._create_database_records(f"rc_user_{i:02d}", db)
+            for i, row in enumerate(db.data['plugins'].values()):
+                row['updated_at'] = f"2026-01-01 00:00:{i:02d}"
+
+            # A restarted process knows no users; status must still come from the row and the files
+            restarted = manager_class(str(plugins_dir), source_dir=source_dir)
+            status = await restarted.get_plugin_status("rc_user_00", db)
+
+            restarted.reconciler.batch_size = 5
+            restarted.reconciler.memory_batch_size = 5
+            restarted.active_users.add("ghost_user")
+            db.data['modules'].pop("rc_user_03_OpenAIPlugin_ComponentOpenAIChat")
+            cycles = [await restarted.reconcile(db) for _ in range(3)]
+            bounded = [c['rows_scanned'] for c in cycles] == [5, 5, 2] and cycles[-1]['caught_up']
+
+            # A new process resumes from the persisted watermark and sees only newer changes
+            resumed = manager_class(str(plugins_dir), source_dir=source_dir)
+            idle = await resumed.reconcile(db)
+            db.data['plugins']["rc_user_07_OpenAIPlugin"]['updated_at'] = "2026-01-02 00:00:00"
+            changed = await resumed.reconcile(db)
+
+            # An install committing while the membership query is in flight must not be dropped
+            racing = manager_class(str(plugins_dir), source_dir=source_dir)
+            racing.active_users.add("late_user")
+            original_execute = db.execute
+
+            async def execute_with_concurrent_install(query, params=None):
+                result = await original_execute(query, params)
+                if "user_id IN" in str(query):
+                    await racing._create_database_records("late_user", db)
+                    racing.active_users.add("late_user")
+                return result
+            db.execute = execute_with_concurrent_install
+            raced = await racing.reconcile(db)
+            db.execute = original_execute
+
+            success = (
+                status['status'] == 'healthy' and status['files_exist'] and
+                "rc_user_00" in restarted.active_users and bounded and
+                all(f"rc_user_{i:02d}" in restarted.active_users for i in range(12)) and
+                "ghost_user" not in restarted.active_users and
+                list(restarted.reconciler.flagged) == ["rc_user_03_OpenAIPlugin"] and
+                all(c['versions_checked'] <= 1 for c in cycles) and
+                idle['rows_scanned'] == 0 and
+                changed['rows_scanned'] == 1 and changed['activated'] == ["rc_user_07"] and
+                "late_user" in racing.active_users and "late_user" not in raced['deactivated']
+            )
+
+            self.test_results.append({
+                'test_name': 'State Reconciler',
+                'passed': success,
+                'details': {'cycles': cycles, 'stats': restarted.reconciler.get_stats()},
+                'error': None if success else 'Drift was not repaired or flagged incrementally'
+            })
+
+            if success:
+                logger.info("✓ State reconciler test passed")
+            else:
+                logger.error("✗ State reconciler test failed")
+
+        except Exception as e:
+            logger.error(f"✗ State reconciler test error: {e}")
+            self.test_results.append({
+                'test_name': 'State Reconciler',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_sharded_runner(self):
+        """Test partitioning users across worker processes with aggregated output"""
+        try:
+            import io
+            from sharded_runner import ShardedRunner, benchmark_speedup, shard_for
+
+            runner_args = {
+                'session_factory': 'test_lifecycle_manager:mock_session_factory',
+                'plugins_dir': str(self.temp_dir / "sharded"),
+                'source_dir': str(self.temp_dir / "OpenAIPlugin")
+            }
+            output, progress = io.StringIO(), io.StringIO()
+            user_ids = [f"shard_user_{i}" for i in range(60)] + ["shard_user_5"]
+            runner = ShardedRunner("install", workers=3, batch_size=8, concurrency=4,
+                                   output=output, progress=progress, **runner_args)
+            summary = await runner.run(iter(user_ids))
+            records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+            expected_per_worker = [0, 0, 0]
+            for user_id in user_ids:
+                expected_per_worker[shard_for(user_id, 3)] += 1
+            installed = sorted(r['user_id'] for r in records if r['success'])
+            # The duplicate lands on the worker that already installed it and is rejected there
+            duplicate = [r for r in records if r['user_id'] == "shard_user_5"]
+
+            benchmark = await asyncio.get_event_loop().run_in_executor(
+                None, lambda: benchmark_speedup(40, (1, 2), **runner_args))
+            # Runs with failures (here: deleting users the per-session mock DB never holds) report no speedup
+            try:
+                await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: benchmark_speedup(4, (1,), operation="delete", **runner_args))
+                failed_benchmark_refused = False
+            except RuntimeError:
+                failed_benchmark_refused = True
+
+            # A worker that dies mid-shard: its unreported users come back as failed, not lost
+            crash_output = io.StringIO()
+            crash_users = [f"crash_shard_user_{i}" for i in range(40)] + ["crash_user"]
+            crash_runner = ShardedRunner("install", workers=2, batch_size=4, concurrency=2, output=crash_output,
+                                         **dict(runner_args, session_factory='test_lifecycle_manager:crashing_session_factory'))
+            crash_summary = await crash_runner.run(iter(crash_users))
+            crash_records = [json.loads(line) for line in crash_output.getvalue().splitlines()]
+            crashed_shard = shard_for("crash_user", 2)
+            crash_ok = (
+                crash_summary['processed'] == len(crash_users) and
+                sorted(r['user_id'] for r in crash_records) == sorted(crash_users) and
+                not next(r for r in crash_records if r['user_id'] == "crash_user")['success'] and
+                list(crash_summary['worker_errors']) == [str(crashed_shard)] and
+                all(r['success'] for r in crash_records if shard_for(r['user_id'], 2) != crashed_shard)
+            )
+
+            success = (
+                summary['processed'] == 61 and summary['succeeded'] == 60 and summary['failed'] == 1 and
+                summary['per_worker'] == expected_per_worker and not summary['worker_errors'] and
+                installed == sorted(set(user_ids)) and
+                sorted(r['success'] for r in duplicate) == [False, True] and
+                "across 3 workers" in progress.getvalue() and
+                [run['workers'] for run in benchmark['runs']] == [1, 2] and
+                all(run['failed'] == 0 for run in benchmark['runs']) and failed_benchmark_refused and
+                crash_ok
+            )
+
+            self.test_results.append({
+                'test_name': 'Sharded Runner',
+                'passed': success,
+                'details': {'summary': summary, 'benchmark': benchmark},
+                'error': None if success else 'Users were not processed exactly once across shards'
+            })
+
+            if success:
+                logger.info("✓ Sharded runner test passed")
+            else:
+                logger.error("✗ Sharded runner test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Sharded runner test error: {e}")
+            self.test_results.append({
+                'test_name': 'Sharded Runner',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_integrity_verification(self, manager_class):
+        """Test stat-cached manifest verification of a published build"""
+        try:
+            import os
+            source_dir = self.temp_dir / "IntegritySource"
+            shutil.copytree(self.temp_dir / "OpenAIPlugin", source_dir)
+            for i in range(2000):
+                asset = source_dir / "assets" / f"chunk_{i // 100}" / f"asset_{i}.js"
+                asset.parent.mkdir(parents=True, exist_ok=True)
+                asset.write_text(f"// asset {i}\n" * 50)
+
+            manager = manager_class(str(self.temp_dir / "integrity"), source_dir=str(source_dir))
+            await manager.publish_shared_version()
+            build = manager.version_store.resolve(manager.shared_path.name)
+
+            first = await manager.verify_integrity()
+            unchanged = await manager.verify_integrity()
+
+            # Publish hashes the build itself: stats are never stamped onto bytes that differ from the source
+            from version_delta import load_stored_manifest, with_build_stats
+            stored = load_stored_manifest(build)
+            source_entry = {'size': stored['package.json']['size'], 'sha256': "0" * 64}
+            try:
+                with_build_stats(build, {'package.json': source_entry})
+                mismatch_rejected = False
+            except ValueError:
+                mismatch_rejected = True
+
+            # Touched but identical: re-hashed once, still ok
+            touched = build / "assets" / "chunk_3" / "asset_300.js"
+            os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+            after_touch = await manager.verify_integrity()
+
+            # Same size, different bytes; a deleted file; an unexpected file
+            tampered = build / "dist" / "remoteEntry.js"
+            tampered.write_text(tampered.read_text().replace("loaded", "LOADED"))
+            (build / "assets" / "chunk_0" / "asset_1.js").unlink()
+            (build / "assets" / "injected.js").write_text("evil()")
+            broken = await manager.verify_integrity()
+
+            success = (
+                first['ok'] and first['rehashed'] == 0 and first['files'] >= 2000 and mismatch_rejected and
+                unchanged['ok'] and unchanged['rehashed'] == 0 and unchanged['duration_ms'] < 500 and
+                after_touch['ok'] and after_touch['rehashed'] == 1 and
+                not broken['ok'] and broken['modified'] == ["dist/remoteEntry.js"] and
+                broken['missing'] == ["assets/chunk_0/asset_1.js"] and
+                broken['extra'] == ["assets/injected.js"]
+            )
+
+            self.test_results.append({
+                'test_name': 'Integrity Verification',
+                'passed': success,
+                'details': {'unchanged_ms': unchanged['duration_ms'], 'files': unchanged['files'],
+                            'broken': {k: broken[k] for k in ('missing', 'modified', 'extra')}},
+                'error': None if success else 'Verification missed drift or re-hashed unchanged files'
+            })
+
+            if success:
+                logger.info(f"✓ Integrity verification test passed "
+                            f"({unchanged['files']} files in {unchanged['duration_ms']} ms)")
+            else:
+                logger.error("✗ Integrity verification test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Integrity verification test error: {e}")
+            self.test_results.append({
+                'test_name': 'Integrity Verification',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
+    async def _test_trace_spans(self, manager_class):
+        """Test nested lifecycle/DB spans, OTLP file export and trace sampling"""
+        from tracing import InMemorySpanExporter, FileSpanExporter, configure_tracing, instrument_engine
+        try:
+            from sqlalchemy import create_engine, text
+
+            exporter = InMemorySpanExporter()
+            tracer = configure_tracing(exporter, sample_ratio=1.0)
+            manager = manager_class(str(self.temp_dir / "tracing"), source_dir=str(self.temp_dir / "OpenAIPlugin"))
+            db = MockAsyncSession()
+            install = await manager.install_plugin("trace_user", db)
+            tracer.flush()
+
+            spans = list(exporter.spans)
+            by_id = {span.span_id: span for span in spans}
+            root = next(span for span in spans if span.name == "lifecycle.install")
+
+            def ancestors(span):
+                names = []
+                while span.parent_id is not None:
+                    span = by_id[span.parent_id]
+                    names.append(span.name)
+                return names
+
+            copy = next(span for span in spans if span.name == "files.copy")
+            records = next(span for span in spans if span.name == "db.create_records")
+            statements = [span for span in spans if span.name == "db.statement"
+                          and records.name in ancestors(span)]
+            nested = (
+                install['success'] and root.parent_id is None and
+                all(span.trace_id == root.trace_id for span in spans) and
+                all(span.end_ns >= span.start_ns for span in spans) and
+                ancestors(copy) == ["lifecycle.publish", "lifecycle.install"] and
+                copy.attributes['files'] > 0 and copy.attributes['bytes'] > 0 and
+                records.attributes['user_id'] == "trace_user" and
+                records.attributes['rows'] == 1 + len(manager.module_data) and
+                len(statements) == 1 + len(manager.module_data) and
+                statements[0].attributes['db.operation'] == "INSERT" and
+                statements[0].attributes['db.sql.table'] == "plugin" and
+                any(span.name == "db.commit" for span in spans)
+            )
+
+            # Traced methods take attributes from their arguments; a returned failure marks the span
+            exporter.clear()
+            deleted = await manager.delete_plugin("missing_trace_user", db)
+            tracer.flush()
+            delete_span = next(span for span in exporter.spans if span.name == "lifecycle.delete")
+            from tracing import STATUS_ERROR
+            decorated = (
+                root.attributes['user_id'] == "trace_user" and
+                not deleted['success'] and delete_span.attributes['user_id'] == "missing_trace_user" and
+                delete_span.status == STATUS_ERROR and
+                not tracer.current_span().recording
+            )
+
+            # The update path's export/import statements are traced like create/delete
+            exporter.clear()
+            target = manager_class(str(self.temp_dir / "tracing"), source_dir=str(self.temp_dir / "OpenAIPlugin"),
+                                   version="1.1.0")
+            updated = await manager.update_plugin("trace_user", db, target)
+            tracer.flush()
+            update_statements = {(span.attributes.get('db.operation'), span.attributes.get('db.sql.table'))
+                                 for span in exporter.spans if span.name == "db.statement"}
+            decorated = decorated and updated['success'] and {
+                ('SELECT', 'plugin'), ('SELECT', 'module'), ('DELETE', 'plugin'), ('INSERT', 'plugin')
+            } <= update_statements
+
+            # SQLAlchemy cursor spans nest under the span active when the statement runs
+            exporter.clear()
+            engine = instrument_engine(create_engine("sqlite://"), tracer)
+            with tracer.span("query"):
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            tracer.flush()
+            cursor = [span for span in exporter.spans if span.name == "db.cursor"]
+            cursor_ok = len(cursor) == 1 and cursor[0].parent_id is not None
+            engine.dispose()
+
+            # OTLP/JSON lines on disk
+            trace_file = self.temp_dir / "traces.jsonl"
+            configure_tracing(FileSpanExporter(trace_file), sample_ratio=1.0)
+            await manager.get_plugin_status("trace_user", db)
+            tracer.flush()
+            request = json.loads(trace_file.read_text().splitlines()[-1])
+            otlp_spans = request['resourceSpans'][0]['scopeSpans'][0]['spans']
+            otlp_ok = (
+                any(span['name'] == "lifecycle.status" and 'parentSpanId' not in span for span in otlp_spans) and
+                all(len(span['traceId']) == 32 and len(span['spanId']) == 16 for span in otlp_spans)
+            )
+
+            # Sampling is per trace: unsampled operations record nothing at all
+            exporter = InMemorySpanExporter()
+            configure_tracing(exporter, sample_ratio=0.0)
+            await manager.get_plugin_status("trace_user", db)
+            tracer.flush()
+            unsampled = len(exporter.spans)
+            configure_tracing(exporter, sample_ratio=0.25)
+            for _ in range(200):
+                await manager.get_plugin_status("trace_user", db)
+            tracer.flush()
+            roots = [span for span in exporter.spans if span.parent_id is None]
+            complete = {span.trace_id for span in exporter.spans} == {span.trace_id for span in roots}
+            sampling_ok = unsampled == 0 and 20 <= len(roots) <= 80 and complete
+
+            success = nested and decorated and cursor_ok and otlp_ok and sampling_ok
+            self.test_results.append({
+                'test_name': 'Trace Spans',
+                'passed': success,
+                'details': {'install_spans': len(spans), 'sampled_traces': len(roots),
+                            'nested': nested, 'decorated': decorated, 'update_statements': sorted(map(str, update_statements)), 'updated': updated, 'cursor': cursor_ok, 'otlp': otlp_ok, 'sampling': sampling_ok},
+                'error': None if success else 'Spans were missing, mis-nested or sampled incorrectly'
+            })
+
+            if success:
+                logger.info(f"✓ Trace spans test passed ({len(spans)} spans per install, "
+                            f"{len(roots)}/200 traces sampled)")
+            else:
+                logger.error("✗ Trace spans test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Trace spans test error: {e}")
+            self.test_results.append({
+                'test_name': 'Trace Spans',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+        finally:
+            configure_tracing(None)
+
+    async def _test_warm_start(self, manager_class):
+        """Test that warm_start preloads users, probes and bundle, in budgeted and background modes"""
+        managers = []
+        try:
+            plugins_dir = str(self.temp_dir / "warmup")
+            source_dir = str(self.temp_dir / "OpenAIPlugin")
+            db = MockAsyncSession()
+            manager = manager_class(plugins_dir, source_dir=source_dir, module_storage="template")
+            await manager.install_plugin("warm_user_0", db)
+            for i in range(1, 50):
+                await manager._create_database_records(f"warm_user_{i}", db)
+
+            @asynccontextmanager
+            async def session_factory():
+                yield db
+
+            # Restarted process: warm up, then the first requests find everything cached
+            restarted = manager_class(plugins_dir, source_dir=source_dir, module_storage="template")
+            managers.append(restarted)
+            report = await restarted.warm_start(session_factory, budget=10)
+
+            probes = []
+            original_check = restarted._check_installation
+
+            async def counting_check(user_id, plugin_dir):
+                probes.append(plugin_dir)
+                return await original_check(user_id, plugin_dir)
+            restarted._check_installation = counting_check
+
+            misses = restarted.bundle_server.stats['cache_misses']
+            status = await restarted.get_plugin_status("warm_user_7", db)
+            asset = restarted.bundle_server.get_asset("remoteEntry.js", {'Accept-Encoding': 'gzip'})
+            warm = (
+                report['complete'] and report['success'] and report['users'] == 50 and
+                len(restarted.active_users) == 50 and "warm_user_49" in restarted.active_users and
+                report['validation'] == {'valid': True, 'healthy': True} and
+                report['definitions'] == len(manager.module_data) and
+                report['bundle']['files'] >= 1 and report['integrity']['files'] >= 1 and
+                set(report['steps']) >= {'users', 'watcher', 'validation', 'integrity', 'definitions', 'bundle'} and
+                status['status'] == 'healthy' and not probes and
+                asset['status'] == 200 and restarted.bundle_server.stats['cache_misses'] == misses
+            )
+
+            # Background mode returns before any work; a zero budget returns a partial report
+            background = manager_class(plugins_dir, source_dir=source_dir)
+            budgeted = manager_class(plugins_dir, source_dir=source_dir)
+            managers.extend([background, budgeted])
+            started = await background.warm_start(session_factory, background=True)
+            partial = await budgeted.warm_start(session_factory, budget=0)
+            await asyncio.gather(background._warmup_task, budgeted._warmup_task)
+            deferred = (
+                not started['complete'] and not partial['complete'] and
+                background.warmup_report['complete'] and budgeted.warmup_report['complete'] and
+                len(background.active_users) == 50 and len(budgeted.active_users) == 50
+            )
+
+            # A saved snapshot is mapped rather than re-queried; collation-ordered input still builds
+            from user_set import CompactUserSetBuilder
+            await restarted.save_active_users()
+            shared = manager_class(plugins_dir, source_dir=source_dir)
+            managers.append(shared)
+            snapshot_report = await shared.warm_start(session_factory)
+            builder = CompactUserSetBuilder()
+            builder.extend(["b", "a"])
+            builder.extend(["b", "c"])
+            unordered = builder.build()
+            mapped = (
+                snapshot_report['users'] == 50 and shared.active_users.shared and
+                "warm_user_49" in shared.active_users and
+                list(unordered) == ["a", "b", "c"] and "b" in unordered
+            )
+            (restarted.data_path / "active-users.bin").unlink()
+
+            success = warm and deferred and mapped
+            self.test_results.append({
+                'test_name': 'Warm Start',
+                'passed': success,
+                'details': {'duration_ms': report['duration_ms'], 'steps': report['steps'],
+                            'warm': warm, 'deferred': deferred, 'mapped': mapped},
+                'error': None if success else 'Warm start left cold work for the first requests'
+            })
+
+            if success:
+                logger.info(f"✓ Warm start test passed ({report['duration_ms']} ms)")
+            else:
+                logger.error("✗ Warm start test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Warm start test error: {e}")
+            self.test_results.append({
+                'test_name': 'Warm Start',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+        finally:
+            for warmed in managers:
+                await warmed.stop_file_watcher()
+
+    async def _test_release_packaging(self, manager_class):
+        """Test reproducible parallel-gzip release archives and the unchanged-input skip"""
+        try:
+            import hashlib
+            import os
+            import tarfile
+            source_dir = self.temp_dir / "ReleaseSource"
+            shutil.copytree(self.temp_dir / "OpenAIPlugin", source_dir)
+            # Several compression chunks' worth of data
+            (source_dir / "dist" / "vendor.js").write_text("".join(f"var v{i} = {i * 7919};\n" for i in range(60000)))
+            # Development-only files stay out of the archive
+            (source_dir / "test_extra.py").write_text("assert True\n")
+            (source_dir / "build.sh").write_text("#!/bin/bash\n")
+
+            # An unbuilt checkout (no dist/remoteEntry.js) cannot be released
+            unbuilt_dir = self.temp_dir / "UnbuiltSource"
+            shutil.copytree(source_dir, unbuilt_dir)
+            (unbuilt_dir / "dist" / "remoteEntry.js").unlink()
+            unbuilt = await manager_class(str(self.temp_dir / "release"), source_dir=str(unbuilt_dir)).package_release()
+
+            manager = manager_class(str(self.temp_dir / "release"), source_dir=str(source_dir))
+            first = await manager.package_release(workers=4)
+            archive = Path(first['archive'])
+            with tarfile.open(archive, "r:gz") as tar:
+                members = tar.getmembers()
+                embedded = json.load(tar.extractfile("OpenAIPlugin/.file-manifest.json"))['files']
+                vendor = tar.extractfile("OpenAIPlugin/dist/vendor.js").read()
+            names = [member.name for member in members]
+            sidecar = archive.with_name(archive.name + ".sha256").read_text().split()[0]
+            archive_ok = (
+                first['success'] and not first['skipped'] and archive.name == "OpenAIPlugin-v1.0.0.tar.gz" and
+                names == sorted(names) and all(m.mtime == 0 and m.uid == 0 for m in members) and
+                not any("/releases" in name for name in names) and
+                "OpenAIPlugin/dist/remoteEntry.js" in names and
+                "OpenAIPlugin/test_extra.py" not in names and "OpenAIPlugin/build.sh" not in names and
+                not unbuilt['success'] and 'dist/remoteEntry.js' in unbuilt['error'] and
+                vendor == (source_dir / "dist" / "vendor.js").read_bytes() and
+                embedded["dist/vendor.js"]['sha256'] == hashlib.sha256(vendor).hexdigest() and
+                sidecar == first['sha256'] == hashlib.sha256(archive.read_bytes()).hexdigest()
+            )
+
+            # Unchanged inputs (even if touched) are not repackaged
+            unchanged = await manager.package_release()
+            touched = source_dir / "package.json"
+            os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+            after_touch = await manager.package_release()
+
+            # Byte-identical regardless of worker count; content changes produce a new archive
+            rebuilt = await manager.package_release(force=True, workers=1)
+            (source_dir / "src" / "index.js").write_text("export const changed = true;\n")
+            changed = await manager.package_release()
+
+            success = (
+                archive_ok and unchanged['skipped'] and after_touch['skipped'] and
+                not rebuilt['skipped'] and rebuilt['sha256'] == first['sha256'] and
+                not changed['skipped'] and changed['sha256'] != first['sha256']
+            )
+            self.test_results.append({
+                'test_name': 'Release Packaging',
+                'passed': success,
+                'details': {'files': first['files'], 'compressed_bytes': first['compressed_bytes'],
+                            'package_ms': first['duration_ms'], 'skip_ms': unchanged['duration_ms']},
+                'error': None if success else 'Archive was not reproducible or was repackaged needlessly'
+            })
+
+            if success:
+                logger.info(f"✓ Release packaging test passed ({first['duration_ms']} ms, "
+                            f"skip in {unchanged['duration_ms']} ms)")
+            else:
+                logger.error("✗ Release packaging test failed")
+
+        except Exception as e:
+            logger.error(f"✗ Release packaging test error: {e}")
+            self.test_results.append({
+                'test_name': 'Release Packaging',
+                'passed': False,
+                'details': {},
+                'error': str(e)
+            })
+
 
 async def main():
     """Run OpenAIPlugin lifecycle manager tests"""
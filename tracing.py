@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Tracing
+
+Nested trace spans for lifecycle operations (install, publish, file copy,
+record writes, individual DB statements, commits) so a slow operation can
+be broken down into where the time actually went. Spans nest through a
+context variable, so they follow asyncio tasks, and carry attributes such as
+user_id, rows and bytes.
+
+Finished spans are batched and handed to a pluggable exporter on a
+background thread. All exporters emit the OTLP/JSON trace encoding
+(ExportTraceServiceRequest), so the output can be fed to any OpenTelemetry
+collector:
+
+- InMemorySpanExporter: keeps the last N spans (tests, debugging)
+- FileSpanExporter: one OTLP/JSON request per line (collector `otlpjsonfile`)
+- OTLPHttpExporter: POSTs to an OTLP/HTTP endpoint (`/v1/traces`)
+
+Sampling is decided once per trace from the trace id (head sampling with a
+ratio); spans of unsampled traces are non-recording and cost little more
+than a context variable switch. The process-wide tracer starts disabled
+unless configured through configure_tracing() or the standard environment
+variables (OTEL_EXPORTER_OTLP_TRACES_ENDPOINT / OTEL_EXPORTER_OTLP_ENDPOINT,
+OTEL_TRACES_SAMPLER_ARG, OTEL_SERVICE_NAME) or OPENAIPLUGIN_TRACE_FILE.
+"""
+
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+SCOPE_NAME = "openaiplugin.lifecycle"
+DEFAULT_SERVICE_NAME = "OpenAIPlugin"
+DEFAULT_MAX_BATCH = 512
+DEFAULT_EXPORT_INTERVAL = 2.0
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("openaiplugin_span", default=None)
+
+
+class Span:
+    """A recording span; use through Tracer.span()"""
+
+    recording = True
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: int, parent: Optional['Span'],
+                 kind: int, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.kind = kind
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = str(error)
+        self.attributes['exception.type'] = type(error).__name__
+        self.attributes['exception.message'] = str(error)
+
+    def set_error(self, message: str):
+        """Mark a failure that was returned rather than raised"""
+        self.status = STATUS_ERROR
+        self.status_message = message or ""
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        self.tracer._finish(self)
+        return False
+
+
+class _NonRecordingSpan:
+    """Stand-in for spans of unsampled traces: keeps children unsampled, records nothing"""
+
+    recording = False
+
+    def __init__(self, trace_id: int = 0):
+        self.trace_id = trace_id
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def __enter__(self) -> '_NonRecordingSpan':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        return False
+
+
+class _NoopSpan(_NonRecordingSpan):
+    """Shared span returned while tracing is disabled; does not touch the context"""
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [_attribute_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _attribute_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(spans: Iterable[Span], service_name: str = DEFAULT_SERVICE_NAME) -> Dict[str, Any]:
+    """Encode finished spans as an OTLP/JSON ExportTraceServiceRequest"""
+    encoded = []
+    for span in spans:
+        item = {
+            'traceId': f"{span.trace_id:032x}",
+            'spanId': f"{span.span_id:016x}",
+            'name': span.name,
+            'kind': span.kind,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns),
+            'attributes': _attributes(span.attributes),
+            'status': {'code': span.status, **({'message': span.status_message} if span.status_message else {})}
+        }
+        if span.parent_id is not None:
+            item['parentSpanId'] = f"{span.parent_id:016x}"
+        encoded.append(item)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _attributes({'service.name': service_name})},
+            'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': encoded}]
+        }]
+    }
+
+
+class InMemorySpanExporter:
+    """Keeps the most recent finished spans in memory"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans = collections.deque(maxlen=max_spans)
+
+    def export(self, spans: List[Span], service_name: str):
+        self.spans.extend(spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileSpanExporter:
+    """Appends one OTLP/JSON request per batch as a line of a file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def export(self, spans: List[Span], service_name: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(to_otlp(spans, service_name), separators=(",", ":")) + "\n"
+        # One write per batch on an O_APPEND file, so concurrent processes don't interleave lines
+        with open(self.path, 'a') as f:
+            f.write(line)
+
+
+class OTLPHttpExporter:
+    """POSTs OTLP/JSON batches to a collector's /v1/traces endpoint"""
+
+    def __init__(self, endpoint: str, headers: Optional[Dict[str, str]] = None, timeout: float = 10.0):
+        self.endpoint = endpoint if endpoint.rstrip("/").endswith("/v1/traces") else endpoint.rstrip("/") + "/v1/traces"
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.timeout = timeout
+
+    def export(self, spans: List[Span], service_name: str):
+        body = json.dumps(to_otlp(spans, service_name), separators=(",", ":")).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class Tracer:
+    """Creates spans, samples traces and exports finished spans in batches"""
+
+    def __init__(self,
+                 service_name: str = DEFAULT_SERVICE_NAME,
+                 exporter=None,
+                 sample_ratio: float = 1.0,
+                 max_batch: int = DEFAULT_MAX_BATCH,
+                 export_interval: float = DEFAULT_EXPORT_INTERVAL):
+        self.service_name = service_name
+        self.max_batch = max_batch
+        self.export_interval = export_interval
+        self.exporter = None
+        self.sample_ratio = 0.0
+        self._threshold = 0
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        self._batches: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self.stats = {'spans_started': 0, 'spans_exported': 0, 'export_errors': 0}
+        self.configure(exporter, sample_ratio)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None and self._threshold > 0
+
+    def configure(self, exporter=None, sample_ratio: float = 1.0, service_name: Optional[str] = None):
+        """Swap exporter and sampling in place (managers keep their tracer reference)"""
+        self.flush()
+        self.exporter = exporter
+        self.sample_ratio = min(max(sample_ratio, 0.0), 1.0)
+        self._threshold = int(self.sample_ratio * (1 << 64))
+        if service_name:
+            self.service_name = service_name
+
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        """Context manager for a span nested under the current one"""
+        parent = _current_span.get()
+        if parent is None:
+            if not self.enabled:
+                return _NOOP_SPAN
+            trace_id = random.getrandbits(128)
+            if (trace_id & 0xFFFFFFFFFFFFFFFF) >= self._threshold:
+                return _NonRecordingSpan(trace_id)
+            parent_span = None
+        elif not parent.recording:
+            return _NonRecordingSpan(parent.trace_id)
+        else:
+            trace_id, parent_span = parent.trace_id, parent
+
+        self.stats['spans_started'] += 1
+        return Span(self, name, trace_id, parent_span, kind, attributes)
+
+    def current_span(self):
+        """The innermost open span; a non-recording one outside any span or while disabled"""
+        span = _current_span.get()
+        return span if span is not None else _NOOP_SPAN
+
+    def flush(self, timeout: float = 10.0):
+        """Export everything finished so far and wait for it"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._enqueue(batch)
+        if self._worker is not None:
+            deadline = time.monotonic() + timeout
+            while self._batches.unfinished_tasks and time.monotonic() < deadline:
+                time.sleep(0.005)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self._pending.append(span)
+            if len(self._pending) < self.max_batch:
+                return
+            batch, self._pending = self._pending, []
+        self._enqueue(batch)
+
+    def _enqueue(self, batch: List[Span]):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._export_loop, name="openaiplugin-trace-export",
+                                            daemon=True)
+            self._worker.start()
+        self._batches.put(batch)
+
+    def _export_loop(self):
+        while True:
+            try:
+                batch = self._batches.get(timeout=self.export_interval)
+            except queue.Empty:
+                # Periodically ship partial batches so slow trickles still show up
+                with self._lock:
+                    batch, self._pending = self._pending, []
+                if not batch:
+                    continue
+                self._batches.put(batch)
+                continue
+            try:
+                exporter = self.exporter
+                if exporter is not None:
+                    exporter.export(batch, self.service_name)
+                    self.stats['spans_exported'] += len(batch)
+            except Exception as e:
+                self.stats['export_errors'] += 1
+                logger.warning(f"OpenAIPlugin: Trace export failed ({len(batch)} spans dropped): {e}")
+            finally:
+                self._batches.task_done()
+
+
+def traced(name: str, *arguments: str, kind: int = SPAN_KIND_INTERNAL):
+    """
+    Run an async method in a span of the instance's `tracer` (the
+    process-wide one if it has none). The named call arguments become span
+    attributes and a returned {'success': False, 'error': ...} dict marks
+    the span as failed; the body adds further attributes through
+    tracer.current_span().
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, 'tracer', None) or get_tracer()
+            attributes = {}
+            if arguments and tracer.enabled:
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                attributes = {argument: bound.arguments[argument] for argument in arguments
+                              if bound.arguments[argument] is not None}
+            with tracer.span(name, kind=kind, **attributes) as span:
+                result = await func(self, *args, **kwargs)
+                if isinstance(result, dict) and result.get('success') is False:
+                    span.set_error(result.get('error'))
+                return result
+        return wrapper
+    return decorator
+
+
+def statement_attributes(statement: Any) -> Dict[str, Any]:
+    """db.operation / db.sql.table / db.statement attributes for a SQL statement"""
+    sql = " ".join(str(statement).split())
+    words = sql.split(" ")
+    operation = words[0].upper() if words else ""
+    table = None
+    upper = [w.upper() for w in words]
+    for keyword in ("INTO", "FROM", "UPDATE", "TABLE"):
+        if keyword in upper:
+            index = upper.index(keyword) + 1
+            if index < len(words):
+                table = words[index].strip("(")
+            break
+    return {'db.system': 'sql', 'db.operation': operation, 'db.sql.table': table, 'db.statement': sql[:500]}
+
+
+def instrument_engine(engine, tracer: Optional['Tracer'] = None):
+    """
+    Add a 'db.cursor' span around every statement an SQLAlchemy engine runs
+    (covering companion modules too). Nested under the manager's
+    'db.statement' spans, it separates time spent waiting for a connection or
+    lock in the session from time spent executing on the server.
+    """
+    from sqlalchemy import event
+
+    tracer = tracer or get_tracer()
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.span("db.cursor", kind=SPAN_KIND_CLIENT)
+        if span.recording:
+            span.set_attributes(statement_attributes(statement))
+            span.set_attribute('db.executemany', executemany)
+        conn.info.setdefault('openaiplugin_spans', []).append(span.__enter__())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('openaiplugin_spans')
+        if spans:
+            span = spans.pop()
+            span.set_attribute('db.rows', cursor.rowcount if cursor.rowcount >= 0 else None)
+            span.__exit__(None, None, None)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        spans = exception_context.connection.info.get('openaiplugin_spans') if exception_context.connection else None
+        if spans:
+            span = spans.pop()
+            span.__exit__(type(exception_context.original_exception), exception_context.original_exception, None)
+
+    return engine
+
+
+_tracer: Optional[Tracer] = None
+
+
+def _tracer_from_environment() -> Tracer:
+    sample_ratio = float(os.environ.get("OTEL_TRACES_SAMPLER_ARG", "1.0"))
+    service_name = os.environ.get("OTEL_SERVICE_NAME", DEFAULT_SERVICE_NAME)
+    endpoint = (os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or
+                os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"))
+    trace_file = os.environ.get("OPENAIPLUGIN_TRACE_FILE")
+    exporter = None
+    if trace_file:
+        exporter = FileSpanExporter(Path(trace_file))
+    elif endpoint:
+        exporter = OTLPHttpExporter(endpoint)
+    return Tracer(service_name, exporter, sample_ratio)
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer (disabled unless configured)"""
+    global _tracer
+    if _tracer is None:
+        _tracer = _tracer_from_environment()
+    return _tracer
+
+
+def configure_tracing(exporter=None, sample_ratio: float = 1.0, service_name: Optional[str] = None) -> Tracer:
+    """Set the exporter and sampling ratio of the process-wide tracer; exporter=None disables it"""
+    tracer = get_tracer()
+    tracer.configure(exporter, sample_ratio, service_name)
+    return tracer
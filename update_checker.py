@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Update Checker
+
+Fleet-wide update checks. Every per-user `plugin` row carries its own
+update_check_url / update_available / latest_version copy, but the release
+endpoint only has to be asked once per plugin slug: the latest release is
+fetched with a conditional request (ETag / Last-Modified) against a cached
+response, and the installed rows of that slug whose flags changed are then
+rewritten with a single set-based UPDATE. The number of upstream requests and statements is
+therefore independent of the number of users.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import bindparam, text
+
+from async_fs import get_async_fs
+from model_catalog import Fetcher, urllib_fetcher
+
+logger = structlog.get_logger()
+
+DEFAULT_MIN_INTERVAL = 3600.0
+
+
+def normalize_version(tag: Optional[str]) -> Optional[str]:
+    """Turn a release tag such as 'v1.2.0' or 'release-1.2.0' into '1.2.0'"""
+    if not tag:
+        return None
+    match = re.search(r"\d+(\.\d+)*([-+.][0-9A-Za-z.-]+)?$", tag.strip())
+    return match.group(0) if match else tag.strip()
+
+
+def version_key(version: str) -> Tuple:
+    """Sort key for dotted versions; numeric parts compare numerically"""
+    release, _, pre = version.partition("-")
+    parts = [(0, int(p), "") if p.isdigit() else (1, 0, p) for p in release.split(".")]
+    # Pad so 1.2 and 1.2.0 compare equal
+    parts = tuple(parts + [(0, 0, "")] * (4 - len(parts)))
+    # A pre-release sorts before the release it precedes (1.2.0-rc1 < 1.2.0)
+    return parts + ((0, pre) if pre else (1, ""),)
+
+
+def is_newer(latest: str, current: str) -> bool:
+    try:
+        return version_key(latest) > version_key(current)
+    except (TypeError, ValueError):
+        return latest != current
+
+
+class UpdateChecker:
+    """Per-slug release lookups with a persistent conditional-request cache"""
+
+    def __init__(self,
+                 fetcher: Optional[Fetcher] = None,
+                 cache_path: Optional[Path] = None,
+                 min_interval: float = DEFAULT_MIN_INTERVAL,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            fetcher: async callable (url, headers) -> (status, headers, body)
+            cache_path: JSON file keeping validators and the last release per
+                URL, so conditional requests survive restarts
+            min_interval: seconds a cached release is trusted without asking
+                the endpoint again
+        """
+        self.fetcher = fetcher or urllib_fetcher
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.min_interval = min_interval
+        self.clock = clock
+
+        self._cache: Dict[str, Dict[str, Any]] = self._load_cache()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            'requests': 0,
+            'not_modified': 0,
+            'cache_hits': 0,
+            'upstream_errors': 0,
+            'rows_flagged': 0
+        }
+
+    async def get_latest_release(self, update_check_url: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Return {'success', 'latest_version', 'cache'} for a release endpoint.
+        Concurrent callers for the same URL share one upstream request.
+        """
+        entry = self._cache.get(update_check_url)
+        if entry and not force and self.clock() - entry['checked_at'] < self.min_interval:
+            self.stats['cache_hits'] += 1
+            return {'success': True, 'latest_version': entry['latest_version'], 'cache': 'hit'}
+
+        inflight = self._inflight.get(update_check_url)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[update_check_url] = future
+        try:
+            result = await self._fetch(update_check_url, entry)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(update_check_url, None)
+
+    async def check_plugin(self, db, plugin_slug: str, update_check_url: str,
+                           force: bool = False, commit: bool = True) -> Dict[str, Any]:
+        """
+        Look up the latest release of one slug and flag the installed rows
+        whose update_available or latest_version changed. With commit=False
+        the caller owns the transaction (unit of work) and the write runs in
+        a savepoint, so a failure leaves the caller's other work intact.
+        """
+        release = await self.get_latest_release(update_check_url, force=force)
+        if not release['success']:
+            return {'success': False, 'plugin_slug': plugin_slug, 'error': release['error']}
+        latest = release['latest_version']
+
+        savepoint = None
+        try:
+            # Installed versions are few even when users are many; decide
+            # outdatedness in Python, then write the changed rows in one statement
+            version_rows = (await db.execute(text("""
+            SELECT version, COUNT(*) AS users FROM plugin
+            WHERE plugin_slug = :plugin_slug
+            GROUP BY version
+            """), {'plugin_slug': plugin_slug})).fetchall()
+            installed = {row.version: row.users for row in version_rows}
+            outdated = sorted(v for v in installed if v and is_newer(latest, v))
+
+            # Rows already carrying these flags are skipped, so repeated checks
+            # of an unchanged release write nothing
+            update_stmt = text("""
+            UPDATE plugin SET
+                update_available = CASE WHEN version IN :outdated THEN TRUE ELSE FALSE END,
+                latest_version = :latest_version,
+                last_update_check = :checked_at
+            WHERE plugin_slug = :plugin_slug
+              AND (latest_version IS NULL OR latest_version <> :latest_version
+                   OR update_available IS NULL
+                   OR update_available <> CASE WHEN version IN :outdated THEN TRUE ELSE FALSE END)
+            """).bindparams(bindparam('outdated', expanding=True))
+            if not commit:
+                savepoint = await db.begin_nested()
+            result = await db.execute(update_stmt, {
+                'outdated': outdated,
+                'latest_version': latest,
+                'checked_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'plugin_slug': plugin_slug
+            })
+            if savepoint is not None:
+                await savepoint.commit()
+            else:
+                await db.commit()
+        except Exception as e:
+            if savepoint is not None:
+                if savepoint.is_active:
+                    await savepoint.rollback()
+            elif commit:
+                await db.rollback()
+            logger.error(f"OpenAIPlugin: Failed to flag updates for {plugin_slug}: {e}")
+            return {'success': False, 'plugin_slug': plugin_slug, 'error': str(e)}
+
+        self.stats['rows_flagged'] += result.rowcount or 0
+        users_outdated = sum(installed[v] for v in outdated)
+        logger.info(f"OpenAIPlugin: {plugin_slug} latest is {latest}; "
+                    f"{users_outdated} of {sum(installed.values())} installs have an update")
+        return {
+            'success': True,
+            'plugin_slug': plugin_slug,
+            'latest_version': latest,
+            'cache': release['cache'],
+            'outdated_versions': outdated,
+            'users_with_update': users_outdated,
+            'rows_updated': result.rowcount
+        }
+
+    async def check_all(self, db, force: bool = False, commit: bool = True) -> List[Dict[str, Any]]:
+        """Run check_plugin once for every slug that has an update_check_url"""
+        rows = (await db.execute(text("""
+        SELECT DISTINCT plugin_slug, update_check_url FROM plugin
+        WHERE update_check_url IS NOT NULL AND update_check_url <> ''
+        """))).fetchall()
+        results = []
+        for row in rows:
+            results.append(await self.check_plugin(db, row.plugin_slug, row.update_check_url,
+                                                   force=force, commit=commit))
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'cached_urls': len(self._cache)}
+
+    async def _fetch(self, url: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        headers = {'Accept': 'application/vnd.github+json', 'User-Agent': 'BrainDrive-OpenAIPlugin'}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        self.stats['requests'] += 1
+        try:
+            status, response_headers, body = await self.fetcher(url, headers)
+        except Exception as e:
+            status, response_headers, body = 0, {}, str(e).encode()
+
+        response_headers = {k.lower(): v for k, v in response_headers.items()}
+        if status == 304 and entry:
+            self.stats['not_modified'] += 1
+            entry['checked_at'] = self.clock()
+            await get_async_fs().run(self._save_cache)
+            return {'success': True, 'latest_version': entry['latest_version'], 'cache': 'not_modified'}
+
+        latest = None
+        if status == 200:
+            try:
+                release = json.loads(body)
+                latest = normalize_version(release.get('tag_name') or release.get('version'))
+            except (ValueError, AttributeError):
+                latest = None
+
+        if latest is None:
+            self.stats['upstream_errors'] += 1
+            if entry:
+                # Keep serving the last known release rather than clearing flags
+                return {'success': True, 'latest_version': entry['latest_version'], 'cache': 'stale'}
+            return {'success': False, 'error': f'OpenAIPlugin: Release lookup failed with status {status}'}
+
+        self._cache[url] = {
+            'etag': response_headers.get('etag'),
+            'last_modified': response_headers.get('last-modified'),
+            'latest_version': latest,
+            'checked_at': self.clock()
+        }
+        await get_async_fs().run(self._save_cache)
+        return {'success': True, 'latest_version': latest, 'cache': 'fetched'}
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_cache(self):
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self._cache, f)
+        os.replace(tmp, self.cache_path)
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Compact User Set
+
+Memory-compact membership structure for `active_users`. A Python `set` of
+user id strings costs roughly 100 bytes per member (a str object plus a hash
+table slot), which is hundreds of MB per process at a million installs.
+CompactUserSet stores every id once as UTF-8 bytes in one sorted blob with an
+offsets array next to it (about len(id) + 4 bytes per member), answers
+membership with a bisect over a sparse index of every 64th id followed by a
+short binary search in the blob, and keeps recent changes in small overlay
+sets that are merged into the sorted base in bulk.
+
+The sorted base can be saved to a file and memory-mapped read-only by every
+worker process on the host, so the pages are shared through the page cache
+instead of being rebuilt per process. Workers keep their own changes in the
+overlay and pick up a newer snapshot with refresh().
+
+CompactUserSet is not thread-safe. To keep file I/O off an event loop, split
+save() and refresh() the way the lifecycle manager does: prepare_save() and
+finish_save() / attach() run on the owning thread, and only SaveJob.write()
+and Snapshot.open() (file write, mmap open) run on an executor thread.
+
+User ids are opaque strings (UUIDs in BrainDrive), so ids are packed into a
+sorted array rather than a bitmap, which would need dense integer ids.
+"""
+
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import sys
+import time
+import tracemalloc
+import uuid
+from array import array
+from collections.abc import MutableSet
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+MAGIC = b"OPUS"
+# magic, offsets typecode, padding, member count
+HEADER = struct.Struct("=4sc3xQ")
+DEFAULT_COMPACT_THRESHOLD = 4096
+# Every INDEX_STRIDE-th id is kept in a small list searched with C bisect
+INDEX_STRIDE = 64
+
+
+class CompactUserSet(MutableSet):
+    """Set of user ids backed by a sorted byte blob plus small change overlays"""
+
+    def __init__(self, iterable: Iterable[str] = (), compact_threshold: int = DEFAULT_COMPACT_THRESHOLD):
+        """
+        Args:
+            iterable: initial members
+            compact_threshold: overlay size that triggers a merge into the
+                sorted base (the threshold also grows with the base, keeping
+                merges amortized O(1) per change)
+        """
+        self.compact_threshold = compact_threshold
+        self._added = set()
+        self._removed = set()
+        self._path: Optional[Path] = None
+        self._mmap = None
+        self._stat = None
+        # Sets collecting users added or discarded while they are registered (see watch())
+        self._watchers: List[set] = []
+        # Users changed while a save is being written (None when no save is in progress)
+        self._touched: Optional[set] = None
+        self._set_base(*_pack(sorted({str(user_id) for user_id in iterable})))
+
+    @classmethod
+    def open(cls, path: Path, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+             snapshot: Optional['Snapshot'] = None) -> 'CompactUserSet':
+        """
+        Memory-map a snapshot written by save(); a missing file gives an empty
+        set. Pass a Snapshot of `path` already opened elsewhere to skip the I/O.
+        """
+        users = cls(compact_threshold=compact_threshold)
+        users._path = Path(path)
+        if snapshot is not None:
+            users.attach(snapshot)
+        else:
+            users.refresh()
+        return users
+
+    # Set protocol
+
+    def __contains__(self, user_id: Any) -> bool:
+        if not isinstance(user_id, str):
+            return False
+        if user_id in self._added:
+            return True
+        if user_id in self._removed:
+            return False
+        return self._in_base(user_id.encode("utf-8"))
+
+    def __len__(self) -> int:
+        return self._count + len(self._added) - len(self._removed)
+
+    def __iter__(self) -> Iterator[str]:
+        """Members in sorted order"""
+        base = (user_id for user_id in self._iter_base() if user_id not in self._removed)
+        return heapq.merge(base, sorted(self._added))
+
+    def iter_after(self, user_id: str) -> Iterator[str]:
+        """Members sorted after user_id, without scanning the ones before it"""
+        start = self._bisect_right(user_id.encode("utf-8"))
+        base = (member for member in self._iter_base(start) if member not in self._removed)
+        return heapq.merge(base, sorted(member for member in self._added if member > user_id))
+
+    def __repr__(self) -> str:
+        return f"CompactUserSet(size={len(self)}, shared={self.shared})"
+
+    def add(self, user_id: str):
+        for changed in self._watchers:
+            changed.add(user_id)
+        if user_id in self._removed:
+            self._removed.discard(user_id)
+        elif not self._in_base(user_id.encode("utf-8")):
+            self._added.add(user_id)
+            self._maybe_compact()
+
+    def discard(self, user_id: str):
+        for changed in self._watchers:
+            changed.add(user_id)
+        if user_id in self._added:
+            self._added.discard(user_id)
+        elif isinstance(user_id, str) and self._in_base(user_id.encode("utf-8")):
+            self._removed.add(user_id)
+            self._maybe_compact()
+
+    def clear(self):
+        if self._watchers:
+            members = set(self)
+            for changed in self._watchers:
+                changed.update(members)
+        self._added.clear()
+        self._removed.clear()
+        self._close_mmap()
+        self._set_base(*_pack([]))
+
+    def watch(self) -> set:
+        """
+        Start collecting every user added or discarded from now on into the
+        returned set, e.g. to skip users that changed during an await.
+        Stop with unwatch().
+        """
+        changed = set()
+        self._watchers.append(changed)
+        return changed
+
+    def unwatch(self, changed: set):
+        self._watchers = [watcher for watcher in self._watchers if watcher is not changed]
+
+    # Compaction and sharing
+
+    @property
+    def shared(self) -> bool:
+        return self._mmap is not None
+
+    def compact(self):
+        """Merge the overlays into a new private sorted base"""
+        if not self._added and not self._removed:
+            return
+        members = list(self)
+        self._added.clear()
+        self._removed.clear()
+        self._close_mmap()
+        self._set_base(*_pack(members))
+
+    def save(self, path: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        Write the full membership as a snapshot (atomically) and switch this
+        set to the memory-mapped copy, so it shares pages with other readers.
+        """
+        job = self.prepare_save(path)
+        job.write()
+        return self.finish_save(job)
+
+    def prepare_save(self, path: Optional[Path] = None) -> 'SaveJob':
+        """
+        Take the member list for a save and start tracking changes made while
+        it is written. Call on the owning thread; SaveJob.write() may then run
+        on any thread, followed by finish_save() on the owning thread.
+        """
+        path = Path(path) if path else self._path
+        if path is None:
+            raise ValueError("No snapshot path given")
+        if self._touched is not None:
+            raise RuntimeError("A save is already in progress")
+        self._touched = self.watch()
+        return SaveJob(path, list(self))
+
+    def finish_save(self, job: 'SaveJob') -> Dict[str, Any]:
+        """Switch to the written snapshot, keeping every change made since prepare_save()"""
+        touched, self._touched = self._touched, None
+        self.unwatch(touched)
+        if job.snapshot is None:
+            raise RuntimeError("SaveJob.write() has not completed")
+        current = {user_id: user_id in self for user_id in touched}
+
+        self._path = job.path
+        self._added.clear()
+        self._removed.clear()
+        self._attach(job.snapshot)
+        for user_id, member in current.items():
+            if member != self._in_base(user_id.encode("utf-8")):
+                (self._added if member else self._removed).add(user_id)
+        return {'success': True, 'path': str(job.path), 'users': len(self), 'bytes': job.bytes}
+
+    def cancel_save(self):
+        """Stop tracking changes after a failed SaveJob.write()"""
+        if self._touched is not None:
+            self.unwatch(self._touched)
+            self._touched = None
+
+    def refresh(self) -> bool:
+        """
+        Re-map the snapshot file if it changed since it was mapped. Overlay
+        changes the new snapshot already contains are dropped; the rest are
+        kept. Returns True when a new snapshot was mapped.
+        """
+        if self._path is None:
+            return False
+        return self.attach(Snapshot.open(self._path, unless=self._stat))
+
+    def attach(self, snapshot: Optional['Snapshot']) -> bool:
+        """
+        Switch to a snapshot opened with Snapshot.open() (on any thread) for
+        this set's path. Call on the owning thread; None is a no-op.
+        """
+        if snapshot is None:
+            return False
+        added, removed = self._added, self._removed
+        self._attach(snapshot)
+        self._added = {user_id for user_id in added if not self._in_base(user_id.encode("utf-8"))}
+        self._removed = {user_id for user_id in removed if self._in_base(user_id.encode("utf-8"))}
+        return True
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self._path
+
+    @property
+    def snapshot_key(self):
+        """Identity of the mapped snapshot file, for Snapshot.open(unless=...)"""
+        return self._stat
+
+    def close(self):
+        """Release the memory map (the set becomes empty)"""
+        self._close_mmap()
+        self._set_base(*_pack([]))
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate private heap bytes, plus bytes mapped from a shared snapshot"""
+        overlay = sum(sys.getsizeof(s) + sum(sys.getsizeof(u) for u in s) for s in (self._added, self._removed))
+        index = sys.getsizeof(self._index) + sum(sys.getsizeof(k) for k in self._index)
+        if self.shared:
+            return {'private_bytes': index + overlay, 'shared_bytes': len(self._mmap)}
+        base = sys.getsizeof(self._offsets) + sys.getsizeof(self._blob)
+        return {'private_bytes': base + index + overlay, 'shared_bytes': 0}
+
+    # Internals
+
+    def _set_base(self, typecode: str, offsets, blob, blob_start: int = 0):
+        self._offsets = offsets
+        self._blob = blob
+        self._blob_start = blob_start
+        self._count = len(offsets) - 1
+        self._index = [self._item(i) for i in range(0, self._count, INDEX_STRIDE)]
+
+    def _attach(self, snapshot: 'Snapshot'):
+        self._close_mmap()
+        self._mmap = snapshot.mapped
+        self._stat = snapshot.key
+        self._set_base(snapshot.typecode, snapshot.offsets, snapshot.mapped, blob_start=snapshot.blob_start)
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            # The offsets view must be released before the map can close
+            if isinstance(self._offsets, memoryview):
+                self._offsets.release()
+            self._mmap.close()
+            self._mmap = None
+            self._stat = None
+
+    def _item(self, index: int) -> bytes:
+        start = self._blob_start
+        return self._blob[start + self._offsets[index]:start + self._offsets[index + 1]]
+
+    def _bisect_right(self, key: bytes) -> int:
+        """Index of the first base member greater than key"""
+        block = bisect.bisect_right(self._index, key) - 1
+        if block < 0:
+            return 0
+        lo = block * INDEX_STRIDE
+        hi = min(lo + INDEX_STRIDE, self._count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < self._item(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _in_base(self, key: bytes) -> bool:
+        index = self._bisect_right(key)
+        return index > 0 and self._item(index - 1) == key
+
+    def _iter_base(self, start: int = 0) -> Iterator[str]:
+        for index in range(start, self._count):
+            yield self._item(index).decode("utf-8")
+
+    def _maybe_compact(self):
+        # Shared sets keep their overlay; the snapshot owner folds it in with save()
+        if self.shared:
+            return
+        if len(self._added) + len(self._removed) > max(self.compact_threshold, self._count // 8):
+            self.compact()
+
+
+class CompactUserSetBuilder:
+    """
+    Build a CompactUserSet from ids streamed in ascending order (e.g. a query
+    with ORDER BY user_id read in partitions) without holding them as Python
+    strings: each id is appended to the blob as it arrives. Input that turns
+    out not to be in UTF-8 byte order (a database collation can differ) is
+    still accepted; the builder then falls back to sorting at build().
+    """
+
+    def __init__(self):
+        self._blob = bytearray()
+        self._offsets = array('I', [0])
+        self._last: Optional[bytes] = None
+        self._unsorted: Optional[set] = None
+
+    def extend(self, user_ids: Iterable[str]):
+        for user_id in user_ids:
+            key = str(user_id).encode("utf-8")
+            if self._unsorted is not None:
+                self._unsorted.add(key)
+                continue
+            if self._last is not None and key <= self._last:
+                if key == self._last:
+                    continue
+                self._unsorted = {key}
+                continue
+            self._blob += key
+            if len(self._blob) >= 2 ** 32 and self._offsets.typecode == 'I':
+                self._offsets = array('Q', self._offsets)
+            self._offsets.append(len(self._blob))
+            self._last = key
+
+    def build(self, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD) -> CompactUserSet:
+        users = CompactUserSet(compact_threshold=compact_threshold)
+        if self._unsorted is not None:
+            offsets = self._offsets
+            self._unsorted.update(bytes(self._blob[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1))
+            users._set_base(*_pack([key.decode("utf-8") for key in self._unsorted]))
+        else:
+            users._set_base(self._offsets.typecode, self._offsets, self._blob)
+        self._blob, self._offsets, self._unsorted = bytearray(), array('I', [0]), None
+        return users
+
+
+class SaveJob:
+    """Member list captured by prepare_save(); write() does the file I/O"""
+
+    def __init__(self, path: Path, members: list):
+        self.path = path
+        self.members = members
+        self.bytes = 0
+        self.snapshot: Optional[Snapshot] = None
+
+    def write(self):
+        """Pack, write atomically and map the new snapshot (safe on any thread)"""
+        typecode, offsets, blob = _pack(self.members)
+        self.members = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, typecode.encode(), len(offsets) - 1))
+            offsets.tofile(f)
+            f.write(blob)
+        # Readers keep mapping the old inode until they refresh
+        os.replace(tmp, self.path)
+        self.snapshot = Snapshot.open(self.path)
+        self.bytes = self.snapshot.key[1]
+
+
+class Snapshot:
+    """A memory-mapped snapshot file, opened but not yet attached to a set"""
+
+    def __init__(self, key, mapped, typecode: str, offsets, blob_start: int):
+        self.key = key
+        self.mapped = mapped
+        self.typecode = typecode
+        self.offsets = offsets
+        self.blob_start = blob_start
+
+    @classmethod
+    def open(cls, path: Path, unless=None) -> Optional['Snapshot']:
+        """
+        Map `path`; None when it is missing or its (inode, size, mtime) key
+        equals `unless`. Touches no set state, so it is safe on any thread.
+        """
+        try:
+            stat = Path(path).stat()
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key == unless:
+            return None
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+        if mapped is None or len(mapped) < HEADER.size:
+            raise ValueError(f"Invalid user set snapshot: {path}")
+        magic, typecode, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"Invalid user set snapshot: {path}")
+        typecode = typecode.decode()
+        offsets_end = HEADER.size + (count + 1) * array(typecode).itemsize
+        offsets = memoryview(mapped)[HEADER.size:offsets_end].cast(typecode)
+        return cls(key, mapped, typecode, offsets, offsets_end)
+
+
+def _pack(members: list):
+    """Sorted members -> (offsets typecode, offsets array, blob)"""
+    encoded = sorted(member.encode("utf-8") for member in members)
+    blob = b"".join(encoded)
+    typecode = 'I' if len(blob) < 2 ** 32 else 'Q'
+    offsets = array(typecode, [0])
+    position = 0
+    for item in encoded:
+        position += len(item)
+        offsets.append(position)
+    return typecode, offsets, blob
+
+
+def benchmark_memory(users: int = 1_000_000,
+                     id_factory: Callable[[int], str] = lambda i: uuid.UUID(int=i).hex,
+                     lookups: int = 100_000) -> Dict[str, Any]:
+    """Compare heap usage and lookup cost of set() and CompactUserSet for `users` ids"""
+    ids = [id_factory(i) for i in range(users)]
+    probes = [ids[(i * 7919) % users] for i in range(lookups)]
+
+    def measure(build):
+        tracemalloc.start()
+        started = time.perf_counter()
+        structure = build()
+        build_seconds = time.perf_counter() - started
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        hits = sum(1 for user_id in probes if user_id in structure)
+        lookup_ns = (time.perf_counter() - started) / lookups * 1e9
+        assert hits == lookups
+        return structure, {'heap_bytes': heap, 'build_seconds': round(build_seconds, 3),
+                           'lookup_ns': round(lookup_ns)}
+
+    # Copies, so the measured structures own their strings like a real fleet would
+    plain, set_stats = measure(lambda: {"".join(user_id) for user_id in ids})
+    del plain
+    compact, compact_stats = measure(lambda: CompactUserSet(ids))
+    del compact
+
+    return {
+        'users': users,
+        'set': set_stats,
+        'compact': compact_stats,
+        'ratio': round(set_stats['heap_bytes'] / max(compact_stats['heap_bytes'], 1), 1)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Memory benchmark: set() vs CompactUserSet")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+    print(json.dumps(benchmark_memory(args.users, lookups=args.lookups), indent=2))
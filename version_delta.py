@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Version Delta
+
+Delta upgrades between shared plugin versions. A file manifest (relative
+path -> size and sha256) describes each build or release archive; diffing
+two manifests yields the added, removed and changed files. A new build is
+then assembled by hard-linking every unchanged file from the previous build
+and writing only the added and changed bytes, so an upgrade that touches
+`dist/remoteEntry.js` costs one file write instead of a full tree copy.
+
+Hard links are safe because published builds are immutable: everything that
+rewrites files in a build (bundle artifacts, manifests) writes a temporary
+file and renames it into place, which never modifies a shared inode. Where
+links are not possible (another filesystem, no permission) the file is
+copied instead and counted as written.
+
+Generated bundle artifacts (precompressed variants, asset-manifest.json) are
+left out of manifests; they are rebuilt for every build.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import structlog
+
+from bundle_artifacts import MANIFEST_NAME as ASSET_MANIFEST_NAME, VARIANT_SUFFIXES
+
+logger = structlog.get_logger()
+
+MANIFEST_NAME = ".file-manifest.json"
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# relative posix path -> {'size': int, 'sha256': str}, plus 'mtime_ns' and
+# 'inode' in manifests stored inside a build
+Manifest = Dict[str, Dict[str, Any]]
+# relative posix path -> absolute source file
+SourceFiles = Dict[str, Path]
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_generated(relative: str) -> bool:
+    """True for files every build regenerates (manifests, precompressed variants)"""
+    name = relative.rsplit("/", 1)[-1]
+    return (name in (MANIFEST_NAME, ASSET_MANIFEST_NAME)
+            or any(name.endswith(suffix) for suffix in VARIANT_SUFFIXES.values()))
+
+
+def is_archive(path: Path) -> bool:
+    name = Path(path).name
+    return name.endswith((".tar", ".tar.gz", ".tgz", ".zip"))
+
+
+def _walk_files(root: Path) -> SourceFiles:
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            relative = path.relative_to(root).as_posix()
+            if not is_generated(relative):
+                files[relative] = path
+    return files
+
+
+def files_manifest(files: SourceFiles, max_workers: Optional[int] = None, with_stats: bool = False) -> Manifest:
+    """
+    Hash a set of files in parallel (hashlib releases the GIL on large buffers).
+    with_stats also records mtime_ns and inode, read before hashing so that a
+    change made during or after the hash never matches them.
+    """
+    relatives = sorted(files)
+
+    def entry(relative: str) -> Dict[str, Any]:
+        path = files[relative]
+        stat = path.stat()
+        digest = hash_file(path)
+        if with_stats:
+            return {'size': stat.st_size, 'sha256': digest, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+        return {'size': stat.st_size, 'sha256': digest}
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(8, (os.cpu_count() or 1) + 1)) as pool:
+        return dict(zip(relatives, pool.map(entry, relatives)))
+
+
+def directory_manifest(root: Path, use_stored: bool = True) -> Manifest:
+    """Manifest of a build directory; the stored one is reused when present"""
+    root = Path(root)
+    if use_stored:
+        stored = load_stored_manifest(root)
+        if stored is not None:
+            return stored
+    return files_manifest(_walk_files(root))
+
+
+def _iter_archive(archive: Path) -> Iterator[Tuple[str, Any]]:
+    """Yield (relative path, readable file object) for regular archive members"""
+    archive = Path(archive)
+    if archive.name.endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as f:
+                        yield info.filename, f
+        return
+    with tarfile.open(archive, "r:*") as tf:
+        for member in tf.getmembers():
+            if member.isfile():
+                f = tf.extractfile(member)
+                if f is not None:
+                    with f:
+                        yield member.name, f
+
+
+def _member_name(name: str) -> str:
+    while name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+def _strip_root(name: str, prefix: Optional[str]) -> Optional[str]:
+    name = _member_name(name)
+    if prefix:
+        if not name.startswith(prefix + "/"):
+            return None
+        name = name[len(prefix) + 1:]
+    if not name or name.startswith("/") or ".." in name.split("/"):
+        return None
+    return name
+
+
+def _archive_prefix(archive: Path) -> Optional[str]:
+    """Common top-level directory of an archive (e.g. 'OpenAIPlugin-1.1.0'), if any"""
+    archive = Path(archive)
+    if archive.name.endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            names = [info.filename for info in zf.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(archive, "r:*") as tf:
+            names = [member.name for member in tf.getmembers() if member.isfile()]
+
+    roots = set()
+    for name in names:
+        parts = _member_name(name).split("/")
+        roots.add(parts[0] if len(parts) > 1 else None)
+    return roots.pop() if len(roots) == 1 else None
+
+
+def archive_manifest(archive: Path) -> Manifest:
+    """Manifest of a .tar(.gz)/.zip release archive, relative to its top-level directory"""
+    prefix = _archive_prefix(archive)
+    manifest = {}
+    for name, f in _iter_archive(archive):
+        relative = _strip_root(name, prefix)
+        if relative is None or is_generated(relative):
+            continue
+        digest, size = hashlib.sha256(), 0
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        manifest[relative] = {'size': size, 'sha256': digest.hexdigest()}
+    return dict(sorted(manifest.items()))
+
+
+def load_manifest(location: Union[Path, str]) -> Manifest:
+    """Manifest of a build directory or release archive"""
+    location = Path(location)
+    return archive_manifest(location) if is_archive(location) else directory_manifest(location)
+
+
+def diff_manifests(old: Manifest, new: Manifest) -> Dict[str, Any]:
+    """Classify files as added, removed, changed or unchanged between two manifests"""
+    added, removed, changed, unchanged = [], [], [], []
+    for relative in sorted(set(old) | set(new)):
+        before, after = old.get(relative), new.get(relative)
+        if before is None:
+            added.append({'path': relative, 'size': after['size'], 'sha256': after['sha256']})
+        elif after is None:
+            removed.append({'path': relative, 'size': before['size'], 'sha256': before['sha256']})
+        elif before['sha256'] != after['sha256']:
+            changed.append({'path': relative, 'size': after['size'],
+                            'old_sha256': before['sha256'], 'sha256': after['sha256']})
+        else:
+            unchanged.append(relative)
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'unchanged': unchanged,
+        'bytes_changed': sum(e['size'] for e in added + changed),
+        'bytes_unchanged': sum(new[r]['size'] for r in unchanged)
+    }
+
+
+def diff_versions(old: Union[Path, str], new: Union[Path, str]) -> Dict[str, Any]:
+    """Diff two build directories and/or release archives"""
+    return diff_manifests(load_manifest(old), load_manifest(new))
+
+
+def with_build_stats(build_dir: Path, manifest: Manifest, trusted: Optional[Manifest] = None) -> Manifest:
+    """
+    Stamp the source manifest with each build file's mtime_ns and inode, so
+    integrity checks (integrity.py) can skip re-hashing unchanged files.
+
+    Every build file is hashed once here and must match its source entry;
+    only files hard-linked from a build whose stored manifest (`trusted`)
+    already vouches for the same inode and mtime are not re-hashed. Sizes
+    and hashes stay those of the source. Raises ValueError on a mismatch.
+    """
+    build_dir = Path(build_dir)
+    trusted = trusted or {}
+    stamped, to_hash = {}, {}
+    for relative, entry in manifest.items():
+        path = build_dir / relative
+        known = trusted.get(relative)
+        if known is not None and 'inode' in known and known['sha256'] == entry['sha256']:
+            stat = path.stat()
+            if (known['size'], known['mtime_ns'], known['inode']) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                stamped[relative] = {**entry, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+                continue
+        to_hash[relative] = path
+
+    mismatched = []
+    for relative, found in files_manifest(to_hash, with_stats=True).items():
+        entry = manifest[relative]
+        if (found['size'], found['sha256']) != (entry['size'], entry['sha256']):
+            mismatched.append(relative)
+        else:
+            stamped[relative] = {**entry, 'mtime_ns': found['mtime_ns'], 'inode': found['inode']}
+    if mismatched:
+        raise ValueError(f"OpenAIPlugin: Build files differ from their source: {', '.join(sorted(mismatched)[:5])}"
+                         + (f" and {len(mismatched) - 5} more" if len(mismatched) > 5 else ""))
+    return stamped
+
+
+def write_stored_manifest(build_dir: Path, manifest: Manifest):
+    """Store a manifest already stamped with build stats inside the build"""
+    path = Path(build_dir) / MANIFEST_NAME
+    tmp = path.with_name(MANIFEST_NAME + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump({'version': 1, 'files': manifest}, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def write_directory_manifest(build_dir: Path) -> Manifest:
+    """Hash a freshly copied build and store its manifest inside it"""
+    manifest = files_manifest(_walk_files(Path(build_dir)), with_stats=True)
+    write_stored_manifest(build_dir, manifest)
+    return manifest
+
+
+def load_stored_manifest(build_dir: Path) -> Optional[Manifest]:
+    try:
+        with open(Path(build_dir) / MANIFEST_NAME, 'r') as f:
+            return json.load(f)['files']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _link_or_copy(source: Path, target: Path) -> bool:
+    """Hard-link source to target; returns False if it had to be copied"""
+    try:
+        os.link(source, target)
+        return True
+    except OSError:
+        shutil.copy2(source, target)
+        return False
+
+
+def build_delta(base_dir: Path,
+                source: Union[SourceFiles, Path, str],
+                target_dir: Path) -> Dict[str, Any]:
+    """
+    Assemble a new build in `target_dir` from `base_dir` plus `source`.
+
+    Args:
+        base_dir: previous build to link unchanged files from
+        source: {relative path: file} for the new version, a directory,
+            or a release archive
+        target_dir: empty staging directory for the new build
+    """
+    base_dir, target_dir = Path(base_dir), Path(target_dir)
+    base_manifest = directory_manifest(base_dir)
+
+    archive = None
+    if isinstance(source, dict):
+        new_manifest = files_manifest(source)
+    elif is_archive(Path(source)):
+        archive = Path(source)
+        new_manifest = archive_manifest(archive)
+    else:
+        source = _walk_files(Path(source))
+        new_manifest = files_manifest(source)
+
+    diff = diff_manifests(base_manifest, new_manifest)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    linked = copied_fallback = 0
+    bytes_linked = 0
+    for relative in diff['unchanged']:
+        target = target_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if _link_or_copy(base_dir / relative, target):
+            linked += 1
+            bytes_linked += new_manifest[relative]['size']
+        else:
+            copied_fallback += 1
+
+    bytes_written = diff['bytes_unchanged'] - bytes_linked
+    to_write = {e['path'] for e in diff['added'] + diff['changed']}
+    if archive is not None:
+        prefix = _archive_prefix(archive)
+        for name, f in _iter_archive(archive):
+            relative = _strip_root(name, prefix)
+            if relative in to_write:
+                target = target_dir / relative
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with open(target, 'wb') as out:
+                    shutil.copyfileobj(f, out, HASH_CHUNK_BYTES)
+                bytes_written += new_manifest[relative]['size']
+    else:
+        for relative in sorted(to_write):
+            target = target_dir / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source[relative], target)
+            bytes_written += new_manifest[relative]['size']
+
+    # Hash what actually landed in the build; linked files the base already vouched for are trusted
+    write_stored_manifest(target_dir, with_build_stats(target_dir, new_manifest, trusted=base_manifest))
+
+    total = sum(e['size'] for e in new_manifest.values())
+    logger.info(f"OpenAIPlugin: Delta build linked {linked} files, wrote {len(to_write)} "
+                f"({bytes_written} of {total} bytes written)")
+    return {
+        'success': True,
+        'base_build': base_dir.name,
+        'added': [e['path'] for e in diff['added']],
+        'removed': [e['path'] for e in diff['removed']],
+        'changed': [e['path'] for e in diff['changed']],
+        'unchanged': len(diff['unchanged']),
+        'linked_files': linked,
+        'copied_fallback_files': copied_fallback,
+        'bytes_total': total,
+        'bytes_written': bytes_written,
+        'bytes_saved': total - bytes_written
+    }
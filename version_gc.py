@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Version Garbage Collector
+
+Reclaims disk space held by shared plugin versions nobody uses. Per-version
+user counts come from one grouped query over the `plugin` table and are
+compared against the version pointers and builds on disk (see
+version_store.py). Unreferenced trees are first moved out of the served
+namespace, then deleted incrementally with a bytes-per-second budget so GC
+never competes with request serving for disk bandwidth.
+
+Builds share hard-linked files (see version_delta.py), so only files with
+no other link are counted as reclaimable; unlinking the others frees
+nothing while a retained build still references them. All directory walks,
+renames and unlinks run on the async filesystem executor.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+import structlog
+
+from version_store import ACTIVE_LINK, BUILDS_DIR, STAGING_DIR, VersionStore
+
+logger = structlog.get_logger()
+
+# Files unlinked per executor call while deleting a tree
+DELETE_BATCH_FILES = 64
+TRASH_DIR = ".trash"
+DEFAULT_BYTES_PER_SECOND = 32 * 1024 * 1024
+DEFAULT_KEEP_HISTORY = 2
+# Staging builds older than this are considered abandoned
+STALE_STAGING_SECONDS = 6 * 3600
+
+
+def tree_size(path: Path) -> int:
+    """
+    Bytes deleting `path` would free: sizes of files under it (symlinks not
+    followed) that have no other hard link
+    """
+    total = 0
+    stack = [str(path)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_nlink == 1:
+                            total += stat.st_size
+        except FileNotFoundError:
+            continue
+    return total
+
+
+class VersionGarbageCollector:
+    """Reference-counted cleanup of shared plugin versions"""
+
+    def __init__(self,
+                 version_store: VersionStore,
+                 plugin_slug: str,
+                 protected_versions: Optional[Set[str]] = None,
+                 keep_history: int = DEFAULT_KEEP_HISTORY,
+                 bytes_per_second: int = DEFAULT_BYTES_PER_SECOND,
+                 fs=None):
+        """
+        Args:
+            protected_versions: version names (e.g. 'v1.0.0') never collected,
+                typically the version the running manager serves
+            keep_history: most recent activations kept for rollback
+            bytes_per_second: deletion I/O budget; 0 disables throttling
+            fs: AsyncFileSystem for blocking calls (default: the process-wide one)
+        """
+        self.store = version_store
+        self.plugin_slug = plugin_slug
+        self.protected_versions = set(protected_versions or ())
+        self.keep_history = keep_history
+        self.bytes_per_second = bytes_per_second
+        if fs is None:
+            from async_fs import get_async_fs
+            fs = get_async_fs()
+        self.fs = fs
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    async def get_version_user_counts(self, db) -> Dict[str, int]:
+        """Users per installed version, from a single grouped query"""
+        query = text("""
+        SELECT version, COUNT(*) AS users
+        FROM plugin
+        WHERE plugin_slug = :plugin_slug
+        GROUP BY version
+        """)
+        result = await db.execute(query, {'plugin_slug': self.plugin_slug})
+        return {f"v{row.version}": int(row.users) for row in result.fetchall()}
+
+    async def plan(self, db) -> Dict[str, Any]:
+        """
+        Work out which version pointers and builds are unreferenced.
+
+        A version is referenced if any user row points at it, it is
+        protected, or it is the active version. A build is referenced if a
+        retained pointer resolves to it or it is in recent rollback history.
+        """
+        plan, _ = await self._plan(db)
+        return plan
+
+    async def _plan(self, db):
+        user_counts = await self.get_version_user_counts(db)
+        return await self.fs.run(self._plan_on_disk, user_counts)
+
+    def _plan_on_disk(self, user_counts: Dict[str, int]) -> Tuple[Dict[str, Any], List[Path]]:
+        root = self.store.plugin_root
+        active = self.store.active_build()
+
+        pointers = {}
+        if root.exists():
+            for entry in root.iterdir():
+                if entry.name.startswith('.') or entry.name == ACTIVE_LINK:
+                    continue
+                if entry.is_symlink() or entry.is_dir():
+                    pointers[entry.name] = entry
+
+        retained_builds: Set[str] = set()
+        if active is not None:
+            retained_builds.add(active.name)
+        if self.keep_history:
+            retained_builds.update(self.store.activation_history()[-self.keep_history:])
+
+        stale_pointers = []
+        versions = []
+        for name, entry in sorted(pointers.items()):
+            users = user_counts.get(name, 0)
+            target = self.store.resolve(name) if entry.is_symlink() else entry
+            in_use = users > 0 or name in self.protected_versions or (
+                active is not None and target is not None and target.name == active.name)
+            versions.append({'version': name, 'users': users, 'in_use': in_use,
+                             'build': target.name if target is not None else None})
+            if in_use:
+                if target is not None and entry.is_symlink():
+                    retained_builds.add(target.name)
+            else:
+                stale_pointers.append(entry)
+
+        stale_builds = []
+        builds_dir = root / BUILDS_DIR
+        if builds_dir.exists():
+            for build in sorted(builds_dir.iterdir()):
+                if build.is_dir() and build.name not in retained_builds:
+                    stale_builds.append(build)
+
+        staging_dir = root / STAGING_DIR
+        if staging_dir.exists():
+            cutoff = time.time() - STALE_STAGING_SECONDS
+            for staging in staging_dir.iterdir():
+                if staging.stat().st_mtime < cutoff:
+                    stale_builds.append(staging)
+
+        reclaimable = sum(tree_size(p) for p in stale_builds)
+        reclaimable += sum(tree_size(p) for p in stale_pointers if not p.is_symlink())
+
+        return {
+            'versions': versions,
+            'user_counts': user_counts,
+            'stale_pointers': [p.name for p in stale_pointers],
+            'stale_builds': [p.name for p in stale_builds],
+            'bytes_reclaimable': reclaimable
+        }, stale_pointers + stale_builds
+
+    async def collect(self, db, dry_run: bool = False) -> Dict[str, Any]:
+        """Remove unreferenced versions and report bytes reclaimed"""
+        started = time.monotonic()
+        plan, paths = await self._plan(db)
+        report = dict(plan, dry_run=dry_run, bytes_reclaimed=0, files_removed=0, errors=[])
+
+        if not dry_run:
+            doomed = await self.fs.run(self._move_to_trash, paths, report['errors'])
+            for path in doomed:
+                removed_bytes, removed_files = await self._delete_tree(path, report['errors'])
+                report['bytes_reclaimed'] += removed_bytes
+                report['files_removed'] += removed_files
+
+        report['duration_seconds'] = time.monotonic() - started
+        self.last_report = report
+        logger.info(f"OpenAIPlugin: Version GC reclaimed {report['bytes_reclaimed']} bytes "
+                    f"({len(report['stale_pointers'])} versions, {len(report['stale_builds'])} builds)")
+        return report
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def collect_in_background(self, session_factory: Callable, dry_run: bool = False) -> asyncio.Task:
+        """
+        Start collect() as a background task (one at a time). The task opens
+        its own session from `session_factory`; the caller's session is never
+        used after this returns.
+        """
+        if self.running:
+            return self._task
+
+        async def run():
+            async with session_factory() as db:
+                return await self.collect(db, dry_run=dry_run)
+
+        self._task = asyncio.ensure_future(run())
+        return self._task
+
+    def _move_to_trash(self, paths: List[Path], errors: List[str]) -> List[Path]:
+        """Take everything out of the served namespace (cheap renames/unlinks); returns trees to delete"""
+        trash = self.store.plugin_root / TRASH_DIR
+        doomed = []
+        for path in paths:
+            try:
+                if path.is_symlink():
+                    path.unlink()
+                    continue
+                trash.mkdir(exist_ok=True)
+                destination = trash / f"{path.name}-{uuid.uuid4().hex[:8]}"
+                os.rename(path, destination)
+                doomed.append(destination)
+            except OSError as e:
+                errors.append(f"{path.name}: {e}")
+
+        # Also finish anything a previous interrupted run left in the trash
+        if trash.exists():
+            doomed.extend(p for p in trash.iterdir() if p not in doomed)
+        return doomed
+
+    async def _delete_tree(self, path: Path, errors: List[str]):
+        """Delete a tree bottom-up in executor batches, sleeping to stay within the byte budget"""
+        removed_bytes = 0
+        removed_files = 0
+        window_start = time.monotonic()
+
+        walk = await self.fs.run(lambda: list(os.walk(path, topdown=False)))
+        files = [os.path.join(dirpath, filename) for dirpath, _, filenames in walk for filename in filenames]
+        for start in range(0, len(files), DELETE_BATCH_FILES):
+            batch_bytes, batch_files = await self.fs.run(
+                _unlink_files, files[start:start + DELETE_BATCH_FILES], errors)
+            removed_bytes += batch_bytes
+            removed_files += batch_files
+
+            if self.bytes_per_second:
+                expected = removed_bytes / self.bytes_per_second
+                elapsed = time.monotonic() - window_start
+                if expected > elapsed:
+                    await asyncio.sleep(expected - elapsed)
+
+        directories = [os.path.join(dirpath, dirname) for dirpath, dirnames, _ in walk for dirname in dirnames]
+        await self.fs.run(_remove_directories, directories + [str(path)], errors)
+        return removed_bytes, removed_files
+
+
+def _unlink_files(paths: List[str], errors: List[str]) -> Tuple[int, int]:
+    """Unlink files; returns (bytes freed, files removed). Still-linked files free nothing"""
+    freed = removed = 0
+    for file_path in paths:
+        try:
+            stat = os.lstat(file_path)
+            os.unlink(file_path)
+        except OSError as e:
+            errors.append(f"{file_path}: {e}")
+            continue
+        removed += 1
+        if stat.st_nlink == 1:
+            freed += stat.st_size
+    return freed, removed
+
+
+def _remove_directories(paths: List[str], errors: List[str]):
+    """Remove emptied directories (deepest first, as os.walk(topdown=False) lists them)"""
+    for dir_path in paths:
+        try:
+            if os.path.islink(dir_path):
+                os.unlink(dir_path)
+            else:
+                os.rmdir(dir_path)
+        except OSError as e:
+            errors.append(f"{dir_path}: {e}")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+OpenAI Plugin Version Store
+
+Atomic activation of shared plugin versions. Every install or update builds
+into a private staging directory; once validated, the build is renamed into
+`.builds/` and the public version path (e.g. `shared/OpenAIPlugin/v1.0.0`)
+and the `active` pointer are switched with a single symlink replace. Readers
+therefore only ever see complete trees, and activation or rollback costs one
+rename regardless of tree size.
+
+Layout under the plugin root (`shared/<plugin_slug>/`):
+
+    .staging/<version>__<build_id>/  in-progress builds
+    .builds/<version>__<build_id>/   immutable, validated builds
+    <version> -> .builds/...         per-version pointer used by the backend
+    active    -> .builds/...         currently served build
+    .history.json                    activation history for rollback
+"""
+
+import datetime
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+ACTIVE_LINK = "active"
+BUILDS_DIR = ".builds"
+STAGING_DIR = ".staging"
+HISTORY_FILE = ".history.json"
+# Separates the version name from the build id in build directory names
+BUILD_SEPARATOR = "__"
+MAX_HISTORY = 20
+
+
+class VersionStore:
+    """Staging, atomic activation and rollback for one plugin's shared versions"""
+
+    def __init__(self, plugin_root: Path):
+        self.plugin_root = Path(plugin_root)
+        self.builds_path = self.plugin_root / BUILDS_DIR
+        self.staging_path = self.plugin_root / STAGING_DIR
+        self.history_path = self.plugin_root / HISTORY_FILE
+
+    def create_staging(self, version_name: str) -> Path:
+        """Create an empty, uniquely named staging directory for a build"""
+        build_id = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        staging = self.staging_path / f"{version_name}{BUILD_SEPARATOR}{build_id}"
+        staging.mkdir(parents=True)
+        return staging
+
+    def discard_staging(self, staging: Path):
+        """Remove a failed or abandoned staging build"""
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def commit(self, staging: Path, version_name: str, activate: bool = True) -> Dict[str, Any]:
+        """
+        Publish a validated staging build.
+
+        The build is renamed into `.builds/` (same filesystem, so atomic),
+        then the version pointer and optionally the `active` pointer are
+        swapped to it.
+        """
+        self.builds_path.mkdir(parents=True, exist_ok=True)
+        build = self.builds_path / staging.name
+        os.rename(staging, build)
+
+        previous = self.resolve(version_name)
+        self._migrate_legacy_directory(version_name)
+        self._swap_link(self.plugin_root / version_name, build)
+        if activate:
+            self._record_activation(build)
+            self._swap_link(self.plugin_root / ACTIVE_LINK, build)
+
+        logger.info(f"OpenAIPlugin: Published build {build.name} as {version_name}")
+        return {
+            'success': True,
+            'build': build.name,
+            'version': version_name,
+            'previous_build': previous.name if previous else None
+        }
+
+    def activate(self, version_name: str) -> Dict[str, Any]:
+        """Point `active` at the current build of an already published version"""
+        build = self.resolve(version_name)
+        if build is None:
+            return {'success': False, 'error': f'Version {version_name} is not published'}
+        self._record_activation(build)
+        self._swap_link(self.plugin_root / ACTIVE_LINK, build)
+        return {'success': True, 'build': build.name, 'version': version_name}
+
+    def rollback(self) -> Dict[str, Any]:
+        """Re-activate the build that was active before the current one"""
+        history = self._read_history()
+        while len(history) > 1:
+            history.pop()
+            candidate = self.builds_path / history[-1]
+            if candidate.is_dir():
+                version_name = self._version_of(candidate.name)
+                self._write_history(history)
+                self._swap_link(self.plugin_root / version_name, candidate)
+                self._swap_link(self.plugin_root / ACTIVE_LINK, candidate)
+                logger.info(f"OpenAIPlugin: Rolled back to build {candidate.name}")
+                return {'success': True, 'build': candidate.name, 'version': version_name}
+        return {'success': False, 'error': 'No previous build to roll back to'}
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """Return the build directory a pointer (version name or `active`) refers to"""
+        link = self.plugin_root / name
+        if not link.is_symlink():
+            return None
+        target = link.parent / os.readlink(link)
+        return target if target.is_dir() else None
+
+    def active_build(self) -> Optional[Path]:
+        return self.resolve(ACTIVE_LINK)
+
+    def activation_history(self) -> List[str]:
+        """Build names in activation order, oldest first"""
+        return self._read_history()
+
+    def list_builds(self) -> List[Dict[str, Any]]:
+        """Return published builds with the pointers that reference them"""
+        if not self.builds_path.exists():
+            return []
+        pointers: Dict[str, List[str]] = {}
+        for entry in self.plugin_root.iterdir():
+            if entry.is_symlink():
+                target = self.resolve(entry.name)
+                if target is not None:
+                    pointers.setdefault(target.name, []).append(entry.name)
+        return [
+            {
+                'build': build.name,
+                'version': self._version_of(build.name),
+                'pointers': sorted(pointers.get(build.name, []))
+            }
+            for build in sorted(self.builds_path.iterdir())
+            if build.is_dir()
+        ]
+
+    def _swap_link(self, link: Path, target: Path):
+        """Atomically (re)point `link` at `target` via rename over the old link"""
+        relative = os.path.relpath(target, link.parent)
+        tmp = link.parent / f".{link.name}.{uuid.uuid4().hex[:8]}.tmp"
+        os.symlink(relative, tmp, target_is_directory=True)
+        os.replace(tmp, link)
+
+    def _migrate_legacy_directory(self, version_name: str):
+        """Move a pre-existing real version directory into `.builds/`"""
+        legacy = self.plugin_root / version_name
+        if legacy.is_dir() and not legacy.is_symlink():
+            destination = self.builds_path / f"{version_name}{BUILD_SEPARATOR}legacy-{uuid.uuid4().hex[:8]}"
+            os.rename(legacy, destination)
+            logger.info(f"OpenAIPlugin: Migrated legacy directory {legacy} to {destination}")
+
+    def _version_of(self, build_name: str) -> str:
+        return build_name.rsplit(BUILD_SEPARATOR, 1)[0]
+
+    def _read_history(self) -> List[str]:
+        try:
+            with open(self.history_path, 'r') as f:
+                return json.load(f).get('activations', [])
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _write_history(self, history: List[str]):
+        tmp = self.history_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'activations': history[-MAX_HISTORY:]}, f)
+        os.replace(tmp, self.history_path)
+
+    def _record_activation(self, build: Path):
+        history = self._read_history()
+        if not history or history[-1] != build.name:
+            history.append(build.name)
+        self._write_history(history)